@@ -0,0 +1,91 @@
+"""Compare the vectorized grid formatting against the previous per-row apply code
+
+Usage: python benchmarks/bench_formatting.py [rows ...]
+"""
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.date_helpers import format_appointment_date
+from utils.formatting import (
+    format_date_column, format_time_column, format_last_visit_column, format_appointment_date_column
+)
+
+
+def make_frame(rows, seed=0):
+    """Build a random appointments-like frame with NaT and 'First visit' values"""
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 365 * 6, rows), unit='D')
+    dates = pd.Series(dates)
+    dates[rng.random(rows) < 0.01] = pd.NaT
+    start_hours = rng.integers(8, 16, rows)
+    days = pd.Series(rng.integers(1, 60, rows), dtype=object)
+    days[rng.random(rows) < 0.2] = 'First visit'
+    return pd.DataFrame({
+        'Appointment_date': dates,
+        'Start_time': [f"{h:02d}:00" for h in start_hours],
+        'End_time': [f"{h + 2:02d}:00" for h in start_hours],
+        'Days_since_last_visit': days,
+    })
+
+
+def legacy_format(df, current_date):
+    """The per-row formatting previously used to build the grid"""
+    def format_date_with_indicator(x):
+        if pd.isna(x):
+            return ''
+        date_str = x.strftime('%Y-%m-%d %A')
+        return f" {date_str}" if x.date() == current_date.date() else date_str
+
+    def format_last_visit(x):
+        if x == 'First visit':
+            return x
+        try:
+            return f"{int(float(x))} days ago"
+        except (ValueError, TypeError):
+            return x
+
+    return pd.DataFrame({
+        'Date': df['Appointment_date'].apply(format_date_with_indicator),
+        'Time': df.apply(lambda x: f"{x['Start_time']} - {x['End_time']}", axis=1),
+        'Last Visit': df['Days_since_last_visit'].apply(format_last_visit),
+        'Short date': df['Appointment_date'].apply(format_appointment_date),
+    })
+
+
+def vectorized_format(df, current_date):
+    return pd.DataFrame({
+        'Date': format_date_column(df['Appointment_date'], current_date),
+        'Time': format_time_column(df['Start_time'], df['End_time']),
+        'Last Visit': format_last_visit_column(df['Days_since_last_visit']),
+        'Short date': format_appointment_date_column(df['Appointment_date']),
+    })
+
+
+def timed(fn, *args, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(sizes):
+    print(f"{'rows':>10} {'legacy s':>10} {'vectorized s':>13} {'speedup':>8}")
+    for rows in sizes:
+        df = make_frame(rows)
+        current_date = pd.Timestamp(df['Appointment_date'].dropna().iloc[0]).normalize()
+        legacy_time, expected = timed(legacy_format, df, current_date)
+        fast_time, actual = timed(vectorized_format, df, current_date)
+        pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+        print(f"{rows:>10} {legacy_time:>10.3f} {fast_time:>13.3f} {legacy_time / fast_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000])
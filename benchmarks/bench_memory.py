@@ -0,0 +1,63 @@
+"""Measure the memory of the appointment table in the text layout and the compact schema
+
+Usage: python benchmarks/bench_memory.py [--rows 1000000] [--seed 0]
+
+The text layout is the table as it used to be held: object strings for
+names, addresses, staff and 'HH:MM' times, and a mixed object column of
+day counts and 'First visit'. The compact layout is what the stores load
+now (see utils/schema.py). Sizes are deep memory_usage figures; results
+are saved next to the other benchmark results.
+"""
+import argparse
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from run_benchmarks import save_results
+from utils.schema import CATEGORY_COLUMNS, memory_usage, to_compact, to_export
+from utils.synthetic_data import generate_appointments
+
+
+def text_layout(df):
+    """The appointment table with every column in its old object form"""
+    return to_export(df).astype({col: object for col in CATEGORY_COLUMNS})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    text = text_layout(generate_appointments(args.rows, seed=args.seed, add_staff=True))
+    started = time.perf_counter()
+    compact = to_compact(text)
+    convert_seconds = time.perf_counter() - started
+
+    before, after = memory_usage(text), memory_usage(compact)
+    print(f"{args.rows:,} rows, {compact['Name'].nunique():,} customers\n")
+    print(f"  {'column':<24} {'text MB':>10} {'compact MB':>12} {'ratio':>8}")
+    for col in before:
+        print(f"  {col:<24} {before[col] / 1e6:>10.1f} {after[col] / 1e6:>12.1f} "
+              f"{before[col] / max(after[col], 1):>7.1f}x")
+    print(f"\nConverting to the compact schema took {convert_seconds:.2f}s")
+
+    current = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'results': {str(args.rows): {'text_bytes': before, 'compact_bytes': after,
+                                     'convert_seconds': convert_seconds}},
+    }
+    path = save_results(current, 'memory')
+    print(f"Saved results to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Measure the app's cold start: import time and the first script run
+
+Usage: python benchmarks/bench_startup.py [--repeat 3] [--fail-on-regression]
+
+Each measurement runs in a fresh interpreter so nothing is already imported.
+The startup imports are the top-level imports of main.py, so anything it
+imports lazily is left out. The store load is the work main.py does under
+its "Loading appointments" spinner, after the page shell is sent: opening
+(and on a new store, seeding) the store and building the shared snapshot
+and its indexes. The first run uses Streamlit's AppTest and is skipped
+when Streamlit is not installed. Results are saved next to the other
+benchmark results and compared with the previous startup run.
+"""
+import argparse
+import ast
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+from run_benchmarks import compare, previous_results, save_results
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+MAIN = os.path.join(ROOT, 'main.py')
+
+FIRST_RUN_SCRIPT = """
+import time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({main!r}, default_timeout=120)
+app.run()
+first = time.perf_counter() - started
+started = time.perf_counter()
+app.run()
+print(first, time.perf_counter() - started)
+"""
+
+
+LOAD_SCRIPT = """
+import time
+from utils.resources import shared_calendar_feeds, shared_recurring, shared_snapshots
+started = time.perf_counter()
+snapshots = shared_snapshots({store!r}, seed_csv={seed!r}, window_days=90)
+shared_recurring({store!r})
+shared_calendar_feeds({store!r}, seed_csv={seed!r})
+snapshots.checkout('bench')
+snapshots.visit_index, snapshots.staff_schedule, snapshots.customer_directory, snapshots.utilization
+print(time.perf_counter() - started)
+"""
+
+
+def startup_imports():
+    """Return the modules main.py imports at the top level"""
+    with open(MAIN) as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            modules.append(node.module)
+    return modules
+
+
+def run_python(code, env=None):
+    """Run code in a fresh interpreter from the repository root and return its stdout"""
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return result.stdout
+
+
+IMPORT_SCRIPT = """
+import importlib, json, time
+times = {{}}
+for module in {modules!r}:
+    started = time.perf_counter()
+    try:
+        importlib.import_module(module)
+    except ImportError:
+        continue
+    times[module] = time.perf_counter() - started
+print(json.dumps(times))
+"""
+
+
+def time_imports(modules, repeat):
+    """Best-of-repeat time each module adds when imported in main.py's order
+
+    Modules are imported one after another in a fresh interpreter, so each
+    time covers only what the earlier imports had not already loaded.
+    Modules that are not installed are left out.
+    """
+    runs = [json.loads(run_python(IMPORT_SCRIPT.format(modules=modules))) for _ in range(repeat)]
+    times = {module: min(run[module] for run in runs) for module in runs[0]}
+    times['all startup imports'] = min(sum(run.values()) for run in runs)
+    return times
+
+
+def time_store_load(repeat, seed_csv):
+    """Best-of-repeat times to load a new store seeded from seed_csv, and to reopen it, in fresh interpreters"""
+    new, existing = [], []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as workdir:
+            script = LOAD_SCRIPT.format(store=os.path.join(workdir, 'appointments.db'), seed=seed_csv)
+            new.append(float(run_python(script)))
+            existing.append(float(run_python(script)))
+    return min(new), min(existing)
+
+
+def time_first_run(repeat):
+    """Best-of-repeat (first run, warm rerun) times of main.py under AppTest"""
+    times = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as workdir:
+            env = dict(os.environ, LOTTA_STORE=os.path.join(workdir, 'appointments.db'))
+            first, rerun = run_python(FIRST_RUN_SCRIPT.format(main=MAIN), env=env).split()
+            times.append((float(first), float(rerun)))
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed-csv', default=os.path.join(ROOT, 'data', 'appointments.csv'),
+                        help="CSV the store is seeded from for the store load (default: the app's seed data)")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    results = {}
+    modules = startup_imports()
+    for module, seconds in time_imports(modules, args.repeat).items():
+        results[f'import {module}' if module in modules else module] = seconds
+    missing = [module for module in modules if f'import {module}' not in results]
+    if missing:
+        print(f"Not installed, left out of the import times: {', '.join(missing)}")
+
+    results['store load (new store)'], results['store load (existing store)'] = \
+        time_store_load(args.repeat, os.path.abspath(args.seed_csv))
+
+    try:
+        results['first run'], results['warm rerun'] = time_first_run(args.repeat)
+    except RuntimeError as e:
+        print(f"Skipping first run: {e}")
+
+    current = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'results': {'startup': results},
+    }
+    regressions = compare(current, previous_results('startup'))
+    path = save_results(current, 'startup')
+    print(f"\nSaved results to {path}")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
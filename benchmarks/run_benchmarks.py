@@ -0,0 +1,222 @@
+"""Time the app's hot paths on generated data at several scales
+
+Usage: python benchmarks/run_benchmarks.py [--sizes 10000 100000 ...] [--fail-on-regression]
+
+Results are written to benchmarks/results/ as JSON and compared with the
+previous run, so a phase that got noticeably slower is flagged.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.availability import free_slots
+from utils.conflicts import StaffSchedule
+from utils.customer_directory import CustomerDirectory
+from utils.dedup import dedup_frame
+from utils.display import build_display_view
+from utils.schema import append_rows, set_values, to_export
+from utils.storage import PartitionedStore, SqliteStore, read_appointments_csv
+from utils.synthetic_data import generate_appointments
+from utils.visit_index import VisitIndex, compute_days_since_last_visit
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+REGRESSION_RATIO = 1.25
+MUTATIONS = 100
+
+PHASES = {}
+
+
+def phase(name):
+    """Register a benchmark phase; each phase receives the shared context dict"""
+    def register(fn):
+        PHASES[name] = fn
+        return fn
+    return register
+
+
+@phase('load_csv')
+def bench_load_csv(ctx):
+    ctx['df'] = read_appointments_csv(ctx['csv_path'])
+
+
+@phase('load_sqlite')
+def bench_load_sqlite(ctx):
+    ctx['df'] = ctx['store'].load()
+
+
+@phase('load_partitioned')
+def bench_load_partitioned(ctx):
+    ctx['parts'].load()
+
+
+@phase('query_recent_partitioned')
+def bench_query_recent_partitioned(ctx):
+    ctx['parts'].query(start=ctx['recent'])
+
+
+@phase('display_prep')
+def bench_display_prep(ctx):
+    build_display_view(ctx['df'], ctx['today'])
+
+
+@phase('customer_directory')
+def bench_customer_directory(ctx):
+    directory = ctx['directory'] = CustomerDirectory.from_frame(ctx['df'])
+    for query in ('eva', 'lind', 'kungsg', 'helna olson'):
+        directory.search(query)
+
+
+@phase('customer_search_common')
+def bench_customer_search_common(ctx):
+    # Every generated address ends in Uddevalla, so each of these matches every customer
+    for query in ('uddevalla', 'udd', 'gatan uddevalla'):
+        ctx['directory'].search(query)
+
+
+@phase('days_since_bulk')
+def bench_days_since_bulk(ctx):
+    compute_days_since_last_visit(ctx['df'])
+
+
+@phase('visit_index_build')
+def bench_visit_index_build(ctx):
+    ctx['visit_index'] = VisitIndex.from_frame(ctx['df'])
+
+
+@phase('days_since_lookup')
+def bench_days_since_lookup(ctx):
+    sample = ctx['df'].sample(min(1000, len(ctx['df'])), random_state=0)
+    for name, date in zip(sample['Name'], sample['Appointment_date']):
+        ctx['visit_index'].days_since_last_visit(name, date)
+
+
+@phase('staff_schedule_build')
+def bench_staff_schedule_build(ctx):
+    ctx['schedule'] = StaffSchedule.from_frame(ctx['df'])
+
+
+@phase('free_slots')
+def bench_free_slots(ctx):
+    staff = ctx['df']['Staff_name'].unique().tolist()
+    start = ctx['today']
+    for duration in (60, 120, 240):
+        list(free_slots(ctx['schedule'], staff, start, start + pd.Timedelta(days=27), duration))
+
+
+@phase('add_edit_cancel')
+def bench_add_edit_cancel(ctx):
+    store, df = ctx['store'], ctx['df']
+    record = df.iloc[0].to_dict()
+    for _ in range(MUTATIONS):
+        new_id = store.insert(record)
+        df = append_rows(df, pd.DataFrame([record], index=[new_id]))
+        changes = {'Start_time': '10:00', 'End_time': '12:00'}
+        store.update(new_id, changes)
+        set_values(df, [new_id], changes)
+        store.delete(new_id)
+        df = df.drop(index=new_id)
+
+
+@phase('dedup')
+def bench_dedup(ctx):
+    dedup_frame(ctx['df'], keep='latest')
+
+
+def run_scale(rows, workdir):
+    """Run every phase on a generated dataset of the given size"""
+    results = {}
+    started = time.perf_counter()
+    df = generate_appointments(rows, seed=rows, add_staff=True)
+    results['generate'] = time.perf_counter() - started
+
+    csv_path = os.path.join(workdir, f'appointments-{rows}.csv')
+    to_export(df).to_csv(csv_path, index=False, date_format='%Y-%m-%d')
+    store = SqliteStore(os.path.join(workdir, f'appointments-{rows}.db'))
+    store.insert_many(df)
+    parts = PartitionedStore(os.path.join(workdir, f'appointments-{rows}.parts'))
+    parts.insert_many(df)
+
+    ctx = {'csv_path': csv_path, 'store': store, 'parts': parts,
+           'today': df['Appointment_date'].iloc[len(df) // 2],
+           'recent': df['Appointment_date'].max() - pd.Timedelta(days=90)}
+    for name, fn in PHASES.items():
+        started = time.perf_counter()
+        fn(ctx)
+        results[name] = time.perf_counter() - started
+    return results
+
+
+def previous_results(prefix='benchmark'):
+    """Return the most recent saved results with the given file prefix, or None"""
+    files = sorted(glob.glob(os.path.join(RESULTS_DIR, f'{prefix}-*.json')))
+    if not files:
+        return None
+    with open(files[-1]) as f:
+        return json.load(f)
+
+
+def compare(current, previous):
+    """Print each phase next to the previous run and return the regressions found"""
+    regressions = []
+    for scale, phases in current['results'].items():
+        print(f"\n{int(scale):,} rows" if scale.isdigit() else f"\n{scale}")
+        before = (previous or {}).get('results', {}).get(scale, {})
+        for name, seconds in phases.items():
+            line = f"  {name:<36} {seconds:>9.3f}s"
+            if name in before and before[name] > 0:
+                ratio = seconds / before[name]
+                line += f"  ({ratio:.2f}x previous)"
+                # Ignore noise on phases that take only a few milliseconds
+                if ratio > REGRESSION_RATIO and seconds > 0.01:
+                    line += "  REGRESSION"
+                    regressions.append((scale, name, ratio))
+            print(line)
+    return regressions
+
+
+def save_results(current, prefix='benchmark'):
+    """Save results as JSON in RESULTS_DIR and return the file path"""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{prefix}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(current, f, indent=2)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    current = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'results': {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in args.sizes:
+            current['results'][str(rows)] = run_scale(rows, workdir)
+
+    regressions = compare(current, previous_results())
+
+    path = save_results(current)
+    print(f"\nSaved results to {path}")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
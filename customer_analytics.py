@@ -0,0 +1,64 @@
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from utils.analytics import analytics, analytics_path, history, source_version
+from utils.recurrence import RecurringBookings, recurring_path
+from utils.storage import get_store
+
+# Path to the appointment store
+data_dir = os.path.join(os.path.dirname(__file__), 'data')
+default_store = os.environ.get('LOTTA_STORE', os.path.join(data_dir, 'appointments.db'))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compute visit intervals, lapsed customers and staff continuity over the whole visit history, "
+                    "repeat bookings included"
+    )
+    parser.add_argument('store', nargs='?', default=default_store, help="appointment store to read")
+    parser.add_argument('--as-of', help="date to compute the analytics for, YYYY-MM-DD (default: today)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: one per CPU; 1 computes in-process)")
+    parser.add_argument('-o', '--output', help="file to save the results to (default: next to the store)")
+    parser.add_argument('--top', type=int, default=20, help="lapsed customers to list (default: 20)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    store = get_store(args.store)
+    bookings = RecurringBookings(recurring_path(args.store))
+    # Taken before reading, so a write during the read leaves the results marked stale
+    store_version = source_version(store, bookings)
+    visits = history(store, bookings, as_of=args.as_of)
+    loaded = time.perf_counter()
+    output = args.output or analytics_path(args.store)
+    results = analytics(visits, as_of=args.as_of, workers=args.workers, path=output,
+                        store_version=store_version)
+    computed = time.perf_counter()
+
+    summary = results.summary()
+    print(f"{summary['customers']} customers from {len(visits)} visits as of {results.as_of:%Y-%m-%d}: "
+          f"read in {loaded - started:.2f}s, analysed in {computed - loaded:.2f}s")
+    print(f"Results written to {output}")
+    print()
+    print("Visit cycles:")
+    for cycle, count in summary['cycles'].items():
+        print(f"  {cycle:<14} {count}")
+    print()
+    print("Staff continuity:")
+    print(results.staff.round(2).to_string())
+    print()
+
+    lapsed = results.customers[results.customers['lapsed']].sort_values('days_since_last', ascending=False)
+    print(f"{summary['lapsed']} lapsed customers" + (", longest gone first:" if len(lapsed) else ""))
+    if len(lapsed):
+        columns = ['last_visit', 'days_since_last', 'usual_interval', 'visits', 'main_staff']
+        shown = lapsed[columns].head(args.top).copy()
+        shown['last_visit'] = pd.to_datetime(shown['last_visit']).dt.strftime('%Y-%m-%d')
+        print(shown.to_string())
+
+
+if __name__ == '__main__':
+    main()
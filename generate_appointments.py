@@ -39,15 +39,16 @@ if existing_appointments:
 else:
     staff = ['Lotta', 'Sara', 'Emma']
 
+# Existing appointment dates per customer, gathered in one pass
+dates_by_name = {}
+for row in existing_appointments:
+    dates_by_name.setdefault(row['Name'], set()).add(row['Appointment_date'])
+
 # For each existing customer, generate two random appointments
 new_appointments = []
 for name, address in existing_customers:
     # Get existing appointment dates for this customer to avoid duplicates
-    existing_dates = set(
-        row['Appointment_date'] 
-        for row in existing_appointments 
-        if row['Name'] == name
-    )
+    existing_dates = dates_by_name.get(name, set())
     
     # Filter out dates that already have appointments
     available_dates = [
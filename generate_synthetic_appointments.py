@@ -0,0 +1,36 @@
+import argparse
+import os
+import time
+
+from utils.schema import to_export
+from utils.synthetic_data import generate_appointments, DEFAULT_STAFF
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a large, reproducible synthetic appointments CSV")
+    parser.add_argument('rows', type=int, help="number of appointments to generate")
+    parser.add_argument('-o', '--output', default=os.path.join(os.path.dirname(__file__), 'data', 'synthetic_appointments.csv'))
+    parser.add_argument('--customers', type=int, help="number of customers (default: rows / 50)")
+    parser.add_argument('--staff', nargs='+', default=DEFAULT_STAFF)
+    parser.add_argument('--add-staff', action='store_true',
+                        help="add numbered staff (Staff 5, ...) when --staff can't cover the busiest moment")
+    parser.add_argument('--start-year', type=int, default=2020)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    try:
+        df = generate_appointments(args.rows, n_customers=args.customers, staff=args.staff,
+                                   start_year=args.start_year, years=args.years, seed=args.seed,
+                                   add_staff=args.add_staff)
+    except ValueError as error:
+        parser.error(f"{error} (--staff, --years, --add-staff)")
+    to_export(df).to_csv(args.output, index=False, date_format='%Y-%m-%d')
+    print(f"Wrote {len(df)} appointments for {df['Name'].nunique()} customers "
+          f"and {df['Staff_name'].nunique()} staff to {args.output} "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,27 @@
 import streamlit as st
-
-# Title
-st.markdown('<h1 class="hero-title">Lottas Hemstäd Appointments</h1>', unsafe_allow_html=True)
-
-# Comment out everything else for debugging
-"""
 import pandas as pd
 from datetime import datetime, timedelta
+import io
+import json
 import os
-from utils.date_helpers import format_appointment_date, calculate_days_since_last_visit
-from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode
+import uuid
+from itertools import islice
+from utils.date_helpers import format_appointment_date, calculate_days_since_last_visit, date_range_bounds
+from utils.storage import ID_COLUMN, COLUMNS
+from utils.schema import append_rows, set_values, time_text, to_export
+from utils.conflicts import find_overlaps
+from utils.calendar_feeds import feed_path
+from utils.exports import available_formats
+from utils.staff_assignment import suggest_staff
+from utils.display import build_display_view, build_staff_options
+from utils.pagination import PAGE_SIZES, page_count, clamp_page, page_window, date_window, page_of_label
+from utils.profiling import RerunProfiler, lap, timings_frame, phase_percentiles, read_log, write_csv
+from utils.recurrence import REPEATS, RecurrenceRule, clashing_dates
+from utils.resources import (calendar_server, read_static, shared_calendar_feeds, shared_exports, shared_recurring,
+                             shared_snapshots)
+from utils.snapshots import session_bytes
+from utils.utilization import StaffUtilization
+from utils.grid import grid_options, render_grid
 
 # Ensure data directory exists
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
@@ -18,6 +30,16 @@ if not os.path.exists(DATA_DIR):
 
 # Define the data file paths
 DATA_FILE = os.path.join(DATA_DIR, 'appointments.csv')
+STORE_FILE = os.environ.get('LOTTA_STORE', os.path.join(DATA_DIR, 'appointments.db'))
+TIMINGS_LOG = os.path.join(DATA_DIR, 'timings.jsonl')
+# Rerun timing is off unless turned on in the sidebar or with LOTTA_PROFILE=1
+PROFILE_DEFAULT = os.environ.get('LOTTA_PROFILE') == '1'
+# Appointments from this many days back on are loaded at start (0 loads all of them);
+# older ones are read when the grid is paged or filtered back to them
+WINDOW_DAYS = int(os.environ.get('LOTTA_WINDOW_DAYS', '90'))
+# Serve each staff member's calendar feed over HTTP on this port (0 turns the server off)
+CALENDAR_PORT = int(os.environ.get('LOTTA_CALENDAR_PORT', '0'))
+CALENDAR_HOST = os.environ.get('LOTTA_CALENDAR_HOST', '127.0.0.1')
 
 # Page configuration
 st.set_page_config(
@@ -26,19 +48,27 @@ st.set_page_config(
     layout="wide"
 )
 
-# Load custom CSS
+# Time this rerun when profiling is switched on
+if st.session_state.get('profile_reruns', PROFILE_DEFAULT):
+    if 'profiler' not in st.session_state:
+        st.session_state.profiler = RerunProfiler(log_path=TIMINGS_LOG)
+    st.session_state.profiler.start_rerun()
+
+# Load custom CSS (read from disk once per process)
 css_path = os.path.join(os.path.dirname(__file__), 'styles', 'custom.css')
 if os.path.exists(css_path):
-    with open(css_path) as f:
-        st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+    st.markdown(f'<style>{read_static(css_path)}</style>', unsafe_allow_html=True)
+
+# Title
+st.markdown('<h1 class="hero-title">Lottas Hemstäd Appointments</h1>', unsafe_allow_html=True)
 
 # Initialize session state
 if 'appointments_changed' not in st.session_state:
     st.session_state.appointments_changed = False
-if 'appointments_df' not in st.session_state:
-    st.session_state.appointments_df = None
-if 'selected_customer' not in st.session_state:
-    st.session_state.selected_customer = None
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if 'selected_customer_id' not in st.session_state:
+    st.session_state.selected_customer_id = None
 if 'selected_row' not in st.session_state:
     st.session_state.selected_row = None
 if 'editing_appointment' not in st.session_state:
@@ -56,232 +86,460 @@ if 'form_name' not in st.session_state:
     st.session_state.form_name = ""
 if 'form_address' not in st.session_state:
     st.session_state.form_address = ""
+if 'new_date' not in st.session_state:
+    st.session_state.new_date = datetime.now().date()
+if 'new_start' not in st.session_state:
+    st.session_state.new_start = datetime.strptime("09:00", "%H:%M").time()
+if 'new_end' not in st.session_state:
+    st.session_state.new_end = datetime.strptime("11:00", "%H:%M").time()
+if 'slot_choice' not in st.session_state:
+    st.session_state.slot_choice = None
 if 'last_edited_name' not in st.session_state:
     st.session_state.last_edited_name = None
 if 'selected_name' not in st.session_state:
     st.session_state.selected_name = None
+if 'snapshot_version' not in st.session_state:
+    st.session_state.snapshot_version = None
+if 'index_generation' not in st.session_state:
+    st.session_state.index_generation = None
+if 'last_upload_id' not in st.session_state:
+    st.session_state.last_upload_id = None
+if 'selected_appointment_id' not in st.session_state:
+    st.session_state.selected_appointment_id = None
+if 'grid_page' not in st.session_state:
+    st.session_state.grid_page = 0
+if 'grid_pages_loaded' not in st.session_state:
+    st.session_state.grid_pages_loaded = 1
+
+current_date = pd.to_datetime(datetime.now().date())
+lap('setup')
+
+def cached(key, compute):
+    """Reuse a value derived from the appointment data until the data (or the day) changes
+
+    Derived values are shared by all sessions viewing the same snapshot.
+    """
+    version = (st.session_state.snapshot_version, current_date)
+    return snapshots.derived.get_or_compute(key, version, compute)
 
 def load_appointments():
-    """Load appointments from CSV file or session state"""
-    if st.session_state.appointments_df is not None:
-        return st.session_state.appointments_df
-        
-    if not os.path.exists(DATA_FILE):
-        # Create an empty DataFrame with the correct columns
-        df = pd.DataFrame(columns=[
-            'Name', 'Address', 'Appointment_date', 'Start_time',
-            'End_time', 'Staff_name', 'Days_since_last_visit'
-        ])
-    else:
-        df = pd.read_csv(DATA_FILE)
-        # Convert date columns
-        df['Appointment_date'] = pd.to_datetime(df['Appointment_date'])
-    
-    st.session_state.appointments_df = df
-    return df
+    """Check out the current shared snapshot of the appointments for this rerun"""
+    snapshot = snapshots.checkout(st.session_state.session_id)
+    st.session_state.snapshot_version = snapshot.version
+    # Customer ids are assigned per directory build
+    if st.session_state.index_generation != snapshots.generation:
+        st.session_state.index_generation = snapshots.generation
+        st.session_state.selected_customer_id = None
+    return snapshot.df
+
+def has_earlier_appointments():
+    """Whether the store holds appointments older than the loaded window"""
+    if snapshots.loaded_from is None:
+        return False
+    earliest, _ = cached('stored_date_range', store.date_range)
+    return earliest is not None and earliest < snapshots.loaded_from
+
+def load_earlier(start):
+    """Load older appointments into the shared snapshot and return how many were added"""
+    before = len(snapshots.current().df)
+    snapshots.ensure_loaded(start)
+    return len(snapshots.current().df) - before
 
-def save_appointments(df):
-    """Save appointments to session state and offer download"""
-    st.session_state.appointments_df = df
+def save_appointments():
+    """Note that the appointments changed
+
+    Downloads are no longer written here after every change; the Export
+    section builds them on request, once per data version.
+    """
     st.session_state.appointments_changed = True
-    
-    # If changes were made, show download button
-    if st.session_state.appointments_changed:
-        csv = df.to_csv(index=False)
-        st.download_button(
-            label="Download appointments data",
-            data=csv,
-            file_name="appointments.csv",
-            mime="text/csv"
-        )
 
-# Main content
-appointments_df = load_appointments()
+def format_date_with_indicator(x):
+    """Format a date as 'YYYY-MM-DD Day', marking today's date"""
+    if pd.isna(x):
+        return ''
+    # Format as YYYY-MM-DD Day for proper sorting, but show day name for readability
+    date_str = x.strftime('%Y-%m-%d %A')
+    return f" {date_str}" if x.date() == current_date.date() else date_str
+
+# Main content; the page shell above is sent before the store is opened and indexed
+with st.spinner("Loading appointments..."):
+    # Persistent appointment store, seeded from the CSV file on first use, and the
+    # in-memory snapshots of it shared by every session in this server process
+    snapshots = shared_snapshots(STORE_FILE, seed_csv=DATA_FILE, window_days=WINDOW_DAYS or None)
+    store = snapshots.store
+    # Repeat bookings are kept as rules and expanded only for the dates being shown
+    recurring = shared_recurring(STORE_FILE)
+    # Per-staff iCalendar feeds, rebuilt only for the staff members a change touches
+    calendar_feeds = shared_calendar_feeds(STORE_FILE, seed_csv=DATA_FILE)
+    feed_server_error = None
+    if CALENDAR_PORT:
+        _, feed_server_error = calendar_server(STORE_FILE, CALENDAR_PORT, seed_csv=DATA_FILE, host=CALENDAR_HOST)
+
+    appointments_df = load_appointments()
+    visit_index = snapshots.visit_index
+    staff_schedule = snapshots.staff_schedule
+    customer_directory = snapshots.customer_directory
+    utilization = snapshots.utilization
+lap('load')
 
 # Sidebar - Add New Appointment
 with st.sidebar:
     st.header("Add New Appointment")
 
-    # Get unique customers and their addresses
-    if not appointments_df.empty:
-        customer_options = ["-New Customer-"] + sorted(appointments_df[['Name', 'Address']].drop_duplicates().apply(
-            lambda x: f"{x['Name']} ({x['Address']})", axis=1
-        ).tolist())
-    else:
-        customer_options = ["-New Customer-"]
-    
-    # Use session state to maintain selection
-    if 'selected_customer' not in st.session_state:
-        st.session_state.selected_customer = "-New Customer-"
-    
-    # Ensure selected customer is in options, otherwise reset to "-New Customer-"
-    if st.session_state.selected_customer not in customer_options:
-        st.session_state.selected_customer = "-New Customer-"
-    
-    selected_customer = st.selectbox(
+    # Type-ahead search over the customer directory
+    customer_query = st.text_input("Search customers", key="customer_search", placeholder="Name or address")
+    customer_ids = customer_directory.search(customer_query, limit=50)
+
+    # Keep the current selection available even when it doesn't match the search
+    selected_customer_id = st.session_state.selected_customer_id
+    if selected_customer_id is not None and selected_customer_id not in customer_ids:
+        customer_ids = [selected_customer_id] + customer_ids
+    customer_options = [None] + customer_ids
+
+    selected_customer_id = st.selectbox(
         "Select Existing Customer",
         options=customer_options,
         key="customer_selector",
-        index=customer_options.index(st.session_state.selected_customer)
+        index=customer_options.index(st.session_state.selected_customer_id),
+        format_func=lambda customer_id: "-New Customer-" if customer_id is None else customer_directory.label(customer_id)
     )
 
     # Update session state
-    if selected_customer != st.session_state.selected_customer:
-        st.session_state.selected_customer = selected_customer
+    if selected_customer_id != st.session_state.selected_customer_id:
+        st.session_state.selected_customer_id = selected_customer_id
         # Reset form values when customer changes
-        if selected_customer == "-New Customer-":
+        if selected_customer_id is None:
             st.session_state.form_name = ""
             st.session_state.form_address = ""
         else:
-            # Extract name from the selection (remove the address part)
-            selected_name = selected_customer.split(" (")[0]
             # Get the customer's details
-            customer_details = appointments_df[appointments_df['Name'] == selected_name].iloc[0]
+            customer_details = customer_directory.get(selected_customer_id)
             st.session_state.form_name = customer_details['Name']
             st.session_state.form_address = customer_details['Address']
         st.rerun()
+    lap('sidebar_customers')
 
     new_name = st.text_input("Customer Name", value=st.session_state.form_name, key="name_input")
     new_address = st.text_area("Address", value=st.session_state.form_address, key="address_input")
     
-    new_date = st.date_input("Appointment Date")
-    new_start_time = st.time_input("Start Time", value=datetime.strptime("09:00", "%H:%M"), step=1800)
-    new_end_time = st.time_input("End Time", value=datetime.strptime("11:00", "%H:%M"), step=1800)
+    # A slot picked in the free-slot finder fills in the form on the next run
+    if 'picked_slot' in st.session_state:
+        st.session_state.slot_choice = st.session_state.pop('picked_slot')
+        st.session_state.new_date, st.session_state.new_start, st.session_state.new_end = st.session_state.slot_choice[:3]
+
+    new_date = st.date_input("Appointment Date", key="new_date")
+    new_start_time = st.time_input("Start Time", step=1800, key="new_start")
+    new_end_time = st.time_input("End Time", step=1800, key="new_end")
+    repeat = st.selectbox("Repeat", options=list(REPEATS), key="repeat")
+    repeat_until = None
+    if REPEATS[repeat]:
+        repeat_until = st.date_input("Repeat until", value=None, min_value=new_date, key="repeat_until",
+                                     help="Leave empty to repeat until the series is ended")
     
     # Updated default staff list
     default_staff = ["Lotta", "Meera", "Alice", "Steve"]
-    staff_options = sorted(appointments_df['Staff_name'].unique().tolist()) if not appointments_df.empty else default_staff
-    staff_options = sorted(list(set(staff_options + default_staff)))  # Ensure default staff are always included
-    new_staff = st.selectbox("Staff", options=staff_options, index=0)
+    # Ensure default staff are always included
+    staff_options = cached('sidebar_staff_options', lambda: build_staff_options(appointments_df, default_staff))
 
-    if st.button("Add Appointment"):
-        if new_name and new_address and new_staff:
-            days_since = calculate_days_since_last_visit(
-                appointments_df, new_name, new_date
+    # Suggest the least loaded staff member who is free for this slot
+    suggested_staff = suggest_staff(staff_schedule, staff_options, new_date, new_start_time, new_end_time,
+                                    bookings=recurring)
+    # Keep the staff member of a picked free slot while the form still shows that slot
+    slot_choice = st.session_state.slot_choice
+    if slot_choice and slot_choice[:3] == (new_date, new_start_time, new_end_time) and slot_choice[3] in staff_options:
+        suggested_staff = slot_choice[3]
+    new_staff = st.selectbox(
+        "Staff",
+        options=staff_options,
+        index=staff_options.index(suggested_staff) if suggested_staff else 0,
+        help="Defaults to the least booked staff member who is free at this time"
+    )
+    if suggested_staff is None:
+        st.caption("No staff member is free at this time.")
+    lap('sidebar_staff')
+
+    # Free slots of a given length from the form's date on, read from the per-staff-day slot masks
+    with st.expander("Find a free slot"):
+        # Only this expander uses the slot search
+        from utils.availability import DURATIONS, free_slots
+
+        slot_col1, slot_col2 = st.columns(2)
+        with slot_col1:
+            slot_duration = st.selectbox("Duration", options=DURATIONS, index=DURATIONS.index(120),
+                                         format_func=lambda minutes: f"{minutes / 60:g} h", key="slot_duration")
+            slot_earliest = st.time_input("Earliest start", value=datetime.strptime("08:00", "%H:%M"),
+                                          step=1800, key="slot_earliest")
+        with slot_col2:
+            slot_days = st.selectbox("Within", options=[7, 14, 28], format_func=lambda days: f"{days} days",
+                                     key="slot_days")
+            slot_latest = st.time_input("Latest end", value=datetime.strptime("17:00", "%H:%M"),
+                                        step=1800, key="slot_latest")
+        slot_staff = st.multiselect("Staff", options=staff_options, default=staff_options, key="slot_staff")
+
+        # Past days are not offered, so the search stays within the loaded window
+        slot_start = max(pd.Timestamp(new_date), current_date)
+        slot_end = slot_start + pd.Timedelta(days=slot_days - 1)
+        slots = list(islice(free_slots(staff_schedule, slot_staff, slot_start, slot_end, slot_duration,
+                                       earliest=slot_earliest, latest=slot_latest,
+                                       extra=recurring.frame(slot_start, slot_end)), 50))
+        if not slots:
+            st.caption("No free slots in this range.")
+        else:
+            slot = st.selectbox(
+                "Free slots",
+                options=range(len(slots)),
+                format_func=lambda pos: (f"{slots[pos][0]:%a %Y-%m-%d} {time_text(slots[pos][1])}-"
+                                         f"{time_text(slots[pos][2])} {slots[pos][3]}"),
+                key="slot_pick"
             )
+            if st.button("Use this slot"):
+                day, start, end, name = slots[slot]
+                st.session_state.picked_slot = (day.date(), datetime.strptime(time_text(start), "%H:%M").time(),
+                                                datetime.strptime(time_text(end), "%H:%M").time(), name)
+                st.rerun()
+    lap('sidebar_slots')
 
-            new_appointment = pd.DataFrame([{
-                'Name': new_name,
-                'Address': new_address,
-                'Appointment_date': pd.Timestamp(new_date),
-                'Start_time': new_start_time.strftime("%H:%M"),
-                'End_time': new_end_time.strftime("%H:%M"),
-                'Staff_name': new_staff,
-                'Days_since_last_visit': days_since if days_since is not None else 'First visit'
-            }])
-            
-            appointments_df = pd.concat([appointments_df, new_appointment], ignore_index=True)
-            appointments_df = appointments_df.sort_values(by='Appointment_date', ascending=True)
-            
-            save_appointments(appointments_df)
-            st.success("Appointment added successfully!")
-            st.rerun()
+    if st.button("Add Appointment"):
+        if new_end_time <= new_start_time:
+            st.error("The end time must be after the start time.")
+        elif new_name and new_address and new_staff:
+            # Bookings before the loaded window are checked against that day's appointments too
+            snapshots.ensure_loaded(new_date)
+            # Check and book under the write lock so two sessions can't take the same slot
+            with snapshots.write() as draft:
+                clashes = (staff_schedule.conflicts(new_staff, new_date, new_start_time, new_end_time)
+                           or recurring.conflicts(new_staff, new_date, new_start_time, new_end_time))
+                if clashes:
+                    st.error(f"{new_staff} is already booked between {new_start_time.strftime('%H:%M')} "
+                             f"and {new_end_time.strftime('%H:%M')} on {new_date}.")
+                elif REPEATS[repeat]:
+                    # One rule for the whole series; its visits are expanded when viewed
+                    unit, interval = REPEATS[repeat]
+                    rule = RecurrenceRule(new_name, new_address, new_staff, new_date, new_start_time, new_end_time,
+                                          unit=unit, interval=interval, until=repeat_until)
+                    series_clashes = clashing_dates(rule, staff_schedule, recurring)
+                    if series_clashes:
+                        st.error(f"{new_staff} is already booked at this time on "
+                                 f"{', '.join(f'{day:%Y-%m-%d}' for day in series_clashes[:5])}"
+                                 f"{' and more' if len(series_clashes) > 5 else ''}.")
+                    else:
+                        recurring.add(rule)
+                        calendar_feeds.invalidate(new_staff)
+                        customer_directory.add(new_name, new_address)
+                        st.success(f"Repeat booking added ({repeat.lower()}).")
+                else:
+                    days_since = calculate_days_since_last_visit(
+                        draft.base, new_name, new_date, visit_index=visit_index
+                    )
+
+                    new_record = {
+                        'Name': new_name,
+                        'Address': new_address,
+                        'Appointment_date': pd.Timestamp(new_date),
+                        'Start_time': new_start_time.strftime("%H:%M"),
+                        'End_time': new_end_time.strftime("%H:%M"),
+                        'Staff_name': new_staff,
+                        'Days_since_last_visit': days_since
+                    }
+                    new_id = store.insert(new_record)
+                    visit_index.add(new_name, new_date)
+                    staff_schedule.add(new_id, new_staff, new_date, new_start_time, new_end_time)
+                    utilization.add(new_staff, new_date, new_start_time, new_end_time)
+                    calendar_feeds.invalidate(new_staff)
+                    customer_directory.add(new_name, new_address)
+                    # Append to the new version; the display view is re-sorted from the cache on the next run
+                    draft.df = append_rows(draft.base, pd.DataFrame([new_record], columns=COLUMNS, index=[new_id]))
+            if draft.changed:
+                save_appointments()
+                st.success("Appointment added successfully!")
+                st.rerun()
+    lap('sidebar_add')
 
 # Add file upload option in sidebar
 with st.sidebar:
     st.write("### Data Management")
+    upload_mode = st.radio(
+        "Upload mode",
+        options=['append', 'upsert', 'replace'],
+        format_func=lambda mode: {
+            'append': "Append",
+            'upsert': "Update matching, add new",
+            'replace': "Replace all"
+        }[mode],
+        key="upload_mode"
+    )
     uploaded_file = st.file_uploader("Upload appointments data", type="csv")
-    if uploaded_file is not None:
+    # The uploader keeps its file across reruns, so import each upload only once
+    upload_id = getattr(uploaded_file, 'file_id', None) or (uploaded_file.name if uploaded_file else None)
+    if uploaded_file is not None and upload_id != st.session_state.last_upload_id:
+        # Marked before importing, so a failed append is not retried (and half-applied again) on the next rerun
+        st.session_state.last_upload_id = upload_id
         try:
-            df = pd.read_csv(uploaded_file)
-            df['Appointment_date'] = pd.to_datetime(df['Appointment_date'])
-            st.session_state.appointments_df = df
-            st.success("Data uploaded successfully!")
+            # Only needed when a file is uploaded
+            from utils.ingest import import_csv_stream
+
+            progress = st.empty()
+            report = import_csv_stream(
+                uploaded_file, store, mode=upload_mode,
+                on_progress=lambda r: progress.caption(f"Imported {r.imported} of {r.rows_read} rows...")
+            )
+            progress.empty()
+            if report.refused:
+                st.error(f"{report.summary()}. Fix the file and upload it again, or choose another upload mode.")
+            elif report.error_count:
+                st.warning(f"{report.error_count} rows were rejected and not imported.")
+            if report.errors:
+                with st.expander("Rejected rows"):
+                    st.dataframe(pd.DataFrame(report.errors, columns=['Line', 'Problem']), hide_index=True)
+            if not report.refused:
+                st.success(f"Data uploaded successfully! {report.summary()}.")
         except Exception as e:
-            st.error(f"Error uploading file: {str(e)}")
+            st.error(f"Error uploading file: {str(e)}. Rows read before the error may have been imported.")
+        finally:
+            # Even a failed import may have written rows, so always reload and rebuild the shared indexes
+            snapshots.reload()
+            calendar_feeds.invalidate()
+            appointments_df = load_appointments()
+            visit_index = snapshots.visit_index
+            staff_schedule = snapshots.staff_schedule
+            customer_directory = snapshots.customer_directory
+            utilization = snapshots.utilization
+
+    if st.button("Check for double bookings"):
+        overlaps = find_overlaps(appointments_df)
+        if overlaps.empty:
+            st.success("No double bookings found.")
+        else:
+            st.warning(f"{len(overlaps)} appointments overlap an earlier booking of the same staff member:")
+            st.dataframe(to_export(overlaps[['Name', 'Appointment_date', 'Start_time', 'End_time', 'Staff_name']]))
+    lap('sidebar_data')
+
+    # Exports are written only when asked for and reused until the data changes
+    st.write("### Export")
+    export_format = st.selectbox("Format", options=available_formats(), format_func=str.upper, key="export_format")
+    export_staff = st.selectbox("Staff", options=[None] + staff_options, key="export_staff",
+                                format_func=lambda name: "All staff" if name is None else name)
+    export_start = export_end = None
+    if st.checkbox("Only a date range", key="export_limit_dates"):
+        export_range = st.date_input(
+            "Export dates",
+            value=(current_date.date() - timedelta(days=30), current_date.date()),
+            key="export_range"
+        )
+        export_start, export_end = date_range_bounds(export_range)
+    export_request = (export_format, export_staff, export_start, export_end)
+    if st.button("Prepare download"):
+        st.session_state.export_request = export_request
+    if st.session_state.get('export_request') == export_request:
+        # Repeat-booking visits are exported too, so their changes (and the day, for open-ended series) count
+        export_version = (snapshots.current().version, recurring.version, current_date)
+        export = shared_exports().get(store, export_version, *export_request, bookings=recurring)
+        with export.open() as export_file:
+            st.download_button(
+                label=f"Download {export.rows:,} appointments",
+                data=export_file,
+                file_name=export.filename,
+                mime=export.mime
+            )
+    lap('sidebar_export')
+
+    # The feed of one staff member, cached until their bookings change
+    st.write("### Calendar feeds")
+    feed_staff = st.selectbox("Calendar of", options=staff_options, key="feed_staff")
+    feed = calendar_feeds.get(feed_staff)
+    st.download_button("Download calendar (.ics)", feed.body, file_name=f"{feed_staff}.ics",
+                       mime="text/calendar")
+    if feed_server_error:
+        st.warning(feed_server_error)
+    elif CALENDAR_PORT:
+        st.caption("Subscribe in a calendar app:")
+        st.code(f"http://{CALENDAR_HOST}:{CALENDAR_PORT}{feed_path(feed_staff)}", language=None)
+    lap('sidebar_calendar')
 
 # Display appointments table
 if not appointments_df.empty:
-    appointments_df['Appointment_date'] = pd.to_datetime(appointments_df['Appointment_date'])
-    current_date = pd.to_datetime(datetime.now().date())
-
     # Sort by date
-    appointments_df = appointments_df.sort_values(by='Appointment_date')
+    appointments_df = cached('appointments', lambda: appointments_df.sort_values(by='Appointment_date'))
     filtered_df = appointments_df
 
     # Get unique staff members
-    staff_options = sorted(filtered_df['Staff_name'].unique().tolist())
-    
-    # Format the date and time columns for display
-    display_df = filtered_df.copy()
-    # Keep both raw and formatted dates
-    display_df['raw_date'] = display_df['Appointment_date']
-    
-    # First sort by date
-    display_df = display_df.sort_values(by='Appointment_date', ascending=True)
-    
-    # Then format the date for display with NaT handling
-    def format_date_with_indicator(x):
-        if pd.isna(x):
-            return ''
-        # Format as YYYY-MM-DD Day for proper sorting, but show day name for readability
-        date_str = x.strftime('%Y-%m-%d %A')
-        return f" {date_str}" if x.date() == current_date.date() else date_str
-    
-    display_df['Date'] = display_df['Appointment_date'].apply(format_date_with_indicator)
-    display_df['Time'] = display_df.apply(lambda x: f"{x['Start_time']} - {x['End_time']}", axis=1)
-    
-    # Function to format last visit
-    def format_last_visit(x):
-        if x == 'First visit':
-            return x
-        try:
-            return f"{int(float(x))} days ago"
-        except (ValueError, TypeError):
-            return x
-    
-    display_df['Last Visit'] = display_df['Days_since_last_visit'].apply(format_last_visit)
+    staff_options = cached('staff_options', lambda: build_staff_options(filtered_df))
 
-    # Reorder and rename columns for display
-    columns_to_show = ['Date', 'Name', 'Address', 'Time', 'Staff_name', 'Last Visit']
-    display_columns = {
-        'Staff_name': 'Staff',
-        'Last Visit': 'Last Visit'
-    }
-    
-    display_view = display_df[columns_to_show].rename(columns=display_columns)
-    display_view = display_view.sort_values(by='Date', ascending=True)
-    
-    # Configure grid options
-    gb = GridOptionsBuilder.from_dataframe(display_view)
-    gb.configure_selection(selection_mode='single', use_checkbox=False)
-    
-    # Pre-select the row if there's a selected name
-    if st.session_state.selected_name:
-        row_index = display_view[display_view['Name'] == st.session_state.selected_name].index
-        if not row_index.empty:
-            gb.configure_selection('single', pre_selected_rows=[int(row_index[0])])
-    
-    # Configure column widths
-    gb.configure_column("Date", width=150)
-    gb.configure_column("Name", width=150)
-    gb.configure_column("Address", width=250)
-    gb.configure_column("Time", width=120)
-    gb.configure_column("Staff", width=100)
-    gb.configure_column("Last Visit", width=100)
-    
-    gb.configure_grid_options(
-        rowStyle={'background-color': '#ffffff'},
-        rowHoverStyle={'background-color': '#c8e6c9'},
-        rowClass='grid-row'
-    )
-    gridOptions = gb.build()
+    display_view = cached('display_view', lambda: build_display_view(filtered_df, current_date))
+    lap('display_prep')
+
+    # Only the visible window of rows is sent to the grid
+    window_col1, window_col2, window_col3 = st.columns([1, 1, 2])
+    with window_col1:
+        window_mode = st.radio("Show", options=["Pages", "Date range"], horizontal=True, key="window_mode")
+    with window_col2:
+        page_size = st.selectbox("Rows per page", options=PAGE_SIZES, index=1, key="grid_page_size")
+
+    if window_mode == "Pages":
+        total_pages = page_count(len(display_view), page_size)
+        st.session_state.grid_page = clamp_page(st.session_state.grid_page, len(display_view), page_size)
+        with window_col3:
+            nav_col1, nav_col2, nav_col3 = st.columns([1, 2, 1])
+            with nav_col1:
+                page_back_in_time = st.session_state.grid_page == 0 and has_earlier_appointments()
+                if st.button("◀ Prev", disabled=st.session_state.grid_page == 0 and not page_back_in_time):
+                    if page_back_in_time:
+                        # Load the previous window and show its last page
+                        added = load_earlier(snapshots.loaded_from - pd.Timedelta(days=WINDOW_DAYS))
+                        st.session_state.grid_page = page_count(added, page_size) - 1
+                    else:
+                        st.session_state.grid_page -= 1
+                    st.session_state.grid_pages_loaded = 1
+                    st.rerun()
+            with nav_col2:
+                st.markdown(f"Page {st.session_state.grid_page + 1} of {total_pages}")
+            with nav_col3:
+                if st.button("Next ▶", disabled=st.session_state.grid_page >= total_pages - 1):
+                    st.session_state.grid_page += 1
+                    st.session_state.grid_pages_loaded = 1
+                    st.rerun()
+        window_view = page_window(display_view, st.session_state.grid_page, page_size,
+                                  st.session_state.grid_pages_loaded)
+
+        # Offer to jump to the page holding the selected appointment
+        selected_id = st.session_state.selected_appointment_id
+        if selected_id is not None and selected_id not in window_view.index:
+            selected_page = page_of_label(display_view, selected_id, page_size)
+            if selected_page is not None and st.button(f"Go to selected appointment (page {selected_page + 1})"):
+                st.session_state.grid_page = selected_page
+                st.session_state.grid_pages_loaded = 1
+                st.rerun()
+        has_more_rows = st.session_state.grid_page + st.session_state.grid_pages_loaded < total_pages
+    else:
+        with window_col3:
+            window_range = st.date_input(
+                "Date range",
+                value=(current_date.date() - timedelta(days=7), current_date.date() + timedelta(days=28)),
+                key="grid_date_range"
+            )
+        range_start, range_end = date_range_bounds(window_range)
+        if snapshots.loaded_from is not None and pd.Timestamp(range_start) < snapshots.loaded_from:
+            load_earlier(range_start)
+            st.rerun()
+        window_view = date_window(display_view, appointments_df['Appointment_date'], range_start, range_end)
+        window_view = window_view.head(page_size * st.session_state.grid_pages_loaded)
+        has_more_rows = len(window_view) == page_size * st.session_state.grid_pages_loaded
+    if has_earlier_appointments():
+        st.caption(f"Showing appointments from {snapshots.loaded_from:%Y-%m-%d} on. "
+                   "Page back or pick an earlier date range to load older ones.")
+    lap('windowing')
+
+    # Grid options are built once per process and reused across reruns
+    gridOptions = grid_options(window_view, st.session_state.selected_appointment_id)
+    lap('grid_options')
 
     # Display the grid
-    grid_response = AgGrid(
-        display_view,
-        gridOptions=gridOptions,
-        update_mode=GridUpdateMode.SELECTION_CHANGED,
-        fit_columns_on_grid_load=True,
-        height=400,
-        allow_unsafe_jscode=True,
-        theme='light',
-        key="appointments_grid",
-        custom_css={
-            ".ag-row-selected": {"background-color": "#a5d6a7 !important"},
-            ".ag-row-hover": {"background-color": "#c8e6c9 !important"},
-        }
-    )
+    grid_response = render_grid(window_view, gridOptions)
+    lap('aggrid')
+
+    if has_more_rows and st.button("Load more rows"):
+        st.session_state.grid_pages_loaded += 1
+        st.rerun()
 
     # Updated handling for selected_rows
     selected_rows = grid_response.get('selected_rows', [])
@@ -289,22 +547,26 @@ if not appointments_df.empty:
     # Handle selection and update session state
     if isinstance(selected_rows, pd.DataFrame):
         if not selected_rows.empty:
-            row = selected_rows.iloc[0]
-            st.session_state.selected_customer = row['Name']
+            st.session_state.selected_appointment_id = int(selected_rows.iloc[0][ID_COLUMN])
     elif isinstance(selected_rows, list) and len(selected_rows) > 0:
-        row = selected_rows[0]
-        st.session_state.selected_customer = row['Name']
-    elif not st.session_state.editing_appointment:  # Only clear if not editing
-        st.session_state.selected_customer = None
-
-    # Show detail card only for the selected customer or when editing
-    if st.session_state.selected_customer or (isinstance(st.session_state.editing_appointment, pd.Series) and not st.session_state.editing_appointment.empty):
-        # Get the customer details
+        st.session_state.selected_appointment_id = int(selected_rows[0][ID_COLUMN])
+    elif st.session_state.selected_appointment_id not in window_view.index:
+        # The selected row is outside the current window; keep it selected
+        pass
+    elif st.session_state.editing_appointment is None:  # Only clear if not editing
+        st.session_state.selected_appointment_id = None
+
+    # Drop a selection whose appointment no longer exists
+    if st.session_state.selected_appointment_id not in appointments_df.index:
+        st.session_state.selected_appointment_id = None
+
+    # Show detail card only for the selected appointment or when editing
+    if st.session_state.selected_appointment_id is not None or (isinstance(st.session_state.editing_appointment, pd.Series) and not st.session_state.editing_appointment.empty):
+        # Get the appointment details
         if isinstance(st.session_state.editing_appointment, pd.Series):
             row = st.session_state.editing_appointment
         else:
-            mask = appointments_df['Name'] == st.session_state.selected_customer
-            row = appointments_df[mask].iloc[0]
+            row = appointments_df.loc[st.session_state.selected_appointment_id]
         
         with st.container():
             if not isinstance(st.session_state.editing_appointment, pd.Series):
@@ -314,13 +576,13 @@ if not appointments_df.empty:
                 st.markdown(f"**Address:** {row['Address']}")
                 formatted_date = format_date_with_indicator(row['Appointment_date'])
                 st.markdown(f"**Date:** {formatted_date}")
-                st.markdown(f"**Time:** {row['Start_time']} - {row['End_time']}")
+                st.markdown(f"**Time:** {time_text(row['Start_time'])} - {time_text(row['End_time'])}")
                 st.markdown(f"**Staff:** {row['Staff_name']}")
                 
                 # Format Last Visit
                 last_visit = row['Days_since_last_visit']
-                if isinstance(last_visit, str):
-                    formatted_last_visit = last_visit
+                if pd.isna(last_visit):
+                    formatted_last_visit = 'First visit'
                 else:
                     formatted_last_visit = f"{int(last_visit)} days ago"
                 st.markdown(f"**Last Visit:** {formatted_last_visit}")
@@ -330,22 +592,32 @@ if not appointments_df.empty:
                 # Action buttons
                 edit_col1, edit_col2 = st.columns([1, 4])
                 with edit_col1:
-                    if st.button("Edit", key=f"edit_{row['Name'].replace(' ', '_').lower()}"):
+                    if st.button("Edit", key=f"edit_{row.name}"):
                         st.session_state.editing_appointment = row
                         st.session_state.edit_data = {
                             'Name': row['Name'],
                             'Address': row['Address'],
                             'Date': pd.to_datetime(row['Appointment_date']).date() if pd.notna(row['Appointment_date']) else datetime.now().date(),
-                            'Start_time': row['Start_time'],
-                            'End_time': row['End_time'],
+                            'Start_time': time_text(row['Start_time']),
+                            'End_time': time_text(row['End_time']),
                             'Staff': row['Staff_name']
                         }
                         st.rerun()
                 with edit_col2:
-                    if st.button("❌ Cancel", key=f"cancel_{row['Name'].replace(' ', '_').lower()}"):
-                        # Remove appointment
-                        appointments_df = appointments_df[appointments_df['Name'] != row['Name']]
-                        save_appointments(appointments_df)
+                    if st.button("❌ Cancel", key=f"cancel_{row.name}"):
+                        # Remove only this appointment, unless another session already has
+                        with snapshots.write() as draft:
+                            if row.name in draft.base.index:
+                                store.delete(row.name)
+                                visit_index.remove(row['Name'], row['Appointment_date'])
+                                staff_schedule.remove(row.name)
+                                utilization.remove(row['Staff_name'], row['Appointment_date'],
+                                                   row['Start_time'], row['End_time'])
+                                calendar_feeds.invalidate(row['Staff_name'])
+                                draft.df = draft.base.drop(index=row.name)
+                        st.session_state.selected_appointment_id = None
+                        if draft.changed:
+                            save_appointments()
                         st.success("Appointment cancelled successfully!")
                         st.rerun()
             
@@ -355,61 +627,86 @@ if not appointments_df.empty:
                 edit_col1, edit_col2 = st.columns(2)
                 
                 with edit_col1:
-                    new_name = st.text_input("Name", value=st.session_state.edit_data['Name'], key=f"edit_name_{row['Name']}")
-                    new_address = st.text_input("Address", value=st.session_state.edit_data['Address'], key=f"edit_addr_{row['Name']}")
-                    new_date = st.date_input("Date", value=st.session_state.edit_data['Date'], key=f"edit_date_{row['Name']}")
+                    new_name = st.text_input("Name", value=st.session_state.edit_data['Name'], key=f"edit_name_{row.name}")
+                    new_address = st.text_input("Address", value=st.session_state.edit_data['Address'], key=f"edit_addr_{row.name}")
+                    new_date = st.date_input("Date", value=st.session_state.edit_data['Date'], key=f"edit_date_{row.name}")
                 
                 with edit_col2:
                     new_start_time = st.time_input("Start Time", 
                         value=datetime.strptime(st.session_state.edit_data['Start_time'], "%H:%M").time(),
                         step=1800,  # 30 minutes in seconds
-                        key=f"edit_start_{row['Name']}")
+                        key=f"edit_start_{row.name}")
                     new_end_time = st.time_input("End Time", 
                         value=datetime.strptime(st.session_state.edit_data['End_time'], "%H:%M").time(),
                         step=1800,  # 30 minutes in seconds
-                        key=f"edit_end_{row['Name']}")
+                        key=f"edit_end_{row.name}")
                     new_staff = st.selectbox("Staff", 
                         options=staff_options,
                         index=staff_options.index(st.session_state.edit_data['Staff']),
-                        key=f"edit_staff_{row['Name']}")
+                        key=f"edit_staff_{row.name}")
                 
                 save_col1, save_col2 = st.columns(2)
                 with save_col1:
                     if st.button("Save Changes"):
-                        # Create a mask for the specific appointment we're editing
-                        name_mask = appointments_df['Name'] == row['Name']
-                        date_mask = appointments_df['Appointment_date'] == row['Appointment_date']
-                        time_mask = appointments_df['Start_time'] == row['Start_time']
-                        specific_appointment_mask = name_mask & date_mask & time_mask
-                        
-                        # Check if we're moving to a date where this customer already has an appointment
+                        appointment_id = row.name
                         new_date = pd.to_datetime(new_date)
-                        new_date_conflicts = appointments_df[
-                            (appointments_df['Name'] == new_name) & 
-                            (pd.to_datetime(appointments_df['Appointment_date']).dt.date == new_date.date()) &
-                            ~specific_appointment_mask
-                        ]
-                        
-                        # Remove any conflicting appointments
-                        if not new_date_conflicts.empty:
-                            appointments_df = appointments_df.drop(new_date_conflicts.index)
-                        
-                        # Update only the specific appointment
-                        appointments_df.loc[specific_appointment_mask, 'Name'] = new_name
-                        appointments_df.loc[specific_appointment_mask, 'Address'] = new_address
-                        appointments_df.loc[specific_appointment_mask, 'Appointment_date'] = new_date
-                        appointments_df.loc[specific_appointment_mask, 'Start_time'] = new_start_time.strftime("%H:%M")
-                        appointments_df.loc[specific_appointment_mask, 'End_time'] = new_end_time.strftime("%H:%M")
-                        appointments_df.loc[specific_appointment_mask, 'Staff_name'] = new_staff
-                        
-                        # Resort after editing
-                        appointments_df = appointments_df.sort_values(by='Appointment_date', ascending=True)
-                        
-                        save_appointments(appointments_df)
-                        st.session_state.editing_appointment = None
-                        st.session_state.selected_customer = new_name  # Keep the customer selected
-                        st.success("Appointment updated successfully!")
-                        st.rerun()
+                        snapshots.ensure_loaded(new_date)
+
+                        with snapshots.write() as draft:
+                            # Check if we're moving to a date where this customer already has an appointment
+                            same_day = store.query(name=new_name, start=new_date, end=new_date).index
+                            new_date_conflicts = [other_id for other_id in same_day
+                                                  if other_id != appointment_id and other_id in draft.base.index]
+
+                            # Check the staff member is free, ignoring the rows this edit replaces
+                            replaced_ids = {appointment_id, *new_date_conflicts}
+                            clashes = (staff_schedule.conflicts(new_staff, new_date, new_start_time, new_end_time,
+                                                                ignore_ids=replaced_ids)
+                                       or recurring.conflicts(new_staff, new_date, new_start_time, new_end_time))
+                            if new_end_time <= new_start_time:
+                                st.error("The end time must be after the start time.")
+                            elif clashes:
+                                st.error(f"{new_staff} is already booked between {new_start_time.strftime('%H:%M')} "
+                                         f"and {new_end_time.strftime('%H:%M')} on {new_date.date()}.")
+                            else:
+                                # Remove any conflicting appointments
+                                for other_id in new_date_conflicts:
+                                    store.delete(other_id)
+                                    visit_index.remove(new_name, draft.base.at[other_id, 'Appointment_date'])
+                                    staff_schedule.remove(other_id)
+                                    other = draft.base.loc[other_id]
+                                    utilization.remove(other['Staff_name'], other['Appointment_date'],
+                                                       other['Start_time'], other['End_time'])
+                                    calendar_feeds.invalidate(other['Staff_name'])
+                                if new_date_conflicts:
+                                    draft.df = draft.base.drop(index=new_date_conflicts)
+
+                                changes = {
+                                    'Name': new_name,
+                                    'Address': new_address,
+                                    'Appointment_date': new_date,
+                                    'Start_time': new_start_time.strftime("%H:%M"),
+                                    'End_time': new_end_time.strftime("%H:%M"),
+                                    'Staff_name': new_staff
+                                }
+                                store.update(appointment_id, changes)
+                                visit_index.move(row['Name'], row['Appointment_date'], new_name, new_date)
+                                staff_schedule.update(appointment_id, new_staff, new_date, new_start_time, new_end_time)
+                                utilization.remove(row['Staff_name'], row['Appointment_date'],
+                                                   row['Start_time'], row['End_time'])
+                                utilization.add(new_staff, new_date, new_start_time, new_end_time)
+                                calendar_feeds.invalidate(row['Staff_name'], new_staff)
+                                customer_directory.add(new_name, new_address)
+
+                                # Update only the specific appointment, in one batched write
+                                set_values(draft.df, [appointment_id], changes)
+
+                        if draft.changed:
+                            save_appointments()
+                            st.session_state.editing_appointment = None
+                            st.session_state.selected_appointment_id = appointment_id  # Keep the appointment selected
+                            st.success("Appointment updated successfully!")
+                            st.rerun()
                 
                 with save_col2:
                     if st.button("Cancel Edit"):
@@ -418,6 +715,185 @@ if not appointments_df.empty:
             
             if len(display_view) > 1:
                 st.markdown("---")
+    lap('detail_card')
+elif has_earlier_appointments():
+    st.info(f"No appointments from {snapshots.loaded_from:%Y-%m-%d} on.")
+    if st.button("Load earlier appointments"):
+        load_earlier(None)
+        st.rerun()
 else:
     st.info("No appointments yet. Add your first appointment using the sidebar form.")
-"""
+
+# Weekly booked hours per staff member, read from the incrementally maintained table
+with st.expander("Staff utilization"):
+    week_date = st.date_input("Week of", key="utilization_week")
+    all_staff = cached('sidebar_staff_options', lambda: build_staff_options(appointments_df, default_staff))
+    summary = utilization.week_summary(week_date, all_staff)
+    if len(recurring):
+        # Repeat bookings are not in the table; add the visits of this week
+        week_start = pd.Timestamp(week_date) - pd.Timedelta(days=week_date.weekday())
+        week_visits = recurring.frame(week_start, week_start + pd.Timedelta(days=6))
+        summary += StaffUtilization.from_frame(week_visits).week_summary(week_date, all_staff)
+    st.dataframe(summary.round(1))
+lap('utilization')
+
+# Repeat bookings: only the visits in the chosen range are expanded from the rules
+with st.expander("Repeat bookings"):
+    if not len(recurring):
+        st.caption("No repeat bookings yet. Choose a repeat option when adding an appointment.")
+    else:
+        st.caption("Series visits appear in exports, analytics and the calendar feeds, but not in the "
+                   "appointments table or its Days since last visit.")
+        series_range = st.date_input(
+            "Visits between",
+            value=(current_date.date(), current_date.date() + timedelta(days=28)),
+            key="series_range"
+        )
+        series_start, series_end = date_range_bounds(series_range)
+        visits = recurring.frame(series_start, series_end)
+        if visits.empty:
+            st.caption("No repeat visits in this range.")
+        else:
+            shown = to_export(visits.drop(columns=['Occurrence']))
+            shown['Appointment_date'] = shown['Appointment_date'].dt.strftime('%Y-%m-%d %A')
+            st.dataframe(shown, hide_index=True)
+
+            visit = st.selectbox(
+                "Visit",
+                options=range(len(visits)),
+                format_func=lambda pos: (f"{visits['Appointment_date'].iloc[pos]:%Y-%m-%d} "
+                                         f"{time_text(visits['Start_time'].iloc[pos])} "
+                                         f"{visits['Name'].iloc[pos]} ({visits['Staff_name'].iloc[pos]})"),
+                key="series_visit"
+            )
+            visit_row = visits.iloc[visit]
+            series_id, scheduled = int(visit_row['Series']), visit_row['Occurrence']
+            rule = recurring.get(series_id)
+            st.caption(f"Series {series_id}: {rule.describe()}")
+            # Calendars to refresh after a change, taken before the change can drop a visit
+            series_staff = rule.staff_members()
+
+            # Changing one visit records an exception; the rest of the series keeps its rule
+            move_col1, move_col2, move_col3, move_col4 = st.columns(4)
+            with move_col1:
+                visit_date = st.date_input("Date", value=visit_row['Appointment_date'].date(),
+                                           key=f"series_date_{series_id}_{scheduled:%Y%m%d}")
+            with move_col2:
+                visit_start = st.time_input("Start Time", value=datetime.strptime(time_text(visit_row['Start_time']), "%H:%M").time(),
+                                            step=1800, key=f"series_start_{series_id}_{scheduled:%Y%m%d}")
+            with move_col3:
+                visit_end = st.time_input("End Time", value=datetime.strptime(time_text(visit_row['End_time']), "%H:%M").time(),
+                                          step=1800, key=f"series_end_{series_id}_{scheduled:%Y%m%d}")
+            with move_col4:
+                visit_staff = st.selectbox("Staff", options=all_staff,
+                                           index=all_staff.index(visit_row['Staff_name']) if visit_row['Staff_name'] in all_staff else 0,
+                                           key=f"series_staff_{series_id}_{scheduled:%Y%m%d}")
+
+            action_col1, action_col2, action_col3, action_col4 = st.columns(4)
+            with action_col1:
+                if st.button("Save this visit"):
+                    snapshots.ensure_loaded(visit_date)
+                    with snapshots.write():
+                        clashes = (staff_schedule.conflicts(visit_staff, visit_date, visit_start, visit_end)
+                                   or recurring.conflicts(visit_staff, visit_date, visit_start, visit_end,
+                                                          ignore=(series_id, scheduled)))
+                        if visit_end <= visit_start:
+                            st.error("The end time must be after the start time.")
+                        elif clashes:
+                            st.error(f"{visit_staff} is already booked between {visit_start.strftime('%H:%M')} "
+                                     f"and {visit_end.strftime('%H:%M')} on {visit_date}.")
+                        else:
+                            recurring.change(series_id, scheduled, {
+                                'Appointment_date': visit_date,
+                                'Start_time': visit_start,
+                                'End_time': visit_end,
+                                'Staff_name': visit_staff
+                            })
+                            calendar_feeds.invalidate(*series_staff, visit_staff)
+                            st.success("Visit updated; the rest of the series is unchanged.")
+                            st.rerun()
+            with action_col2:
+                if st.button("Skip this visit"):
+                    recurring.skip(series_id, scheduled)
+                    calendar_feeds.invalidate(*series_staff)
+                    st.rerun()
+            with action_col3:
+                if st.button("End series before this visit"):
+                    recurring.end(series_id, scheduled - pd.Timedelta(days=1))
+                    calendar_feeds.invalidate(*series_staff)
+                    st.rerun()
+            with action_col4:
+                if st.button("Delete series"):
+                    recurring.remove(series_id)
+                    calendar_feeds.invalidate(*series_staff)
+                    st.rerun()
+lap('repeat_bookings')
+
+# Customer analytics are precomputed by customer_analytics.py; the view only reads the saved results
+with st.expander("Customer analytics"):
+    # Imported at the end of the script, after the rest of the page has been sent; it loads the process pool
+    from utils.analytics import analytics, analytics_path, history, saved_analytics, source_version
+
+    analytics_file = analytics_path(STORE_FILE)
+    results = saved_analytics(analytics_file)
+    if st.button("Recompute analytics", help="Reads every appointment in the store; can take a while"):
+        with st.spinner("Analysing visit history..."):
+            store_version = source_version(store, recurring)
+            # In-process: forking a pool from the threaded app server is not safe
+            results = analytics(history(store, recurring), workers=1, path=analytics_file,
+                                store_version=store_version)
+    if results is None:
+        st.caption("No analytics yet. Run `python customer_analytics.py` or press \"Recompute analytics\".")
+    else:
+        summary = results.summary()
+        st.caption(f"As of {results.as_of:%Y-%m-%d}, computed {results.computed_at:%Y-%m-%d %H:%M}")
+        if results.store_version is None:
+            st.caption("Saved without a store version; recompute to track whether they are current.")
+        elif results.store_version != cached(f'analytics_source_{recurring.version}',
+                                             lambda: source_version(store, recurring)):
+            st.warning("Appointments have changed since these analytics were computed.")
+        metric_col1, metric_col2 = st.columns(2)
+        metric_col1.metric("Customers", summary['customers'])
+        metric_col2.metric("Lapsed customers", summary['lapsed'])
+        st.markdown("**Staff continuity**")
+        st.dataframe(results.staff.round(2))
+        lapsed = results.customers[results.customers['lapsed']].sort_values('days_since_last', ascending=False)
+        if not lapsed.empty:
+            st.markdown("**Lapsed customers**, longest gone first")
+            shown = lapsed[['last_visit', 'days_since_last', 'usual_interval', 'cycle', 'main_staff']].head(100).copy()
+            shown['last_visit'] = shown['last_visit'].dt.strftime('%Y-%m-%d')
+            st.dataframe(shown)
+lap('customer_analytics')
+
+# Opt-in timing panel showing where recent reruns spent their time
+with st.sidebar:
+    if st.checkbox("Show memory usage", key="show_memory"):
+        stats = snapshots.memory_stats()
+        own_bytes = session_bytes(st.session_state)
+        with st.expander("Memory (MB)", expanded=True):
+            st.markdown(
+                f"**Snapshot:** version {stats['version']}, {stats['live_versions']} version(s) in memory  \n"
+                f"**Shared data:** {stats['snapshot_bytes'] / 1e6:.1f} MB, derived views "
+                f"{stats['derived_bytes'] / 1e6:.1f} MB  \n"
+                f"**Active sessions:** {stats['sessions']}  \n"
+                f"**Per session:** {(stats['shared_bytes_per_session'] + own_bytes) / 1e6:.2f} MB "
+                f"({own_bytes / 1e6:.2f} MB own state + shared share)"
+            )
+
+    profiling = st.checkbox("Show rerun timings", value=PROFILE_DEFAULT, key="profile_reruns")
+    if profiling and 'profiler' in st.session_state:
+        profiler = st.session_state.profiler
+        if profiler.running:
+            profiler.finish_rerun()
+        if profiler.reruns:
+            with st.expander("Rerun timings (ms)", expanded=True):
+                st.dataframe(timings_frame(reversed(profiler.reruns)).round(1), hide_index=True)
+                logged = read_log(TIMINGS_LOG)
+                st.caption(f"Percentiles over {len(logged)} logged reruns")
+                st.dataframe(phase_percentiles(logged))
+                csv_buffer = io.StringIO()
+                write_csv(logged, csv_buffer)
+                st.download_button("Download timings (CSV)", csv_buffer.getvalue(),
+                                   file_name="timings.csv", mime="text/csv")
+                st.download_button("Download timings (JSON)", json.dumps(logged),
+                                   file_name="timings.json", mime="application/json")
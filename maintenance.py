@@ -0,0 +1,76 @@
+import argparse
+import os
+import sys
+import time
+
+from utils.dedup import KEEP_POLICIES, DEFAULT_CHUNKSIZE
+from utils.maintenance import run_pipeline, run_store_pipeline, STAGES, DEFAULT_ORDER, DEFAULT_STAFF
+from utils.storage import get_store
+
+# The app's appointment store, and the CSV it was seeded from
+data_dir = os.path.join(os.path.dirname(__file__), 'data')
+default_store = os.environ.get('LOTTA_STORE', os.path.join(data_dir, 'appointments.db'))
+appointments_file = os.path.join(data_dir, 'appointments.csv')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Clean up the appointments in a single read and a single write"
+    )
+    parser.add_argument('input', nargs='?', default=default_store,
+                        help="appointment store to clean (default: the app's store), or a CSV with --csv")
+    parser.add_argument('--csv', action='store_true',
+                        help="treat input as a plain appointments CSV and rewrite it atomically")
+    parser.add_argument('-o', '--output', help="with --csv, the CSV to write (default: overwrite the input)")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=DEFAULT_ORDER,
+                        help=f"stages to run, in order (default: {' '.join(DEFAULT_ORDER)})")
+    parser.add_argument('--keep', choices=KEEP_POLICIES, default='latest',
+                        help="which appointment of a day the dedup stage keeps")
+    parser.add_argument('--staff', nargs='+', default=DEFAULT_STAFF, help="staff members for the staff stage")
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--dry-run', action='store_true', help="show what would change without writing")
+    parser.add_argument('--diff', help="with --dry-run, write the full diff to this CSV")
+    args = parser.parse_args()
+
+    if args.output and not args.csv:
+        parser.error("-o/--output only applies with --csv; a store is cleaned in place")
+    if not args.csv and not os.path.exists(args.input):
+        parser.error(f"there is no appointment store at {args.input}; start the app once to create it, "
+                     "or pass --csv to clean a CSV file")
+    if (args.csv and os.path.abspath(args.input) == os.path.abspath(appointments_file)
+            and os.path.exists(default_store)):
+        parser.error(f"{args.input} is only the seed of {default_store}, which the app reads; "
+                     "run without --csv to clean the store")
+
+    started = time.perf_counter()
+    options = dict(stages=args.stages, chunksize=args.chunksize, dry_run=args.dry_run,
+                   keep=args.keep, staff=args.staff)
+    if args.csv:
+        results, diff = run_pipeline(args.input, args.output, **options)
+    else:
+        results, diff = run_store_pipeline(get_store(args.input), **options)
+    elapsed = time.perf_counter() - started
+
+    for result in results:
+        print(result.summary())
+    print(f"Done in {elapsed:.2f}s")
+
+    if args.dry_run:
+        print(f"\nDry run: {len(diff)} changes, nothing was written")
+        if len(diff):
+            print(diff.rename(columns={'Line': 'Line' if args.csv else 'Id'}).head(20).to_string(index=False))
+        if args.diff:
+            diff.to_csv(args.diff, index=False)
+            print(f"Full diff written to {args.diff}")
+    elif not args.csv:
+        print("Running apps pick up the changes when they are restarted")
+
+    unresolved = sum(result.unresolved for result in results)
+    if unresolved:
+        print(f"\n{unresolved} rows could not be fixed; see the stage summaries above", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
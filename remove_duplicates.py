@@ -1,31 +1,60 @@
-import pandas as pd
+import argparse
 import os
+import time
 
-# Path to appointments file
+from utils.dedup import dedup_csv, dedup_store, KEEP_POLICIES, DEFAULT_CHUNKSIZE
+from utils.storage import get_store
+
+# The app's appointment store, and the CSV it was seeded from
 data_dir = os.path.join(os.path.dirname(__file__), 'data')
+default_store = os.environ.get('LOTTA_STORE', os.path.join(data_dir, 'appointments.db'))
 appointments_file = os.path.join(data_dir, 'appointments.csv')
 
-# Read existing appointments
-df = pd.read_csv(appointments_file)
-
-print("Before removing duplicates:", len(df))
-
-# Convert Appointment_date to datetime
-df['Appointment_date'] = pd.to_datetime(df['Appointment_date'])
-
-# Sort by date and time to keep the latest appointment when removing duplicates
-df = df.sort_values(['Appointment_date', 'Start_time'])
-
-# Remove duplicates keeping the last occurrence (latest time) for each customer per day
-df['date_only'] = df['Appointment_date'].dt.date
-df = df.drop_duplicates(subset=['Name', 'date_only'], keep='last')
-df = df.drop('date_only', axis=1)
-
-print("After removing duplicates:", len(df))
-
-# Save the deduplicated appointments
-df.to_csv(appointments_file, index=False)
 
-# Print some examples of removed duplicates
-print("\nExample rows after deduplication:")
-print(df[['Name', 'Appointment_date', 'Start_time', 'End_time']].head())
+def main():
+    parser = argparse.ArgumentParser(
+        description="Remove duplicate appointments, keeping one per customer per day"
+    )
+    parser.add_argument('input', nargs='?', default=default_store,
+                        help="appointment store to deduplicate (default: the app's store), or a CSV with --csv")
+    parser.add_argument('--csv', action='store_true',
+                        help="treat input as a plain appointments CSV and stream it to a new file")
+    parser.add_argument('-o', '--output', help="with --csv, the CSV to write (default: overwrite the input)")
+    parser.add_argument('--keep', choices=KEEP_POLICIES, default='latest',
+                        help="which appointment of a day to keep (default: the latest start time)")
+    parser.add_argument('--dropped', help="write every dropped row to this CSV")
+    # Stores are the default now; the flag is still accepted
+    parser.add_argument('--store', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--dry-run', action='store_true', help="report duplicates without changing anything")
+    args = parser.parse_args()
+
+    if args.output and not args.csv:
+        parser.error("-o/--output only applies with --csv; a store is deduplicated in place")
+    if not args.csv and not os.path.exists(args.input):
+        parser.error(f"there is no appointment store at {args.input}; start the app once to create it, "
+                     "or pass --csv to deduplicate a CSV file")
+    if (args.csv and os.path.abspath(args.input) == os.path.abspath(appointments_file)
+            and os.path.exists(default_store)):
+        parser.error(f"{args.input} is only the seed of {default_store}, which the app reads; "
+                     "run without --csv to deduplicate the store")
+
+    started = time.perf_counter()
+    if not args.csv:
+        report = dedup_store(get_store(args.input), keep=args.keep, chunksize=args.chunksize,
+                             dropped_output=args.dropped, dry_run=args.dry_run)
+    else:
+        report = dedup_csv(args.input, args.output, keep=args.keep, chunksize=args.chunksize,
+                           dropped_output=args.dropped, dry_run=args.dry_run)
+    elapsed = time.perf_counter() - started
+
+    print(f"{report.summary()} in {elapsed:.2f}s")
+    if report.dropped_count:
+        print("\nExample dropped rows:")
+        print(report.dropped_frame().head().to_string(index=False))
+    if args.dry_run:
+        print("\nDry run: nothing was written")
+
+
+if __name__ == '__main__':
+    main()
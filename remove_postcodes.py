@@ -1,29 +1,41 @@
-import pandas as pd
-import re
+import argparse
 import os
 
-# Path to appointments file
+from utils.maintenance import run_pipeline, run_store_pipeline
+from utils.storage import get_store
+
+# The app's appointment store, and the CSV it was seeded from
 data_dir = os.path.join(os.path.dirname(__file__), 'data')
+default_store = os.environ.get('LOTTA_STORE', os.path.join(data_dir, 'appointments.db'))
 appointments_file = os.path.join(data_dir, 'appointments.csv')
 
-# Read existing appointments
-df = pd.read_csv(appointments_file)
-
-# Function to remove postcode from address
-def remove_postcode(address):
-    # Remove the postcode pattern (e.g., "451 XX" or any 5-6 digit number)
-    return re.sub(r',\s*\d{3}\s*\d{2}\s*', ', ', address)
 
-# Print a sample of addresses before change
-print("Sample of addresses before change:")
-print(df['Address'].head())
+def main():
+    parser = argparse.ArgumentParser(description="Remove postcodes from appointment addresses")
+    parser.add_argument('input', nargs='?', default=default_store,
+                        help="appointment store to clean (default: the app's store), or a CSV with --csv")
+    parser.add_argument('--csv', action='store_true', help="treat input as a plain appointments CSV")
+    parser.add_argument('-o', '--output', help="with --csv, the CSV to write (default: overwrite the input)")
+    parser.add_argument('--dry-run', action='store_true', help="show the changes without writing")
+    args = parser.parse_args()
 
-# Update addresses
-df['Address'] = df['Address'].apply(remove_postcode)
+    if args.output and not args.csv:
+        parser.error("-o/--output only applies with --csv; a store is cleaned in place")
+    if not args.csv and not os.path.exists(args.input):
+        parser.error(f"there is no appointment store at {args.input}; start the app once to create it, "
+                     "or pass --csv to clean a CSV file")
+    if (args.csv and os.path.abspath(args.input) == os.path.abspath(appointments_file)
+            and os.path.exists(default_store)):
+        parser.error(f"{args.input} is only the seed of {default_store}, which the app reads; "
+                     "run without --csv to clean the store")
+    if args.csv:
+        results, diff = run_pipeline(args.input, args.output, stages=['postcodes'], dry_run=args.dry_run)
+    else:
+        results, diff = run_store_pipeline(get_store(args.input), stages=['postcodes'], dry_run=args.dry_run)
+    print(results[0].summary())
+    if diff is not None and len(diff):
+        print(diff.head(20).to_string(index=False))
 
-# Save updated appointments
-df.to_csv(appointments_file, index=False)
 
-# Print a sample of addresses after change
-print("\nSample of addresses after change:")
-print(df['Address'].head())
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from utils.recurrence import RecurrenceRule
+from utils.schema import DAYS_COLUMN
+
+
+def days_since(rule, start=None, end=None):
+    return [(record['Appointment_date'], record[DAYS_COLUMN]) for record in rule.occurrences(start, end)]
+
+
+def test_visit_after_skipped_one_counts_from_the_last_visit_kept():
+    rule = RecurrenceRule('Eva Larsson', 'Kungsgatan 3, Uddevalla', 'Lotta', '2025-03-03', '09:00', '10:00',
+                          interval=2, until='2025-04-14')
+    rule.exceptions[pd.Timestamp('2025-03-17')] = None
+    assert days_since(rule) == [
+        (pd.Timestamp('2025-03-03'), None),
+        (pd.Timestamp('2025-03-31'), 28),
+        (pd.Timestamp('2025-04-14'), 14),
+    ]
+    # A window starting after the skipped visit looks back past it too
+    assert days_since(rule, start='2025-03-20') == [(pd.Timestamp('2025-03-31'), 28), (pd.Timestamp('2025-04-14'), 14)]
+
+
+def test_moved_visit_counts_on_its_new_date():
+    rule = RecurrenceRule('Eva Larsson', 'Kungsgatan 3, Uddevalla', 'Lotta', '2025-03-03', '09:00', '10:00',
+                          until='2025-03-17')
+    rule.exceptions[pd.Timestamp('2025-03-10')] = {'Appointment_date': '2025-03-12'}
+    assert days_since(rule) == [
+        (pd.Timestamp('2025-03-03'), None),
+        (pd.Timestamp('2025-03-12'), 9),
+        (pd.Timestamp('2025-03-17'), 5),
+    ]
+    assert days_since(rule, start='2025-03-13') == [(pd.Timestamp('2025-03-17'), 5)]
@@ -0,0 +1,30 @@
+import argparse
+import os
+
+from utils.profiling import read_log, phase_percentiles, write_csv
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the app's rerun timing log")
+    parser.add_argument('log', nargs='?', default=os.path.join(os.path.dirname(__file__), 'data', 'timings.jsonl'))
+    parser.add_argument('--last', type=int, help="only use the most recent N reruns")
+    parser.add_argument('--csv', help="also write the timings to this CSV file")
+    args = parser.parse_args()
+
+    reruns = read_log(args.log)
+    if args.last:
+        reruns = reruns[-args.last:]
+    if not reruns:
+        print(f"No timings logged in {args.log}")
+        return
+
+    print(f"{len(reruns)} reruns, times in ms")
+    print(phase_percentiles(reruns).to_string())
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            write_csv(reruns, f)
+        print(f"Wrote {args.csv}")
+
+
+if __name__ == '__main__':
+    main()
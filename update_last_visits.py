@@ -17,10 +17,9 @@ print(f"Found {first_visits.sum()} 'First visit' entries")
 first_visit_indices = df[first_visits].index.tolist()
 keep_first_visits = random.sample(first_visit_indices, k=int(len(first_visit_indices) * 0.2))
 
-# Update the rest with random days
-for idx in first_visit_indices:
-    if idx not in keep_first_visits:
-        df.at[idx, 'Days_since_last_visit'] = random.randint(1, 40)
+# Update the rest with random days in one assignment
+update = first_visits & ~df.index.isin(keep_first_visits)
+df.loc[update, 'Days_since_last_visit'] = [random.randint(1, 40) for _ in range(update.sum())]
 
 # Save updated appointments
 df.to_csv(appointments_file, index=False)
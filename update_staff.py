@@ -1,36 +1,80 @@
-import pandas as pd
+import argparse
 import os
+import sys
+import time
+import pandas as pd
 
-# Path to appointments file
+from utils.schema import to_export
+from utils.staff_assignment import assign_staff, keep_current_staff
+from utils.storage import atomic_write, get_store
+
+# The app's appointment store, and the CSV it was seeded from
 data_dir = os.path.join(os.path.dirname(__file__), 'data')
+default_store = os.environ.get('LOTTA_STORE', os.path.join(data_dir, 'appointments.db'))
 appointments_file = os.path.join(data_dir, 'appointments.csv')
 
 # New staff list
 new_staff = ['Lotta', 'Meera', 'Alice', 'Steve']
 
-# Read existing appointments
-df = pd.read_csv(appointments_file)
 
-# Count current staff assignments
-print("Current staff assignments:")
-print(df['Staff_name'].value_counts())
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reassign staff, balancing daily and weekly workload without double-booking"
+    )
+    parser.add_argument('input', nargs='?', default=default_store,
+                        help="appointment store to update (default: the app's store), or a CSV with --csv")
+    parser.add_argument('--csv', action='store_true', help="treat input as a plain appointments CSV")
+    parser.add_argument('-o', '--output', help="with --csv, the CSV to write (default: overwrite the input)")
+    parser.add_argument('--staff', nargs='+', default=new_staff, help="staff members to assign")
+    args = parser.parse_args()
+
+    if args.output and not args.csv:
+        parser.error("-o/--output only applies with --csv; a store is updated in place")
+    if not args.csv and not os.path.exists(args.input):
+        parser.error(f"there is no appointment store at {args.input}; start the app once to create it, "
+                     "or pass --csv to update a CSV file")
+    if (args.csv and os.path.abspath(args.input) == os.path.abspath(appointments_file)
+            and os.path.exists(default_store)):
+        parser.error(f"{args.input} is only the seed of {default_store}, which the app reads; "
+                     "run without --csv to update the store")
+
+    # Read existing appointments
+    store = None if args.csv else get_store(args.input)
+    df = pd.read_csv(args.input) if args.csv else store.load()
+    before = df['Staff_name'].astype(object)
+
+    # Count current staff assignments
+    print("Current staff assignments:")
+    print(df['Staff_name'].value_counts())
+
+    started = time.perf_counter()
+    assigned = assign_staff(df, args.staff)
+    # Appointments nobody is free for keep the staff member they had, where that person is free
+    unassigned = assigned.isna()
+    df['Staff_name'], clashing = keep_current_staff(df, assigned)
+    elapsed = time.perf_counter() - started
 
-# Randomly reassign staff members while trying to maintain similar workload
-import random
-from collections import Counter
+    # Save updated appointments: the whole file, or only the store rows whose staff member changed
+    if args.csv:
+        with atomic_write(args.output or args.input) as f:
+            df.to_csv(f, index=False)
+    else:
+        changed = df['Staff_name'].astype(object).ne(before)
+        store.update_many(df.loc[changed, ['Staff_name']])
 
-# Initialize counter for new staff assignments
-staff_counter = Counter()
+    print(f"\nNew staff assignments ({len(df)} appointments in {elapsed:.2f}s):")
+    print(df['Staff_name'].value_counts())
 
-# Update staff names
-for idx in df.index:
-    # Get staff member with least assignments
-    least_assigned = min(new_staff, key=lambda x: staff_counter[x])
-    df.at[idx, 'Staff_name'] = least_assigned
-    staff_counter[least_assigned] += 1
+    if unassigned.any():
+        print(f"\n{unassigned.sum() - len(clashing)} appointments nobody else was free for kept their staff member")
+    if len(clashing):
+        print(f"\n{len(clashing)} appointments could not be booked without double-booking; "
+              f"they were left with the staff member they had:", file=sys.stderr)
+        shown = df.loc[clashing, ['Name', 'Appointment_date', 'Start_time', 'End_time', 'Staff_name']]
+        print((shown if args.csv else to_export(shown)).to_string(), file=sys.stderr)
+        return 1
+    return 0
 
-# Save updated appointments
-df.to_csv(appointments_file, index=False)
 
-print("\nNew staff assignments:")
-print(df['Staff_name'].value_counts())
+if __name__ == '__main__':
+    sys.exit(main())
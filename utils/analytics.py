@@ -0,0 +1,242 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from utils.cache import VersionedCache
+from utils.recurrence import SERIES_HORIZON_DAYS
+from utils.schema import concat_frames
+from utils.storage import atomic_write
+
+ANALYTICS_COLUMNS = ['Name', 'Appointment_date', 'Staff_name']
+# A customer has lapsed when the time since their last visit is this many of their usual intervals
+LAPSE_FACTOR = 2.0
+# ...or, with only one visit so far, this many days
+SINGLE_VISIT_LAPSE_DAYS = 180
+# Below this many visits the work is done in-process; a pool costs more than it saves
+PARALLEL_MIN_ROWS = 200_000
+# Customers whose intervals vary less than this relative to their mean count as regular
+REGULAR_CV = 0.25
+# Usual interval in days -> cycle label, checked in order
+CYCLES = [(10, 'weekly'), (17, 'fortnightly'), (24, 'every 3 weeks'), (38, 'monthly')]
+
+_results = VersionedCache(maxsize=4)
+_saved = VersionedCache(maxsize=4)
+
+
+def analytics_path(store_path):
+    """Where the precomputed analytics of the store at store_path are saved"""
+    return os.path.splitext(store_path.rstrip('/'))[0] + '-analytics.pkl'
+
+
+def data_version(visits):
+    """Fingerprint of the visit history: changes whenever a visit is added, moved, reassigned or removed"""
+    # Categoricals hash by value, so the category order doesn't matter
+    hashed = pd.util.hash_pandas_object(visits[ANALYTICS_COLUMNS], index=False).to_numpy()
+    # Order-independent, so stores that return rows in a different order agree
+    return f"{len(hashed)}-{int(np.bitwise_xor.reduce(hashed)) if len(hashed) else 0:016x}-{int(hashed.sum()):016x}"
+
+
+def _cycle(usual_interval):
+    if pd.isna(usual_interval):
+        return 'single visit'
+    for days, label in CYCLES:
+        if usual_interval <= days:
+            return label
+    return 'occasional'
+
+
+def customer_metrics(visits, as_of, lapse_factor=LAPSE_FACTOR):
+    """Per-customer visit statistics of the visits in a DataFrame, one row per customer Name with a past visit
+
+    Visits after as_of count as upcoming bookings: they are not part of the
+    interval statistics, but a customer with one is never lapsed. Intervals
+    are in days; interval_cv (spread relative to the mean) is near 0 for
+    customers on a steady cycle. continuity is the share of past visits
+    done by the staff member who visited most often.
+    """
+    as_of = pd.Timestamp(as_of).normalize()
+    visits = visits[ANALYTICS_COLUMNS].dropna(subset=['Name', 'Appointment_date'])
+    visits = visits.astype({'Name': object, 'Staff_name': object})
+    dates = pd.to_datetime(visits['Appointment_date'])
+    past = visits[(dates <= as_of).to_numpy()].sort_values(['Name', 'Appointment_date'], kind='stable')
+    upcoming = visits[(dates > as_of).to_numpy()]
+
+    names = past['Name']
+    gaps = past['Appointment_date'].diff().dt.days
+    gaps = gaps.where(names.eq(names.shift()).to_numpy())
+    by_name = gaps.groupby(names, sort=True)
+    customers = pd.DataFrame({
+        'visits': names.groupby(names, sort=True).size(),
+        'first_visit': past['Appointment_date'].groupby(names, sort=True).min(),
+        'last_visit': past['Appointment_date'].groupby(names, sort=True).max(),
+        'mean_interval': by_name.mean(),
+        'usual_interval': by_name.median(),
+        'interval_std': by_name.std(ddof=0),
+    })
+    customers['interval_cv'] = customers['interval_std'] / customers['mean_interval']
+    customers['cycle'] = customers['usual_interval'].map(_cycle)
+
+    staff_visits = past.groupby(['Name', 'Staff_name'], sort=False).size().sort_values(ascending=False, kind='stable')
+    top = staff_visits[~staff_visits.index.get_level_values('Name').duplicated()]
+    customers['main_staff'] = pd.Series(top.index.get_level_values('Staff_name'),
+                                        index=top.index.get_level_values('Name'))
+    customers['continuity'] = pd.Series(top.to_numpy(), index=top.index.get_level_values('Name')) / customers['visits']
+    customers['staff_count'] = staff_visits.groupby(level='Name').size()
+    customers['continuity'] = customers['continuity'].fillna(0.0)
+    customers['staff_count'] = customers['staff_count'].fillna(0).astype('int64')
+
+    customers['next_visit'] = upcoming['Appointment_date'].groupby(upcoming['Name']).min()
+    customers['days_since_last'] = (as_of - customers['last_visit']).dt.days
+    overdue = np.where(customers['usual_interval'].notna(),
+                       customers['days_since_last'] > lapse_factor * customers['usual_interval'],
+                       customers['days_since_last'] > SINGLE_VISIT_LAPSE_DAYS)
+    customers['lapsed'] = overdue & customers['next_visit'].isna().to_numpy()
+    customers.index.name = 'Name'
+    return customers
+
+
+def staff_metrics(customers):
+    """Per-staff continuity: the customers each staff member is the main contact of, and how loyal they are"""
+    if customers.empty:
+        return pd.DataFrame(columns=['customers', 'mean_continuity', 'regular_customers', 'lapsed_customers'])
+    grouped = customers.groupby('main_staff')
+    staff = pd.DataFrame({
+        'customers': grouped.size(),
+        'mean_continuity': grouped['continuity'].mean(),
+        'regular_customers': (customers['interval_cv'] < REGULAR_CV).groupby(customers['main_staff']).sum(),
+        'lapsed_customers': grouped['lapsed'].sum(),
+    }).astype({'regular_customers': 'int64', 'lapsed_customers': 'int64'})
+    staff.index.name = 'Staff_name'
+    return staff.sort_values('customers', ascending=False)
+
+
+def partition_by_customer(visits, partitions):
+    """Split the visits into partitions so that all of a customer's visits land in the same one"""
+    codes, _ = pd.factorize(visits['Name'])
+    buckets = codes % partitions
+    return [visits[buckets == bucket] for bucket in range(partitions)]
+
+
+def compute(visits, as_of=None, workers=None, lapse_factor=LAPSE_FACTOR):
+    """Customer and staff metrics of a visit history; returns (customers, staff)
+
+    The history is partitioned by customer and the partitions are run
+    through customer_metrics() in a process pool. Small histories, or
+    workers=1, are done in-process.
+    """
+    as_of = pd.Timestamp(as_of or datetime.now()).normalize()
+    workers = workers or os.cpu_count() or 1
+    visits = visits[ANALYTICS_COLUMNS]
+    if workers <= 1 or len(visits) < PARALLEL_MIN_ROWS:
+        customers = customer_metrics(visits, as_of, lapse_factor)
+    else:
+        # A few partitions per worker evens out customers with long histories
+        parts = [part for part in partition_by_customer(visits, workers * 4) if not part.empty]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(customer_metrics, parts, repeat(as_of), repeat(lapse_factor))
+            customers = pd.concat(list(results)).sort_index()
+    return customers, staff_metrics(customers)
+
+
+class AnalyticsResults:
+    """Computed analytics with the data version and date they were computed for
+
+    store_version is the source_version() of the store and repeat bookings
+    when the history was read, so a reader can tell whether the results are
+    current without reading the history again. It is None for results saved
+    without one.
+    """
+
+    store_version = None
+
+    def __init__(self, version, as_of, customers, staff, computed_at=None, store_version=None):
+        self.version = version
+        self.store_version = store_version
+        self.as_of = pd.Timestamp(as_of).normalize()
+        self.customers = customers
+        self.staff = staff
+        self.computed_at = computed_at or datetime.now()
+
+    def summary(self):
+        """Headline figures: customers, lapsed customers and the mix of visit cycles"""
+        customers = self.customers
+        return {
+            'customers': len(customers),
+            'lapsed': int(customers['lapsed'].sum()),
+            'cycles': customers['cycle'].value_counts().to_dict(),
+        }
+
+    def save(self, path):
+        with atomic_write(path, binary=True) as f:
+            pd.to_pickle(self, f)
+
+    @classmethod
+    def load(cls, path):
+        """Read saved results, or None if there are none"""
+        if not os.path.exists(path):
+            return None
+        return pd.read_pickle(path)
+
+
+def saved_analytics(path):
+    """The results saved at path, or None; the file is only read again when it changes"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return _saved.get_or_compute(path, (stat.st_mtime_ns, stat.st_size), lambda: AnalyticsResults.load(path))
+
+
+def analytics(visits, as_of=None, workers=None, path=None, store_version=None):
+    """Return AnalyticsResults for a visit history, computing them only when needed
+
+    Results are memoized per (data version, as_of) in this process and, if
+    path is given, saved there; saved results for the same version and
+    date are reused rather than recomputed. store_version, the
+    source_version() the visits were read at, is recorded with the results.
+    """
+    as_of = pd.Timestamp(as_of or datetime.now()).normalize()
+    version = data_version(visits)
+    changed = []
+
+    def build():
+        saved = AnalyticsResults.load(path) if path else None
+        if saved is not None and saved.version == version and saved.as_of == as_of:
+            return saved
+        customers, staff = compute(visits, as_of, workers)
+        changed.append('computed')
+        return AnalyticsResults(version, as_of, customers, staff, store_version=store_version)
+
+    results = _results.get_or_compute('analytics', (version, as_of), build)
+    # Reused results may have been read from the store before a change that was since undone
+    if store_version is not None and results.store_version != store_version:
+        results.store_version = store_version
+        changed.append('restamped')
+    if path and changed:
+        results.save(path)
+    return results
+
+
+def source_version(store, bookings=None):
+    """Version stamp of what history() reads: the store and, if given, the repeat bookings"""
+    version = store.version()
+    return version if bookings is None else f"{version}+{bookings.version}"
+
+
+def history(store, bookings=None, as_of=None):
+    """The columns analytics need of every appointment in a store, read in chunks
+
+    With bookings, the visits of the repeat bookings are included, up to
+    SERIES_HORIZON_DAYS after as_of (today by default).
+    """
+    chunks = [chunk[ANALYTICS_COLUMNS] for chunk in store.iter_chunks()]
+    if bookings is not None and len(bookings):
+        until = pd.Timestamp(as_of or datetime.now()).normalize() + pd.Timedelta(days=SERIES_HORIZON_DAYS)
+        chunks.append(bookings.frame(None, until)[ANALYTICS_COLUMNS])
+    if not chunks:
+        return pd.DataFrame(columns=ANALYTICS_COLUMNS)
+    return concat_frames(chunks)
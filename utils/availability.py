@@ -0,0 +1,43 @@
+import pandas as pd
+
+from utils.conflicts import SLOT_MINUTES, booked_masks, slot_mask, time_to_minutes
+
+DURATIONS = [60, 90, 120, 180, 240]
+
+
+def _runs(free, slots):
+    """Mask of the slots where a run of `slots` free slots in a row starts"""
+    starts = free
+    for shift in range(1, slots):
+        starts &= free >> shift
+    return starts
+
+
+def free_slots(schedule, staff, start_date, end_date, duration, earliest='08:00', latest='17:00', extra=None):
+    """Yield (date, start minutes, end minutes, staff) for every free slot of duration minutes
+
+    Looks at each day from start_date to end_date (inclusive) and each staff
+    member, in order; slots of a day come sorted by start time. A staff-day is
+    one bitmask of booked slots from the StaffSchedule, so finding the free
+    runs of a day is a few shifts and ANDs. Slots start on SLOT_MINUTES
+    boundaries between earliest and latest and must end by latest. extra is
+    an optional appointments DataFrame of bookings the schedule does not
+    hold, e.g. the visits of repeat bookings.
+    """
+    slots = -(-duration // SLOT_MINUTES)
+    window = slot_mask(time_to_minutes(earliest), time_to_minutes(latest))
+    extra_masks = booked_masks(extra) if extra is not None else {}
+    for day in range(pd.Timestamp(start_date).toordinal(), pd.Timestamp(end_date).toordinal() + 1):
+        found = []
+        for name in staff:
+            busy = schedule.busy_mask(name, day) | extra_masks.get((name, day), 0)
+            starts = _runs(window & ~busy, slots)
+            while starts:
+                lowest = starts & -starts
+                found.append((lowest.bit_length() - 1, name))
+                starts ^= lowest
+        date = pd.Timestamp.fromordinal(day)
+        # A stable sort keeps the staff order within each start time
+        for slot, name in sorted(found, key=lambda item: item[0]):
+            start = slot * SLOT_MINUTES
+            yield date, start, start + duration, name
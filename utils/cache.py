@@ -0,0 +1,56 @@
+from collections import OrderedDict
+from threading import RLock
+
+
+class VersionedCache:
+    """Bounded LRU cache whose entries are tied to a data version
+
+    An entry is reused only while the version it was computed for is still
+    current, so bumping the version invalidates everything derived from the
+    old data without having to track individual keys.
+    """
+
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, version, compute):
+        """Return the cached value for (key, version), computing it on a miss"""
+        with self._lock:
+            entry_key = (key, version)
+            if entry_key in self._entries:
+                self._entries.move_to_end(entry_key)
+                self.hits += 1
+                return self._entries[entry_key]
+
+        value = compute()
+
+        with self._lock:
+            self.misses += 1
+            # Drop entries for the same key computed against older versions
+            for stale in [k for k in self._entries if k[0] == key]:
+                del self._entries[stale]
+            self._entries[entry_key] = value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key=None):
+        """Drop one key (all versions) or, with no key, the whole cache"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                for stale in [k for k in self._entries if k[0] == key]:
+                    del self._entries[stale]
+
+    def values(self):
+        """Return the cached values"""
+        with self._lock:
+            return list(self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,274 @@
+import hashlib
+import threading
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+
+import pandas as pd
+
+from utils.schema import time_text
+
+# Feeds hold the appointments from this many days back on
+FEED_PAST_DAYS = 90
+WEEKDAY_CODES = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+
+
+def feed_path(staff):
+    """URL path of a staff member's feed"""
+    return f"/calendars/{quote(str(staff), safe='')}.ics"
+
+
+def _escape(text):
+    """Escape a TEXT value (RFC 5545 section 3.3.11)"""
+    return (str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _fold(line):
+    """Split a content line into lines of at most 75 octets, continued with a leading space"""
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return [line]
+    parts, start, limit = [], 0, 75
+    while start < len(data):
+        end = min(start + limit, len(data))
+        # Don't cut a multi-byte character in half
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(('' if start == 0 else ' ') + data[start:end].decode('utf-8'))
+        start, limit = end, 74
+    return parts
+
+
+def _local(date, minutes):
+    """Floating local date-time, e.g. 20250204T090000"""
+    return f"{pd.Timestamp(date):%Y%m%d}T{time_text(minutes).replace(':', '')}00"
+
+
+def _event(uid, stamp, date, start, end, name, address, extra=()):
+    return [
+        'BEGIN:VEVENT',
+        f'UID:{uid}',
+        f'DTSTAMP:{stamp}',
+        f'DTSTART:{_local(date, start)}',
+        f'DTEND:{_local(date, end)}',
+        f'SUMMARY:{_escape(name)}',
+        f'LOCATION:{_escape(address)}',
+        *extra,
+        'END:VEVENT',
+    ]
+
+
+def appointment_events(appointments_df, stamp):
+    """VEVENT lines of each appointment in a DataFrame indexed by appointment id"""
+    lines = []
+    columns = ['Name', 'Address', 'Appointment_date', 'Start_time', 'End_time']
+    for appointment_id, name, address, date, start, end in appointments_df[columns].itertuples(name=None):
+        if pd.isna(date) or pd.isna(start) or pd.isna(end):
+            continue
+        lines += _event(f'appointment-{appointment_id}@lotta', stamp, date, start, end, name, address)
+    return lines
+
+
+def _rrule(rule):
+    if rule.unit == 'weeks':
+        text = f'RRULE:FREQ=WEEKLY;INTERVAL={rule.interval}'
+    else:
+        nth = (rule.start_date.day - 1) // 7 + 1
+        text = f'RRULE:FREQ=MONTHLY;INTERVAL={rule.interval};BYDAY={nth}{WEEKDAY_CODES[rule.start_date.weekday()]}'
+    if rule.until is not None:
+        text += f';UNTIL={rule.until:%Y%m%d}T235959'
+    return text
+
+
+def series_events(rule_id, rule, staff, stamp):
+    """VEVENT lines of a repeat booking as seen in one staff member's calendar
+
+    The series' own staff member gets one event with an RRULE; skipped
+    visits become EXDATEs and changed visits RECURRENCE-ID overrides. A
+    visit handed to someone else is excluded there and shows up in the
+    other person's calendar as a single event.
+    """
+    uid = f'series-{rule_id}@lotta'
+    lines, excluded, overrides = [], [], []
+    for scheduled in sorted(rule.exceptions):
+        visit = rule.visit(scheduled)
+        if visit is None:
+            excluded.append(scheduled)
+            continue
+        if visit['Staff_name'] == rule.staff == staff:
+            overrides.append(visit)
+        elif rule.staff == staff:
+            excluded.append(scheduled)
+        elif visit['Staff_name'] == staff:
+            lines += _event(f'series-{rule_id}-{scheduled:%Y%m%d}@lotta', stamp, visit['Appointment_date'],
+                            visit['Start_time'], visit['End_time'], rule.name, rule.address)
+    if rule.staff != staff:
+        return lines
+
+    extra = [_rrule(rule)] + [f'EXDATE:{_local(day, rule.start_time)}' for day in excluded]
+    lines += _event(uid, stamp, rule.start_date, rule.start_time, rule.end_time, rule.name, rule.address, extra)
+    for visit in overrides:
+        lines += _event(uid, stamp, visit['Appointment_date'], visit['Start_time'], visit['End_time'],
+                        rule.name, rule.address, [f"RECURRENCE-ID:{_local(visit['Occurrence'], rule.start_time)}"])
+    return lines
+
+
+def build_calendar(staff, appointments_df, series=(), stamp=None):
+    """The iCalendar document of a staff member's appointments and repeat bookings"""
+    stamp = stamp or datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Lottas Hemstad//Appointments//EN',
+        'CALSCALE:GREGORIAN',
+        f'X-WR-CALNAME:{_escape(staff)}',
+    ]
+    lines += appointment_events(appointments_df, stamp)
+    for rule_id, rule in series:
+        lines += series_events(rule_id, rule, staff, stamp)
+    lines.append('END:VCALENDAR')
+    return ''.join(part + '\r\n' for line in lines for part in _fold(line))
+
+
+class Feed:
+    """One built feed document with its validators"""
+
+    def __init__(self, body, last_modified, built_on):
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.last_modified = last_modified
+        self.built_on = built_on
+
+
+class StaffFeeds:
+    """Per-staff iCalendar feeds, built on first request and cached until that staff member's bookings change
+
+    A feed is built from store.query(staff=...), which reads only that staff
+    member's appointments, plus the repeat bookings. The add, edit and
+    cancel paths call invalidate() with the staff members they touched, so
+    polling calendars get the cached document (or a 304) in between. When
+    the date window moves on a new day and drops appointments from the feed,
+    Last-Modified (and so the ETag) moves with it.
+    """
+
+    def __init__(self, store, recurring=None, past_days=FEED_PAST_DAYS):
+        self.store = store
+        self.recurring = recurring
+        self.past_days = past_days
+        self._feeds = {}
+        self._changed = {}
+        self._known = None
+        self._started = datetime.now(timezone.utc).replace(microsecond=0)
+        self._lock = threading.RLock()
+        self.builds = 0
+
+    def invalidate(self, *staff):
+        """Drop the cached feeds of the given staff members, or of everyone when none are given"""
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        with self._lock:
+            if staff:
+                names = [name for name in staff if name is not None and not pd.isna(name)]
+                if self._known is not None:
+                    self._known.update(names)
+            else:
+                names = list(self._feeds)
+                self._changed.clear()
+                self._known = None
+                self._started = now
+            for name in names:
+                self._feeds.pop(name, None)
+                self._changed[name] = now
+
+    def is_known(self, staff):
+        """Whether staff has stored appointments or repeat-booking visits
+
+        The stored staff names are read once and kept until a full
+        invalidate(); staff touched by a change are added as they come.
+        """
+        with self._lock:
+            if self._known is None:
+                self._known = set(self.store.staff_names())
+            if staff in self._known:
+                return True
+        return self.recurring is not None and any(staff in rule.staff_members() for _, rule in self.recurring)
+
+    def get(self, staff):
+        """Return the Feed of a staff member, building it if it is not cached"""
+        today = pd.Timestamp.now().normalize()
+        with self._lock:
+            feed = self._feeds.get(staff)
+            # The feed's date window moves on every day
+            if feed is not None and feed.built_on == today:
+                return feed
+            appointments = self.store.query(staff=staff, start=today - pd.Timedelta(days=self.past_days))
+            series = list(self.recurring) if self.recurring is not None else []
+            last_modified = self._changed.get(staff, self._started)
+            # Stamped with the last change rather than the build time, so unchanged data keeps its ETag
+            body = build_calendar(staff, appointments, series, stamp=f'{last_modified:%Y%m%dT%H%M%SZ}')
+            if feed is not None and body.encode('utf-8') != feed.body:
+                # Only the window moved, and it dropped appointments: the feed changed now
+                last_modified = self._changed[staff] = datetime.now(timezone.utc).replace(microsecond=0)
+                body = build_calendar(staff, appointments, series, stamp=f'{last_modified:%Y%m%dT%H%M%SZ}')
+            feed = Feed(body.encode('utf-8'), last_modified, today)
+            self._feeds[staff] = feed
+            self.builds += 1
+            return feed
+
+
+def _not_modified(headers, feed):
+    """Whether a conditional request's validators still match the feed"""
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or feed.etag in tags or f'W/{feed.etag}' in tags
+    if_modified_since = headers.get('If-Modified-Since')
+    if if_modified_since:
+        try:
+            return feed.last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def make_handler(feeds):
+    """A request handler class serving GET /calendars/<staff>.ics from feeds"""
+
+    class FeedHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?', 1)[0]
+            if not (path.startswith('/calendars/') and path.endswith('.ics')):
+                self.send_error(404)
+                return
+            staff = unquote(path[len('/calendars/'):-len('.ics')])
+            # Only staff with bookings get a feed, so made-up names are neither built nor cached
+            if not staff or not feeds.is_known(staff):
+                self.send_error(404)
+                return
+            feed = feeds.get(staff)
+            not_modified = _not_modified(self.headers, feed)
+            self.send_response(304 if not_modified else 200)
+            self.send_header('ETag', feed.etag)
+            self.send_header('Last-Modified', format_datetime(feed.last_modified, usegmt=True))
+            self.send_header('Cache-Control', 'no-cache')
+            if not_modified:
+                self.end_headers()
+                return
+            self.send_header('Content-Type', 'text/calendar; charset=utf-8')
+            self.send_header('Content-Length', str(len(feed.body)))
+            self.end_headers()
+            self.wfile.write(feed.body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FeedHandler
+
+
+def serve(feeds, host='127.0.0.1', port=8502):
+    """Serve the feeds over HTTP from a daemon thread; returns the server (call shutdown() to stop it)"""
+    server = ThreadingHTTPServer((host, port), make_handler(feeds))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='calendar-feeds', daemon=True).start()
+    return server
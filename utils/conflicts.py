@@ -0,0 +1,197 @@
+from bisect import bisect_left, insort
+from datetime import time
+import numpy as np
+import pandas as pd
+
+# Free-slot searches work on 30-minute slots, the step of the app's time inputs
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+
+def time_to_minutes(value):
+    """Convert 'HH:MM', a datetime.time or minutes after midnight to minutes after midnight"""
+    if isinstance(value, time):
+        return value.hour * 60 + value.minute
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    hours, minutes = str(value).split(':')[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def minutes_column(times):
+    """Vectorized 'HH:MM' to minutes after midnight
+
+    Columns already holding minutes (the compact schema) are used as they
+    are. Otherwise only the distinct time strings are parsed; there are a few
+    dozen of them even in very large tables.
+    """
+    if pd.api.types.is_numeric_dtype(times):
+        return times.to_numpy(dtype=np.int64)
+    codes, uniques = pd.factorize(times.astype(str))
+    parsed = np.array([time_to_minutes(value) for value in uniques], dtype=np.int64)
+    return parsed[codes]
+
+
+def day_numbers(dates):
+    """Vectorized date.toordinal() of each date"""
+    days = pd.to_datetime(dates).to_numpy().astype('datetime64[D]').astype(np.int64)
+    return days + pd.Timestamp('1970-01-01').toordinal()
+
+
+def _day(value):
+    return pd.Timestamp(value).toordinal()
+
+
+def slot_mask(start, end):
+    """Bitmask of the slots a booking from start to end (minutes) touches; bit i is the slot at i * SLOT_MINUTES"""
+    first = max(start // SLOT_MINUTES, 0)
+    last = min(-(-end // SLOT_MINUTES), SLOTS_PER_DAY)
+    return (1 << last) - (1 << first) if last > first else 0
+
+
+def _slot_masks(frame):
+    """OR the slot masks of an interval frame per (staff, day number)"""
+    if frame.empty:
+        return {}
+    start = frame['start'].to_numpy(dtype=np.int64)
+    end = frame['end'].to_numpy(dtype=np.int64)
+    first = np.clip(start // SLOT_MINUTES, 0, SLOTS_PER_DAY).astype(np.uint64)
+    last = np.clip(-(-end // SLOT_MINUTES), 0, SLOTS_PER_DAY).astype(np.uint64)
+    one = np.uint64(1)
+    masks = np.where(last > first, (one << last) - (one << first), np.uint64(0))
+
+    codes = frame.groupby(['Staff_name', 'day'], sort=False, observed=True).ngroup().to_numpy()
+    order = np.argsort(codes, kind='stable')
+    starts = np.flatnonzero(np.r_[True, np.diff(codes[order]) != 0])
+    combined = np.bitwise_or.reduceat(masks[order], starts)
+    rows = order[starts]
+    keys = zip(frame['Staff_name'].to_numpy()[rows].tolist(), frame['day'].to_numpy()[rows].tolist())
+    return dict(zip(keys, combined.tolist()))
+
+
+def booked_masks(appointments_df):
+    """Slot masks of the bookings in an appointments DataFrame, keyed by (staff, day number)"""
+    if appointments_df.empty:
+        return {}
+    return _slot_masks(_interval_frame(appointments_df))
+
+
+class StaffSchedule:
+    """Per-staff, per-day interval index of booked time slots
+
+    Each staff-day keeps its bookings as (start, end, id) tuples sorted by
+    start minute. As long as the bookings of a staff-day do not overlap each
+    other (which the app enforces on every add and edit), a new booking can
+    only clash with its neighbours around the insertion point, so a check is
+    a binary search. Overlaps already present in older data are reported by
+    find_overlaps().
+
+    Each staff-day also keeps a bitmask of the SLOT_MINUTES slots its
+    bookings touch, for free-slot searches (see utils/availability.py).
+    """
+
+    def __init__(self):
+        self._days = {}
+        self._by_id = {}
+        self._masks = {}
+
+    @classmethod
+    def from_frame(cls, appointments_df):
+        """Build the index from an appointments DataFrame indexed by appointment id"""
+        schedule = cls()
+        if appointments_df.empty:
+            return schedule
+        # Sorted on the whole (start, end, id) tuple, as remove() bisects for it
+        frame = _interval_frame(appointments_df).sort_index().sort_values(['Staff_name', 'day', 'start', 'end'],
+                                                                          kind='stable')
+        for appointment_id, staff, day, start, end in frame.itertuples(name=None):
+            key = (staff, day)
+            schedule._days.setdefault(key, []).append((start, end, appointment_id))
+            schedule._by_id[appointment_id] = (key, start, end)
+        schedule._masks = _slot_masks(frame)
+        return schedule
+
+    def add(self, appointment_id, staff, appointment_date, start_time, end_time):
+        """Record a booking"""
+        key = (staff, _day(appointment_date))
+        start, end = time_to_minutes(start_time), time_to_minutes(end_time)
+        insort(self._days.setdefault(key, []), (start, end, appointment_id))
+        self._by_id[appointment_id] = (key, start, end)
+        self._masks[key] = self._masks.get(key, 0) | slot_mask(start, end)
+
+    def remove(self, appointment_id):
+        """Forget a booking"""
+        entry = self._by_id.pop(appointment_id, None)
+        if entry is None:
+            return
+        key, start, end = entry
+        bookings = self._days[key]
+        pos = bisect_left(bookings, (start, end, appointment_id))
+        if pos < len(bookings) and bookings[pos][2] == appointment_id:
+            del bookings[pos]
+        if not bookings:
+            del self._days[key]
+            del self._masks[key]
+            return
+        # Other bookings may share slots with the removed one, so rebuild the day's mask
+        mask = 0
+        for other_start, other_end, _ in bookings:
+            mask |= slot_mask(other_start, other_end)
+        self._masks[key] = mask
+
+    def update(self, appointment_id, staff, appointment_date, start_time, end_time):
+        """Move a booking to a new staff member, day or time"""
+        self.remove(appointment_id)
+        self.add(appointment_id, staff, appointment_date, start_time, end_time)
+
+    def booked_minutes(self, staff, day):
+        """Minutes booked for a staff member on a day number (date.toordinal())"""
+        return sum(end - start for start, end, _ in self._days.get((staff, day), ()))
+
+    def busy_mask(self, staff, day):
+        """Bitmask of the slots booked for a staff member on a day number (date.toordinal())"""
+        return self._masks.get((staff, day), 0)
+
+    def conflicts(self, staff, appointment_date, start_time, end_time, ignore_ids=()):
+        """Return the ids of bookings that overlap the given slot"""
+        bookings = self._days.get((staff, _day(appointment_date)))
+        if not bookings:
+            return []
+        start, end = time_to_minutes(start_time), time_to_minutes(end_time)
+        clashes = []
+        # Bookings starting inside the slot
+        pos = bisect_left(bookings, (end,))
+        while pos > 0 and bookings[pos - 1][0] >= start:
+            pos -= 1
+            clashes.append(bookings[pos][2])
+        # The booking starting before the slot may still be running
+        if pos > 0 and bookings[pos - 1][1] > start:
+            clashes.append(bookings[pos - 1][2])
+        return [appointment_id for appointment_id in clashes if appointment_id not in ignore_ids]
+
+
+def _interval_frame(appointments_df):
+    """Staff, day number and start/end minutes for each appointment"""
+    return pd.DataFrame({
+        'Staff_name': appointments_df['Staff_name'],
+        'day': day_numbers(appointments_df['Appointment_date']),
+        'start': minutes_column(appointments_df['Start_time']),
+        'end': minutes_column(appointments_df['End_time']),
+    }, index=appointments_df.index)
+
+
+def find_overlaps(appointments_df):
+    """Find every double booking in one sorted sweep
+
+    Returns the appointments that start before an earlier booking of the same
+    staff member on the same day has ended.
+    """
+    if appointments_df.empty:
+        return appointments_df
+    frame = _interval_frame(appointments_df).sort_values(['Staff_name', 'day', 'start'])
+    groups = frame.groupby(['Staff_name', 'day'], sort=False, observed=True)['end']
+    # Latest end time among the earlier bookings of the same staff-day
+    running_end = groups.cummax()
+    previous_end = running_end.groupby([frame['Staff_name'], frame['day']], sort=False, observed=True).shift()
+    overlapping = frame.index[(frame['start'] < previous_end).to_numpy()]
+    return appointments_df.loc[overlapping]
@@ -0,0 +1,165 @@
+from bisect import bisect_left, insort
+import heapq
+import re
+from collections import defaultdict
+
+from utils.cache import VersionedCache
+
+
+def _normalize(text):
+    return re.sub(r'\s+', ' ', str(text).strip().lower())
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CustomerDirectory:
+    """Customers keyed by id, with prefix and trigram search over name and address
+
+    A customer is a distinct (Name, Address) pair. Lookups by id are dict
+    reads. Prefix search bisects a sorted list of the distinct name and
+    address words, each pointing at the set of customers using it, and
+    fuzzy search uses a trigram index. add() updates both incrementally;
+    add_many() builds them with one sort. Search results are cached until
+    the next customer is added.
+    """
+
+    def __init__(self):
+        self._customers = {}
+        self._ids = {}
+        self._by_name = {}
+        self._sort_keys = {}
+        self._postings = {}
+        self._tokens = []
+        # Trigram -> ids; lists, as a customer's trigrams are distinct
+        self._trigram_index = defaultdict(list)
+        self._sorted = []
+        self._generation = 0
+        self._results = VersionedCache(maxsize=64)
+
+    @classmethod
+    def from_frame(cls, appointments_df):
+        """Build the directory from the distinct customers in an appointments DataFrame"""
+        directory = cls()
+        if appointments_df.empty:
+            return directory
+        customers = appointments_df[['Name', 'Address']].drop_duplicates()
+        directory.add_many(customers.itertuples(index=False, name=None))
+        return directory
+
+    def __len__(self):
+        return len(self._customers)
+
+    def _register(self, name, address):
+        """Record a new customer in the id maps and the word and trigram indexes
+
+        Returns the new id and the words seen for the first time.
+        """
+        customer_id = len(self._customers) + 1
+        self._customers[customer_id] = {'Name': name, 'Address': address}
+        self._ids[(name, address)] = customer_id
+        self._by_name.setdefault(name, customer_id)
+        self._sort_keys[customer_id] = self.label(customer_id).lower()
+
+        text = _normalize(f"{name} {address}")
+        new_tokens = []
+        for token in set(re.findall(r'\w+', text)):
+            if token not in self._postings:
+                self._postings[token] = set()
+                new_tokens.append(token)
+            self._postings[token].add(customer_id)
+        trigram_index = self._trigram_index
+        for gram in _trigrams(text):
+            trigram_index[gram].append(customer_id)
+        self._generation += 1
+        return customer_id, new_tokens
+
+    def add(self, name, address):
+        """Add a customer if new and return its id"""
+        key = (name, address)
+        if key in self._ids:
+            return self._ids[key]
+        customer_id, new_tokens = self._register(name, address)
+        insort(self._sorted, (self._sort_keys[customer_id], customer_id))
+        for token in new_tokens:
+            insort(self._tokens, token)
+        return customer_id
+
+    def add_many(self, customers):
+        """Add (name, address) pairs, sorting the label and word lists once at the end"""
+        for name, address in customers:
+            if (name, address) not in self._ids:
+                self._register(name, address)
+        self._sorted = sorted((key, customer_id) for customer_id, key in self._sort_keys.items())
+        self._tokens = sorted(self._postings)
+
+    def get(self, customer_id):
+        """Return the customer's details"""
+        return self._customers[customer_id]
+
+    def find(self, name, address=None):
+        """Return the id of a customer by name (and address), or None"""
+        if address is not None:
+            return self._ids.get((name, address))
+        return self._by_name.get(name)
+
+    def label(self, customer_id):
+        """Return the 'Name (Address)' label used in the selector"""
+        customer = self._customers[customer_id]
+        return f"{customer['Name']} ({customer['Address']})"
+
+    def all_ids(self, limit=None):
+        """Return customer ids sorted by label"""
+        entries = self._sorted if limit is None else self._sorted[:limit]
+        return [customer_id for _, customer_id in entries]
+
+    def _first_by_label(self, ids, limit):
+        return heapq.nsmallest(limit, ids, key=self._sort_keys.__getitem__)
+
+    def _prefix_ids(self, prefix):
+        """Set of ids of customers with a name or address word starting with prefix; not to be modified"""
+        matches = []
+        pos = bisect_left(self._tokens, prefix)
+        while pos < len(self._tokens) and self._tokens[pos].startswith(prefix):
+            matches.append(self._postings[self._tokens[pos]])
+            pos += 1
+        if len(matches) == 1:
+            return matches[0]
+        return set().union(*matches)
+
+    def prefix_search(self, prefix, limit=20):
+        """Return ids of customers with a name or address word starting with prefix"""
+        return self._first_by_label(self._prefix_ids(_normalize(prefix)), limit)
+
+    def search(self, query, limit=20):
+        """Type-ahead search: prefix matches first, then fuzzy trigram matches"""
+        query = _normalize(query)
+        return self._results.get_or_compute((query, limit), self._generation,
+                                            lambda: self._search(query, limit))
+
+    def _search(self, query, limit):
+        if not query:
+            return self.all_ids(limit)
+
+        # Customers matching every word as a prefix rank first; intersect from the rarest word
+        matches = sorted((self._prefix_ids(word) for word in query.split(' ')), key=len)
+        exact = matches[0].intersection(*matches[1:])
+        results = self._first_by_label(exact, limit)
+
+        if len(results) < limit and len(query) >= 3:
+            grams = _trigrams(query)
+            scores = {}
+            for gram in grams:
+                for customer_id in self._trigram_index.get(gram, ()):
+                    scores[customer_id] = scores.get(customer_id, 0) + 1
+            threshold = max(1, len(grams) // 2)
+            fuzzy = heapq.nsmallest(
+                limit - len(results),
+                (customer_id for customer_id, score in scores.items()
+                 if score >= threshold and customer_id not in exact),
+                key=lambda customer_id: (-scores[customer_id], self._sort_keys[customer_id])
+            )
+            results.extend(fuzzy)
+        return results
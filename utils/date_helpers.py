@@ -1,8 +1,13 @@
 from datetime import datetime
 import pandas as pd
+from utils.profiling import timed
 
+@timed('format_appointment_date')
 def format_appointment_date(date_obj):
-    """Convert date object to 'Thursday dd-mm' format"""
+    """Convert date object to 'Thursday dd-mm' format
+
+    For whole columns use utils.formatting.format_appointment_date_column.
+    """
     try:
         if pd.isna(date_obj):
             return "No date"
@@ -10,8 +15,15 @@ def format_appointment_date(date_obj):
     except:
         return "Invalid date"
 
-def calculate_days_since_last_visit(appointments_df, customer_name, current_date):
-    """Calculate days since last visit for a customer"""
+@timed('calculate_days_since_last_visit')
+def calculate_days_since_last_visit(appointments_df, customer_name, current_date, visit_index=None):
+    """Calculate days since last visit for a customer
+
+    When a VisitIndex is given the lookup is a binary search instead of a full scan.
+    """
+    if visit_index is not None:
+        return visit_index.days_since_last_visit(customer_name, current_date)
+
     if appointments_df.empty:
         return None
     
@@ -34,3 +46,15 @@ def calculate_days_since_last_visit(appointments_df, customer_name, current_date
     last_visit = past_appointments.iloc[0]['Appointment_date']
     days_since = (current_date - last_visit).days
     return days_since
+
+def date_range_bounds(selection):
+    """Return (start, end) from a st.date_input range picker
+
+    The picker returns a single date, or a one-item tuple, while the user is
+    still choosing; the range is then that one day.
+    """
+    if isinstance(selection, (tuple, list)):
+        if len(selection) == 2:
+            return selection[0], selection[1]
+        selection = selection[0]
+    return selection, selection
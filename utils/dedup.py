@@ -0,0 +1,242 @@
+from contextlib import ExitStack
+import numpy as np
+import pandas as pd
+
+from utils.conflicts import time_to_minutes
+from utils.schema import to_export
+from utils.storage import COLUMNS, ID_COLUMN, atomic_write
+
+# Which appointment of a customer's day survives:
+#   latest   - the latest start time (ties go to the row read last)
+#   earliest - the earliest start time (ties go to the row read first)
+#   last     - the row read last
+#   first    - the row read first
+KEEP_POLICIES = ('latest', 'earliest', 'last', 'first')
+DEFAULT_CHUNKSIZE = 50_000
+
+# A row's rank packs its start minute above its position (file line or appointment id)
+_POSITION_BITS = 40
+_POSITION_MASK = (1 << _POSITION_BITS) - 1
+
+
+class DedupReport:
+    """Outcome of a deduplication run"""
+
+    def __init__(self, max_reported=1000):
+        self.max_reported = max_reported
+        self.rows_read = 0
+        self.dropped_count = 0
+        self.dropped = []
+        self._reported = 0
+
+    def add_dropped(self, rows):
+        """Record dropped rows, keeping at most max_reported of them"""
+        self.dropped_count += len(rows)
+        room = self.max_reported - self._reported
+        if room > 0 and len(rows):
+            self.dropped.append(rows.head(room))
+            self._reported += min(room, len(rows))
+
+    def dropped_frame(self):
+        """Return the reported dropped rows as one DataFrame"""
+        if not self.dropped:
+            return pd.DataFrame()
+        return pd.concat(self.dropped)
+
+    @property
+    def kept(self):
+        return self.rows_read - self.dropped_count
+
+    def summary(self):
+        return f"Read {self.rows_read} rows: kept {self.kept}, dropped {self.dropped_count} duplicates"
+
+
+def _start_minutes(times):
+    """Minutes after midnight of each start time, -1 where it is missing or unreadable"""
+    if pd.api.types.is_numeric_dtype(times):
+        return times.fillna(-1).to_numpy(dtype=np.int64)
+    codes, uniques = pd.factorize(times, use_na_sentinel=True)
+    parsed = []
+    for value in uniques:
+        try:
+            parsed.append(time_to_minutes(value))
+        except (ValueError, TypeError):
+            parsed.append(-1)
+    parsed = np.array(parsed + [-1], dtype=np.int64)
+    # The missing-value code -1 picks the trailing -1
+    return parsed[codes]
+
+
+def dedup_keys(chunk):
+    """Return a 64-bit hash of (Name, appointment day) per row and a mask of rows that have both"""
+    days = pd.to_datetime(chunk['Appointment_date'], errors='coerce')
+    names = chunk['Name']
+    valid = (days.notna() & names.notna()).to_numpy()
+    day_numbers = days.to_numpy().astype('datetime64[D]').astype(np.int64)
+    keys = pd.util.hash_pandas_object(
+        pd.DataFrame({'Name': names.astype(str).to_numpy(), 'day': day_numbers}), index=False
+    ).to_numpy()
+    return keys, valid
+
+
+def _ranks(chunk, positions, keep):
+    """Rank rows so the row to keep has the highest (or, for earliest/first, lowest) rank"""
+    positions = np.asarray(positions, dtype=np.int64)
+    if keep in ('first', 'last'):
+        return positions
+    minutes = _start_minutes(chunk['Start_time'])
+    return ((minutes + 1) << _POSITION_BITS) | positions
+
+
+def _prefers_max(keep):
+    return keep in ('latest', 'last')
+
+
+def build_winners(chunks, keep='latest'):
+    """First pass: map each (Name, day) key hash to the rank of the row to keep
+
+    chunks yields (chunk, positions) pairs. The table holds one int per
+    distinct customer-day, so memory grows with the number of distinct
+    customer-days rather than with the rows or their width.
+    """
+    if keep not in KEEP_POLICIES:
+        raise ValueError(f"Unknown keep policy: {keep}")
+    take_max = _prefers_max(keep)
+    table = {}
+    rows_read = 0
+    for chunk, positions in chunks:
+        rows_read += len(chunk)
+        keys, valid = dedup_keys(chunk)
+        ranks = pd.Series(_ranks(chunk, positions, keep)[valid])
+        grouped = ranks.groupby(keys[valid], sort=False)
+        best = grouped.max() if take_max else grouped.min()
+        for key, rank in zip(best.index.tolist(), best.tolist()):
+            current = table.get(key)
+            if current is None or (rank > current if take_max else rank < current):
+                table[key] = rank
+    return table, rows_read
+
+
+def _split_chunk(chunk, positions, table, keep, winning_positions):
+    """Second pass: return the kept rows and the dropped rows of a chunk
+
+    Dropped rows carry Kept_position, the position of the row kept in their place.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    if len(winning_positions):
+        idx = np.searchsorted(winning_positions, positions)
+        idx[idx == len(winning_positions)] = 0
+        keep_mask = winning_positions[idx] == positions
+    else:
+        keep_mask = np.zeros(len(chunk), dtype=bool)
+
+    # Only rows that lost need their keys; those without a name or date are never duplicates
+    losers = np.flatnonzero(~keep_mask)
+    keys, valid = dedup_keys(chunk.iloc[losers])
+    keep_mask[losers[~valid]] = True
+    dropped = chunk.iloc[losers[valid]].copy()
+    dropped.insert(0, 'Kept_position', [table[key] & _POSITION_MASK for key in keys[valid].tolist()])
+    dropped.insert(0, 'Position', positions[losers[valid]])
+    return chunk[keep_mask], dropped
+
+
+def _winning_positions(table):
+    return np.sort(np.fromiter((rank & _POSITION_MASK for rank in table.values()),
+                               dtype=np.int64, count=len(table)))
+
+
+def _label_positions(dropped, label):
+    return dropped.rename(columns={'Position': label, 'Kept_position': f'Kept_{label.lower()}'})
+
+
+def dedup_frame(df, keep='latest'):
+    """Deduplicate an in-memory DataFrame; returns (kept, dropped)
+
+    Positions are row numbers, so 'first' and 'last' follow the frame's row order.
+    """
+    positions = np.arange(len(df))
+    table, _ = build_winners([(df, positions)], keep)
+    kept, dropped = _split_chunk(df, positions, table, keep, _winning_positions(table))
+    return kept, _label_positions(dropped, 'Row')
+
+
+def _read_chunks(source, chunksize):
+    """Yield (chunk, file line numbers) pairs of an appointments CSV read as text"""
+    # Text in, text out: values are written back exactly as they were read
+    reader = pd.read_csv(source, dtype=str, chunksize=chunksize, keep_default_na=False, na_values=[''])
+    line = 2  # Line 1 is the header
+    for chunk in reader:
+        yield chunk, np.arange(line, line + len(chunk))
+        line += len(chunk)
+
+
+def dedup_csv(source, output=None, keep='latest', chunksize=DEFAULT_CHUNKSIZE,
+              dropped_output=None, dry_run=False):
+    """Remove duplicate customer-days from an appointments CSV in bounded memory
+
+    The file is streamed twice: the first pass finds the row to keep for
+    every (Name, day), the second writes the kept rows to a temporary file
+    that then atomically replaces output (the source when output is None).
+    Every dropped row is written to dropped_output, if given, with its line
+    number and the line of the row kept instead. Nothing is written when
+    dry_run is set.
+    """
+    table, _ = build_winners(_read_chunks(source, chunksize), keep)
+    winning_positions = _winning_positions(table)
+    output = output or source
+    report = DedupReport()
+
+    with ExitStack() as files:
+        out_file = dropped_file = None
+        if not dry_run:
+            out_file = files.enter_context(atomic_write(output))
+            if dropped_output:
+                dropped_file = files.enter_context(open(dropped_output, 'w', newline=''))
+        first = True
+        for chunk, positions in _read_chunks(source, chunksize):
+            kept, dropped = _split_chunk(chunk, positions, table, keep, winning_positions)
+            dropped = _label_positions(dropped, 'Line')
+            report.rows_read += len(chunk)
+            report.add_dropped(dropped)
+            if out_file:
+                kept.to_csv(out_file, index=False, header=first)
+            if dropped_file:
+                dropped.to_csv(dropped_file, index=False, header=first)
+            first = False
+    return report
+
+
+def dedup_store(store, keep='latest', chunksize=DEFAULT_CHUNKSIZE, dropped_output=None, dry_run=False):
+    """Remove duplicate customer-days from an appointment store
+
+    Positions are appointment ids, so 'first' and 'last' mean the oldest and
+    newest booking. The store is scanned twice in chunks and the duplicates
+    are deleted in one batch at the end. Every dropped row is written to
+    dropped_output, if given, with the id of the appointment kept instead.
+    """
+    def chunks():
+        for chunk in store.iter_chunks(chunksize):
+            yield chunk, chunk.index.to_numpy()
+
+    table, _ = build_winners(chunks(), keep)
+    winning_positions = _winning_positions(table)
+    report = DedupReport()
+    dropped_ids = []
+    dropped_file = open(dropped_output, 'w', newline='') if dropped_output else None
+    try:
+        first = True
+        for chunk, positions in chunks():
+            _, dropped = _split_chunk(chunk[COLUMNS], positions, table, keep, winning_positions)
+            dropped = _label_positions(dropped, ID_COLUMN).reset_index(drop=True)
+            report.rows_read += len(chunk)
+            report.add_dropped(dropped)
+            if dropped_file:
+                to_export(dropped).to_csv(dropped_file, index=False, header=first, date_format='%Y-%m-%d')
+            dropped_ids.extend(dropped[ID_COLUMN].tolist())
+            first = False
+    finally:
+        if dropped_file:
+            dropped_file.close()
+    if dropped_ids and not dry_run:
+        store.delete_many(dropped_ids)
+    return report
@@ -0,0 +1,37 @@
+from utils.formatting import format_date_column, format_time_column, format_last_visit_column
+from utils.storage import ID_COLUMN
+
+
+def build_staff_options(df, default_staff=None):
+    """Build the sorted staff list, optionally including the default staff"""
+    staff = df['Staff_name'].unique().tolist() if not df.empty else []
+    if default_staff:
+        staff = list(set(staff + default_staff))
+    return sorted(staff)
+
+
+def build_display_view(df, current_date):
+    """Build the formatted, sorted frame shown in the appointments grid"""
+    # Format the date and time columns for display
+    display_df = df.copy()
+    # Keep both raw and formatted dates
+    display_df['raw_date'] = display_df['Appointment_date']
+
+    # First sort by date
+    display_df = display_df.sort_values(by='Appointment_date', ascending=True)
+
+    display_df['Date'] = format_date_column(display_df['Appointment_date'], current_date)
+    display_df['Time'] = format_time_column(display_df['Start_time'], display_df['End_time'])
+    display_df['Last Visit'] = format_last_visit_column(display_df['Days_since_last_visit'])
+
+    # Reorder and rename columns for display
+    columns_to_show = ['Date', 'Name', 'Address', 'Time', 'Staff_name', 'Last Visit']
+    display_columns = {
+        'Staff_name': 'Staff',
+        'Last Visit': 'Last Visit'
+    }
+
+    display_view = display_df[columns_to_show].rename(columns=display_columns)
+    # Carry the stable appointment id so grid selections address a single row
+    display_view[ID_COLUMN] = display_view.index
+    return display_view.sort_values(by='Date', ascending=True)
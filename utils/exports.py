@@ -0,0 +1,194 @@
+import importlib.util
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from utils.recurrence import SERIES_HORIZON_DAYS
+from utils.schema import minutes_to_text, to_export
+from utils.storage import COLUMNS
+
+FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+DEFAULT_CHUNKSIZE = 50_000
+
+
+def parquet_available():
+    """Whether Parquet exports can be written (they need the optional pyarrow package)"""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def available_formats():
+    """The export formats this installation can write"""
+    return [fmt for fmt in FORMATS if fmt != 'parquet' or parquet_available()]
+
+
+class Export:
+    """One exported file: where it is, what to call the download and how many rows it holds"""
+
+    def __init__(self, path, filename, mime, rows):
+        self.path = path
+        self.filename = filename
+        self.mime = mime
+        self.rows = rows
+
+    def open(self):
+        """Open the file for reading as bytes
+
+        st.download_button reads the handle into Streamlit's in-memory
+        media store, so the whole file is in memory while it is offered.
+        """
+        return open(self.path, 'rb')
+
+
+def export_filename(fmt='csv', staff=None, start=None, end=None):
+    """Download name such as appointments-Lotta-from-2025-02-01-to-2025-02-28.csv"""
+    parts = ['appointments']
+    if staff:
+        parts.append(str(staff).replace(' ', '_'))
+    if start is not None:
+        parts.append(f"from-{pd.Timestamp(start):%Y-%m-%d}")
+    if end is not None:
+        parts.append(f"to-{pd.Timestamp(end):%Y-%m-%d}")
+    return '-'.join(parts) + '.' + FORMATS[fmt][0]
+
+
+def export_chunks(store, staff=None, start=None, end=None, chunksize=DEFAULT_CHUNKSIZE, bookings=None):
+    """Yield the appointments to export as DataFrames of at most chunksize rows
+
+    A full export streams store.iter_chunks(); a staff or date filter uses
+    store.query(), which only reads the matching rows. The visits of the
+    repeat bookings in the same range follow; without an end date,
+    open-ended series are exported up to SERIES_HORIZON_DAYS ahead.
+    """
+    if staff is None and start is None and end is None:
+        yield from store.iter_chunks(chunksize)
+    else:
+        df = store.query(staff=staff, start=start, end=end)
+        for offset in range(0, len(df), chunksize):
+            yield df.iloc[offset:offset + chunksize]
+    if bookings is None or not len(bookings):
+        return
+    if end is None:
+        end = pd.Timestamp.now().normalize() + pd.Timedelta(days=SERIES_HORIZON_DAYS)
+    visits = bookings.frame(start, end)
+    if staff is not None:
+        visits = visits[(visits['Staff_name'] == staff).to_numpy()]
+    for offset in range(0, len(visits), chunksize):
+        yield visits.iloc[offset:offset + chunksize]
+
+
+def write_csv(chunks, path):
+    """Write chunks to a CSV file one at a time; returns the number of rows written"""
+    rows = 0
+    with open(path, 'w', newline='') as f:
+        for chunk in chunks:
+            to_export(chunk[COLUMNS]).to_csv(f, header=rows == 0, index=False, date_format='%Y-%m-%d')
+            rows += len(chunk)
+        if rows == 0:
+            pd.DataFrame(columns=COLUMNS).to_csv(f, index=False)
+    return rows
+
+
+def _parquet_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('Name', pa.string()),
+        ('Address', pa.string()),
+        ('Appointment_date', pa.date32()),
+        ('Start_time', pa.string()),
+        ('End_time', pa.string()),
+        ('Staff_name', pa.string()),
+        # Null for a first visit
+        ('Days_since_last_visit', pa.int32()),
+    ])
+
+
+def write_parquet(chunks, path):
+    """Write chunks to a Parquet file, one row group per chunk; returns the number of rows written"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema()
+    rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            frame = chunk[COLUMNS].copy()
+            for col in ('Name', 'Address', 'Staff_name'):
+                frame[col] = frame[col].astype(object)
+            for col in ('Start_time', 'End_time'):
+                frame[col] = minutes_to_text(frame[col])
+            frame['Appointment_date'] = frame['Appointment_date'].dt.date
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+            rows += len(chunk)
+        if rows == 0:
+            writer.write_table(schema.empty_table())
+    return rows
+
+
+WRITERS = {'csv': write_csv, 'parquet': write_parquet}
+
+
+class ExportCache:
+    """Exports built on request and kept, on disk, for as long as the data version is current
+
+    Asking again for the same export of the same version returns the file
+    already written. Files of older versions are deleted when a newer
+    version of the same export is built, and the least recently used
+    exports beyond maxsize are dropped.
+    """
+
+    def __init__(self, directory=None, maxsize=8):
+        self.directory = directory or tempfile.mkdtemp(prefix='lotta-exports-')
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._counter = 0
+
+    def _drop(self, entry_key):
+        export = self._entries.pop(entry_key)
+        if os.path.exists(export.path):
+            os.remove(export.path)
+
+    def get(self, store, version, fmt='csv', staff=None, start=None, end=None, bookings=None):
+        """Return the Export of the store's appointments at version, writing it if needed
+
+        With bookings, the visits of the repeat bookings are exported too and
+        version must change with them as well.
+        """
+        if fmt not in WRITERS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        start = None if start is None else pd.Timestamp(start).normalize()
+        end = None if end is None else pd.Timestamp(end).normalize()
+        key = (fmt, staff, start, end)
+        # Built under the lock, so two sessions asking at once write the file only once
+        with self._lock:
+            entry_key = (key, version)
+            if entry_key in self._entries:
+                self._entries.move_to_end(entry_key)
+                return self._entries[entry_key]
+
+            self._counter += 1
+            path = os.path.join(self.directory, f"export-{self._counter}.{FORMATS[fmt][0]}")
+            try:
+                rows = WRITERS[fmt](export_chunks(store, staff, start, end, bookings=bookings), path)
+            except BaseException:
+                if os.path.exists(path):
+                    os.remove(path)
+                raise
+            export = Export(path, export_filename(fmt, staff, start, end), FORMATS[fmt][1], rows)
+
+            for stale in [k for k in self._entries if k[0] == key]:
+                self._drop(stale)
+            self._entries[entry_key] = export
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+            return export
+
+    def __len__(self):
+        return len(self._entries)
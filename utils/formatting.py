@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from utils.schema import FIRST_VISIT, minutes_to_text
+
+
+def _strftime_unique(dates, fmt):
+    """strftime each distinct date once and broadcast back to every row
+
+    Appointment tables have far fewer distinct days than rows, so this keeps
+    the per-element formatting cost proportional to the number of days.
+    """
+    codes, uniques = pd.factorize(dates)
+    formatted = pd.DatetimeIndex(uniques).strftime(fmt).to_numpy(dtype=object)
+    # factorize marks missing values with -1; append a slot for them
+    formatted = np.append(formatted, None)
+    return pd.Series(formatted[codes], index=dates.index, dtype=object)
+
+
+def format_date_column(dates, today):
+    """Vectorized format_date_with_indicator: 'YYYY-MM-DD Day', today prefixed, NaT as ''"""
+    dates = pd.to_datetime(dates)
+    text = _strftime_unique(dates, '%Y-%m-%d %A')
+    is_today = (dates.dt.normalize() == pd.Timestamp(today).normalize()).to_numpy()
+    text[is_today] = ' ' + text[is_today]
+    return text.where(dates.notna(), '')
+
+
+def format_time_column(start_times, end_times):
+    """Vectorized 'Start - End' time range from 'HH:MM' strings or minutes after midnight"""
+    return minutes_to_text(start_times).astype(str) + ' - ' + minutes_to_text(end_times).astype(str)
+
+
+def format_last_visit_column(days_since):
+    """Vectorized format_last_visit: 'N days ago', 'First visit' where missing, other non-numbers passed through"""
+    numeric = pd.to_numeric(days_since.astype(object), errors='coerce')
+    numeric = numeric.where(np.isfinite(numeric))
+    result = days_since.astype(object).copy()
+    has_days = numeric.notna()
+    result[has_days] = np.trunc(numeric[has_days]).astype('int64').astype(str) + ' days ago'
+    return result.where(days_since.notna(), FIRST_VISIT)
+
+
+def format_appointment_date_column(dates):
+    """Vectorized date_helpers.format_appointment_date: 'Thursday dd-mm'"""
+    missing = dates.isna()
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        parsed = dates
+    else:
+        parsed = pd.to_datetime(dates, errors='coerce', format='mixed')
+    result = _strftime_unique(parsed, '%A %d-%m')
+    result[parsed.isna() & ~missing] = 'Invalid date'
+    result[missing] = 'No date'
+    return result
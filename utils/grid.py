@@ -0,0 +1,74 @@
+from functools import lru_cache
+import copy
+import pandas as pd
+
+from utils.storage import ID_COLUMN
+
+# Column widths of the appointments grid, in display order
+COLUMN_WIDTHS = {
+    'Date': 150,
+    'Name': 150,
+    'Address': 250,
+    'Time': 120,
+    'Staff': 100,
+    'Last Visit': 100,
+}
+GRID_CSS = {
+    ".ag-row-selected": {"background-color": "#a5d6a7 !important"},
+    ".ag-row-hover": {"background-color": "#c8e6c9 !important"},
+}
+
+
+@lru_cache(maxsize=256)
+def _grid_options(column_types, selected_row):
+    # st_aggrid is only imported once a grid is actually drawn
+    from st_aggrid import GridOptionsBuilder
+
+    template = pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in column_types})
+    gb = GridOptionsBuilder.from_dataframe(template)
+    gb.configure_selection(selection_mode='single', use_checkbox=False)
+    if selected_row is not None:
+        gb.configure_selection('single', pre_selected_rows=[selected_row])
+
+    for col, width in COLUMN_WIDTHS.items():
+        gb.configure_column(col, width=width)
+    gb.configure_column(ID_COLUMN, hide=True)
+
+    gb.configure_grid_options(
+        rowStyle={'background-color': '#ffffff'},
+        rowHoverStyle={'background-color': '#c8e6c9'},
+        rowClass='grid-row'
+    )
+    return gb.build()
+
+
+def grid_options(view, selected_id=None):
+    """Return the grid options for a display view, pre-selecting selected_id if it is shown
+
+    Options depend only on the view's columns and the selection, so they are
+    built once per process for each combination and copied per use. AgGrid
+    identifies rows by their position in the frame it is given, as a string,
+    so the selection is passed as the row's position in view, not its id.
+    """
+    column_types = tuple((col, str(dtype)) for col, dtype in view.dtypes.items())
+    selected_row = None
+    if selected_id is not None and selected_id in view.index:
+        selected_row = str(view.index.get_loc(selected_id))
+    return copy.deepcopy(_grid_options(column_types, selected_row))
+
+
+def render_grid(view, options, key="appointments_grid"):
+    """Draw the appointments grid and return its response"""
+    from st_aggrid import AgGrid, GridUpdateMode
+
+    return AgGrid(
+        view,
+        gridOptions=options,
+        update_mode=GridUpdateMode.SELECTION_CHANGED,
+        fit_columns_on_grid_load=True,
+        height=400,
+        allow_unsafe_jscode=True,
+        theme='light',
+        key=key,
+        custom_css=GRID_CSS
+    )
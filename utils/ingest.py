@@ -0,0 +1,159 @@
+import pandas as pd
+
+from utils.schema import FIRST_VISIT
+from utils.storage import COLUMNS
+
+# Everything is read as text so validation sees exactly what the file contains
+IMPORT_DTYPES = {col: str for col in COLUMNS}
+DEFAULT_CHUNKSIZE = 10_000
+IMPORT_MODES = ('append', 'upsert', 'replace')
+
+_DATE_PATTERN = r'^\d{4}-\d{2}-\d{2}$'
+_TIME_PATTERN = r'^([01]\d|2[0-3]):[0-5]\d$'
+
+
+class ImportReport:
+    """Outcome of a streaming import"""
+
+    def __init__(self, max_reported_errors=1000):
+        self.max_reported_errors = max_reported_errors
+        self.rows_read = 0
+        self.inserted = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+        # Set when a replace was refused and the store left as it was
+        self.refused = None
+
+    def add_errors(self, errors):
+        """Record (line, message) pairs, keeping at most max_reported_errors of them"""
+        self.error_count += len(errors)
+        room = self.max_reported_errors - len(self.errors)
+        if room > 0:
+            self.errors.extend(errors[:room])
+
+    @property
+    def imported(self):
+        return self.inserted + self.updated
+
+    def summary(self):
+        if self.refused:
+            return f"Read {self.rows_read} rows: nothing imported, {self.refused}"
+        text = f"Read {self.rows_read} rows: {self.inserted} added, {self.updated} updated"
+        if self.error_count:
+            text += f", {self.error_count} rejected"
+        return text
+
+
+def validate_chunk(chunk, first_line):
+    """Split a chunk of raw text rows into valid typed rows and (line, message) errors
+
+    first_line is the file line number of the chunk's first row. Line numbers
+    count one record per line, which holds for files without quoted newlines.
+    """
+    lines = pd.RangeIndex(first_line, first_line + len(chunk))
+    chunk = chunk.set_axis(lines)
+    problems = pd.Series('', index=lines)
+
+    def flag(mask, message):
+        problems[mask] = problems[mask] + message + '; '
+
+    for col in ('Name', 'Appointment_date', 'Start_time', 'End_time', 'Staff_name'):
+        flag(chunk[col].isna() | (chunk[col].str.strip() == ''), f"missing {col}")
+
+    dates = chunk['Appointment_date'].str.strip()
+    parsed_dates = pd.to_datetime(dates, format='%Y-%m-%d', errors='coerce')
+    flag(dates.notna() & (~dates.str.match(_DATE_PATTERN, na=False) | parsed_dates.isna()),
+         "Appointment_date is not a valid YYYY-MM-DD date")
+
+    for col in ('Start_time', 'End_time'):
+        times = chunk[col].str.strip()
+        flag(times.notna() & ~times.str.match(_TIME_PATTERN, na=False), f"{col} is not HH:MM")
+    start, end = chunk['Start_time'].str.strip(), chunk['End_time'].str.strip()
+    # Zero-padded HH:MM strings compare in time order
+    flag(start.str.match(_TIME_PATTERN, na=False) & end.str.match(_TIME_PATTERN, na=False) & (end <= start),
+         "End_time is not after Start_time")
+
+    days = chunk['Days_since_last_visit'].str.strip()
+    flag(days.notna() & (days != FIRST_VISIT) & ~days.str.match(r'^\d+(\.0+)?$', na=False),
+         "Days_since_last_visit must be a number of days or 'First visit'")
+
+    bad = problems != ''
+    errors = [(line, message.rstrip('; ')) for line, message in problems[bad].items()]
+
+    valid = chunk[~bad].copy()
+    for col in ('Name', 'Address', 'Start_time', 'End_time', 'Staff_name'):
+        valid[col] = valid[col].str.strip()
+    valid['Appointment_date'] = parsed_dates[~bad]
+    return valid, errors
+
+
+def _read_chunks(source, chunksize):
+    """Yield (chunk, first line) of the raw text rows of a CSV, checking the header first"""
+    reader = pd.read_csv(source, dtype=IMPORT_DTYPES, chunksize=chunksize,
+                         keep_default_na=False, na_values=[''])
+    line = 2  # Line 1 is the header
+    for chunk in reader:
+        missing = [col for col in COLUMNS if col not in chunk.columns]
+        if missing:
+            raise ValueError(f"Missing columns in appointments data: {', '.join(missing)}")
+        yield chunk[COLUMNS], line
+        line += len(chunk)
+
+
+def import_csv_stream(source, store, mode='append', chunksize=DEFAULT_CHUNKSIZE, on_progress=None):
+    """Import an appointments CSV into a store chunk by chunk
+
+    Rows are read as text in chunks of chunksize, validated, and merged into
+    the store before the next chunk is read, so memory stays bounded by the
+    chunk size. Invalid rows are skipped and reported with their line
+    numbers. mode is 'append' (insert every row), 'upsert' (update rows
+    matching on Name, Appointment_date and Start_time, insert the rest) or
+    'replace' (clear the store first).
+
+    A replace reads the whole file twice: the first pass only validates, and
+    the store is cleared only if every row is valid. Otherwise, or if the
+    file cannot be parsed, the store is left untouched; a refused replace
+    returns a report with refused set and the rejected rows listed.
+    """
+    if mode not in IMPORT_MODES:
+        raise ValueError(f"Unknown import mode: {mode}")
+
+    report = ImportReport()
+    if mode == 'replace':
+        if isinstance(source, str):
+            start = None
+        elif hasattr(source, 'seek'):
+            start = source.tell()
+        else:
+            raise ValueError("Replacing the appointments needs a file that can be read twice")
+        for chunk, line in _read_chunks(source, chunksize):
+            _, errors = validate_chunk(chunk, line)
+            report.rows_read += len(chunk)
+            report.add_errors(errors)
+        if report.error_count:
+            report.refused = "the appointments were not replaced because some rows are invalid"
+            return report
+        if report.rows_read == 0:
+            report.refused = "the file has no appointments to replace the stored ones with"
+            return report
+        if start is not None:
+            source.seek(start)
+        report.rows_read = 0
+        store.clear()
+
+    for chunk, line in _read_chunks(source, chunksize):
+        valid, errors = validate_chunk(chunk, line)
+        report.rows_read += len(chunk)
+        report.add_errors(errors)
+
+        if len(valid):
+            if mode == 'upsert':
+                inserted, updated = store.upsert_many(valid)
+                report.inserted += inserted
+                report.updated += updated
+            else:
+                report.inserted += store.insert_many(valid)
+        if on_progress:
+            on_progress(report)
+    return report
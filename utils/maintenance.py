@@ -0,0 +1,231 @@
+import re
+import time
+import pandas as pd
+
+from utils.dedup import dedup_frame, DEFAULT_CHUNKSIZE
+from utils.schema import days_to_text, to_export
+from utils.staff_assignment import assign_staff, keep_current_staff
+from utils.storage import COLUMNS, ID_COLUMN, atomic_write, empty_frame
+from utils.visit_index import compute_days_since_last_visit
+
+# A postcode after the street, e.g. "Kungsgatan 3, 451 30, Uddevalla"
+POSTCODE_PATTERN = re.compile(r',\s*\d{3}\s*\d{2}\s*')
+DEFAULT_STAFF = ['Lotta', 'Meera', 'Alice', 'Steve']
+
+
+def remove_postcodes(df, **options):
+    """Strip postcodes from addresses"""
+    return df.assign(Address=df['Address'].str.replace(POSTCODE_PATTERN, ', ', regex=True))
+
+
+def remove_duplicates(df, keep='latest', **options):
+    """Keep one appointment per customer per day"""
+    kept, _ = dedup_frame(df, keep=keep)
+    return kept
+
+
+def recompute_last_visits(df, **options):
+    """Recompute Days_since_last_visit from each customer's visit history"""
+    return df.assign(Days_since_last_visit=days_to_text(compute_days_since_last_visit(df)).astype(str))
+
+
+def reassign_staff(df, staff=None, **options):
+    """Reassign staff, balancing workload without double-booking
+
+    Appointments nobody is free for keep the staff member they had if that
+    person is free; the rest stay double-booked and are counted as
+    unresolved.
+    """
+    assigned, clashing = keep_current_staff(df, assign_staff(df, staff or DEFAULT_STAFF))
+    return df.assign(Staff_name=assigned), len(clashing)
+
+
+# name -> (function, columns it changes, whether it works row by row)
+STAGES = {
+    'postcodes': (remove_postcodes, ['Address'], True),
+    'dedup': (remove_duplicates, [], False),
+    'last_visits': (recompute_last_visits, ['Days_since_last_visit'], False),
+    'staff': (reassign_staff, ['Staff_name'], False),
+}
+DEFAULT_ORDER = ['postcodes', 'dedup', 'last_visits', 'staff']
+
+
+class StageResult:
+    """What one pipeline stage did"""
+
+    def __init__(self, name, seconds, rows_removed, cells_changed, unresolved=0):
+        self.name = name
+        self.seconds = seconds
+        self.rows_removed = rows_removed
+        self.cells_changed = cells_changed
+        self.unresolved = unresolved
+
+    def summary(self):
+        text = (f"{self.name}: {self.cells_changed} values changed, "
+                f"{self.rows_removed} rows removed in {self.seconds:.2f}s")
+        if self.unresolved:
+            text += f"; {self.unresolved} rows left unresolved"
+        return text
+
+
+def _changes(before, after, columns):
+    """Count rows removed and values changed in the given columns"""
+    rows_removed = len(before) - len(after)
+    cells_changed = 0
+    for col in columns:
+        old = before[col].loc[after.index]
+        cells_changed += int((old.ne(after[col]) & ~(old.isna() & after[col].isna())).sum())
+    return rows_removed, cells_changed
+
+
+def diff_frames(before, after):
+    """Return the changed values and removed rows between two frames indexed by file line
+
+    One row per change with the line, the column ('*' for a removed row) and
+    the old and new values.
+    """
+    parts = []
+    removed = before.index.difference(after.index)
+    if len(removed):
+        parts.append(pd.DataFrame({'Line': removed, 'Column': '*', 'Before': 'row', 'After': 'removed'}))
+    common = before.loc[after.index]
+    for col in after.columns:
+        old, new = common[col], after[col]
+        changed = old.ne(new) & ~(old.isna() & new.isna())
+        if changed.any():
+            parts.append(pd.DataFrame({'Line': after.index[changed], 'Column': col,
+                                       'Before': old[changed].to_numpy(), 'After': new[changed].to_numpy()}))
+    if not parts:
+        return pd.DataFrame(columns=['Line', 'Column', 'Before', 'After'])
+    return pd.concat(parts, ignore_index=True).sort_values(['Line', 'Column'], kind='stable', ignore_index=True)
+
+
+def _run_stage(name, df, totals, options):
+    """Run one stage, adding its time and changes to totals[name]"""
+    fn, columns, _ = STAGES[name]
+    started = time.perf_counter()
+    out = fn(df, **options)
+    # A stage that can't fix every row returns how many it left as they were
+    out, unresolved = out if isinstance(out, tuple) else (out, 0)
+    rows_removed, cells_changed = _changes(df, out, columns)
+    stage_totals = totals.setdefault(name, [0.0, 0, 0, 0])
+    stage_totals[0] += time.perf_counter() - started
+    stage_totals[1] += rows_removed
+    stage_totals[2] += cells_changed
+    stage_totals[3] += unresolved
+    return out
+
+
+def _run_stages(chunks, stages, keep_originals, options):
+    """Run the stages over text chunks; returns (stage results, original rows or None, result)
+
+    Leading row-by-row stages run on each chunk as it is read. The chunks
+    are then concatenated, so the whole table is in memory, and the stages
+    that need every row run on it in order. With keep_originals the
+    unchanged chunks are kept too, holding a second copy.
+    """
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown maintenance stage: {', '.join(unknown)}")
+    stages = list(stages)
+    streamed = []
+    while len(streamed) < len(stages) and STAGES[stages[len(streamed)]][2]:
+        streamed.append(stages[len(streamed)])
+    remaining = stages[len(streamed):]
+
+    totals = {}
+    originals, results = [], []
+    for chunk in chunks:
+        if keep_originals:
+            originals.append(chunk)
+        for name in streamed:
+            chunk = _run_stage(name, chunk, totals, options)
+        results.append(chunk)
+    df = pd.concat(results) if results else None
+    if df is not None:
+        for name in remaining:
+            df = _run_stage(name, df, totals, options)
+
+    stage_results = [StageResult(name, *totals.get(name, (0.0, 0, 0, 0))) for name in stages]
+    before = pd.concat(originals) if originals else None
+    return stage_results, before, df
+
+
+def run_pipeline(source, output=None, stages=DEFAULT_ORDER, chunksize=DEFAULT_CHUNKSIZE,
+                 dry_run=False, **options):
+    """Run maintenance stages over an appointments CSV with one read and one write
+
+    The file is read once, in chunks, as text so untouched values are
+    written back exactly as they were. Leading row-by-row stages (postcodes)
+    run on each chunk as it is read; only the read is chunked, though. The
+    chunks are concatenated into one table, which the stages that need every
+    row (dedup, last_visits, staff) then run on in the given order and which
+    is written out whole, so memory grows with the file, and doubles for a
+    dry run, which keeps the original rows for the diff. The result
+    atomically replaces output (the source when output is None) unless
+    dry_run is set.
+
+    options are passed to every stage, e.g. keep='earliest' or staff=[...].
+    Returns (stage results, diff) where diff is the diff_frames output of
+    the run, computed only for dry runs (None otherwise).
+    """
+    def chunks():
+        reader = pd.read_csv(source, dtype=str, chunksize=chunksize, keep_default_na=False, na_values=[''])
+        line = 2  # Line 1 is the header
+        for chunk in reader:
+            chunk.index = pd.RangeIndex(line, line + len(chunk), name='Line')
+            line += len(chunk)
+            yield chunk
+
+    stage_results, before, df = _run_stages(chunks(), stages, dry_run, options)
+    if df is None:
+        df = before = pd.read_csv(source, dtype=str)
+    if dry_run:
+        return stage_results, diff_frames(before, df)
+
+    with atomic_write(output or source) as f:
+        df.to_csv(f, index=False)
+    return stage_results, None
+
+
+def _text_chunk(chunk):
+    """An appointment store chunk in the text form the CSV pipeline sees"""
+    text = to_export(chunk[COLUMNS]).astype(object).where(chunk[COLUMNS].notna(), None)
+    text['Appointment_date'] = chunk['Appointment_date'].dt.strftime('%Y-%m-%d')
+    text['Days_since_last_visit'] = days_to_text(chunk['Days_since_last_visit']).astype(str)
+    return text
+
+
+def run_store_pipeline(store, stages=DEFAULT_ORDER, chunksize=DEFAULT_CHUNKSIZE, dry_run=False, **options):
+    """Run maintenance stages over an appointment store
+
+    The store is read once with iter_chunks() and each chunk converted to
+    the text form, so the stages behave exactly as on a CSV file. The chunks
+    are concatenated and the original rows kept for the diff, so two copies
+    of the whole table are in memory. Rows are
+    in id order, so the dedup stage's 'first' and 'last' mean the oldest
+    and newest booking. The result is written back with one delete_many()
+    of the removed appointments and one update_many() of the changed ones,
+    unless dry_run is set.
+
+    Returns (stage results, diff) like run_pipeline(), with the diff's Line
+    column holding appointment ids.
+    """
+    frames = [_text_chunk(chunk) for chunk in store.iter_chunks(chunksize)]
+    # Every stage then runs on the whole table, in id order
+    table = [pd.concat(frames).sort_index().rename_axis('Line')] if frames else []
+    stage_results, before, df = _run_stages(table, stages, True, options)
+    if df is None:
+        return stage_results, diff_frames(empty_frame(), empty_frame()) if dry_run else None
+    diff = diff_frames(before, df)
+    if dry_run:
+        return stage_results, diff
+
+    removed = diff.loc[diff['Column'] == '*', 'Line'].tolist()
+    changed = diff.loc[diff['Column'] != '*', 'Line'].unique()
+    columns = list(dict.fromkeys(col for name in stages for col in STAGES[name][1]))
+    if removed:
+        store.delete_many(removed)
+    if len(changed):
+        store.update_many(df.loc[changed, columns].rename_axis(ID_COLUMN))
+    return stage_results, None
@@ -0,0 +1,35 @@
+import math
+import pandas as pd
+
+PAGE_SIZES = [50, 100, 250, 500]
+
+
+def page_count(total_rows, page_size):
+    """Return the number of pages needed for total_rows (at least one)"""
+    return max(1, math.ceil(total_rows / page_size))
+
+
+def clamp_page(page, total_rows, page_size):
+    """Keep a zero-based page number inside the available pages"""
+    return min(max(0, page), page_count(total_rows, page_size) - 1)
+
+
+def page_window(view, page, page_size, pages_loaded=1):
+    """Return the rows of a page plus any further pages loaded with 'Load more'"""
+    start = page * page_size
+    return view.iloc[start:start + page_size * pages_loaded]
+
+
+def date_window(view, dates, start, end):
+    """Return the rows of view whose date (aligned on the index) lies in [start, end]"""
+    dates = dates.reindex(view.index)
+    mask = (dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end))
+    return view[mask.to_numpy()]
+
+
+def page_of_label(view, label, page_size):
+    """Return the page that contains the row with the given index label, or None"""
+    positions = view.index.get_indexer([label])
+    if positions[0] < 0:
+        return None
+    return int(positions[0]) // page_size
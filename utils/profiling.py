@@ -0,0 +1,164 @@
+from collections import deque
+from functools import wraps
+import csv
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+DEFAULT_PERCENTILES = (50, 90, 99)
+
+# The profiler of the rerun running on this thread; None when profiling is off
+_local = threading.local()
+_log_lock = threading.Lock()
+
+
+class RerunProfiler:
+    """Phase timings for the reruns of one app session
+
+    A rerun is split into phases with lap(): each call attributes the time
+    since the previous lap to the named phase. Functions decorated with
+    timed() add their call counts and durations to the rerun in progress.
+    The last `history` reruns are kept in memory and, when log_path is set,
+    every rerun is appended to a JSON lines log holding at most
+    max_log_entries reruns.
+    """
+
+    def __init__(self, history=20, log_path=None, max_log_entries=5000):
+        self.reruns = deque(maxlen=history)
+        self.log_path = log_path
+        self.max_log_entries = max_log_entries
+        self._current = None
+        self._started = self._last = 0.0
+
+    def start_rerun(self):
+        """Start timing a rerun and make this profiler active on the current thread"""
+        # st.rerun() stops the script early, so the previous rerun may not have finished
+        if self._current is not None:
+            self._finish(interrupted=True)
+        self._current = {'started': time.time(), 'phases': {}, 'calls': {}}
+        self._started = self._last = time.perf_counter()
+        _local.profiler = self
+
+    @property
+    def running(self):
+        return self._current is not None
+
+    def lap(self, phase):
+        """Attribute the time since the previous lap to phase"""
+        now = time.perf_counter()
+        phases = self._current['phases']
+        phases[phase] = phases.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def record(self, name, seconds):
+        """Add one timed function call to the rerun in progress"""
+        count, total = self._current['calls'].get(name, (0, 0.0))
+        self._current['calls'][name] = (count + 1, total + seconds)
+
+    def finish_rerun(self):
+        """Close the rerun in progress and return it"""
+        return self._finish(interrupted=False)
+
+    def _finish(self, interrupted):
+        rerun = self._current
+        end = time.perf_counter() if not interrupted else self._last
+        rerun['total'] = end - self._started
+        rerun['interrupted'] = interrupted
+        self.reruns.append(rerun)
+        self._current = None
+        if getattr(_local, 'profiler', None) is self:
+            _local.profiler = None
+        if self.log_path:
+            append_log(self.log_path, rerun, self.max_log_entries)
+        return rerun
+
+
+def lap(phase):
+    """End the current phase of the active rerun; does nothing when profiling is off"""
+    profiler = getattr(_local, 'profiler', None)
+    if profiler is not None:
+        profiler.lap(phase)
+
+
+def timed(name):
+    """Decorator recording each call's duration in the active rerun
+
+    With no active profiler the wrapper only adds an attribute lookup.
+    """
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            profiler = getattr(_local, 'profiler', None)
+            if profiler is None:
+                return fn(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profiler.record(name, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def append_log(path, rerun, max_entries):
+    """Append a rerun to a JSON lines log, dropping the oldest entries past max_entries"""
+    with _log_lock:
+        with open(path, 'a') as f:
+            f.write(json.dumps(rerun) + '\n')
+        # Trim in batches so the file isn't rewritten on every rerun
+        if os.path.getsize(path) > 1_000_000:
+            entries = read_log(path)
+            if len(entries) > max_entries * 1.1:
+                tmp_path = path + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    for entry in entries[-max_entries:]:
+                        f.write(json.dumps(entry) + '\n')
+                os.replace(tmp_path, path)
+
+
+def read_log(path):
+    """Return the reruns saved in a JSON lines log"""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def timings_frame(reruns):
+    """Return one row per rerun with its total and per-phase times in milliseconds"""
+    rows = []
+    for rerun in reruns:
+        row = {'Started': pd.Timestamp(rerun['started'], unit='s'), 'Total': rerun['total'] * 1000}
+        row.update({phase: seconds * 1000 for phase, seconds in rerun['phases'].items()})
+        for name, (count, seconds) in rerun['calls'].items():
+            row[name] = seconds * 1000
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def phase_percentiles(reruns, percentiles=DEFAULT_PERCENTILES):
+    """Return count and percentiles in milliseconds for each phase, timed function and the total"""
+    timings = timings_frame(reruns)
+    if timings.empty:
+        return pd.DataFrame()
+    timings = timings.drop(columns='Started')
+    summary = pd.DataFrame({'count': timings.count()})
+    for p in percentiles:
+        summary[f'p{p}'] = timings.quantile(p / 100)
+    return summary.round(2)
+
+
+def write_csv(reruns, f):
+    """Write reruns to a file object as CSV rows of (started, kind, name, calls, ms)"""
+    writer = csv.writer(f)
+    writer.writerow(['started', 'kind', 'name', 'calls', 'ms'])
+    for rerun in reruns:
+        started = pd.Timestamp(rerun['started'], unit='s').isoformat()
+        writer.writerow([started, 'total', 'rerun', 1, round(rerun['total'] * 1000, 3)])
+        for phase, seconds in rerun['phases'].items():
+            writer.writerow([started, 'phase', phase, 1, round(seconds * 1000, 3)])
+        for name, (count, seconds) in rerun['calls'].items():
+            writer.writerow([started, 'function', name, count, round(seconds * 1000, 3)])
@@ -0,0 +1,374 @@
+import heapq
+import json
+import os
+import threading
+from itertools import islice
+
+import pandas as pd
+
+from utils.conflicts import time_to_minutes
+from utils.schema import DAYS_COLUMN, time_text, to_compact
+from utils.storage import COLUMNS, atomic_write
+
+# Repeat choices offered when booking: label -> (unit, interval), None for a single visit
+REPEATS = {
+    'Does not repeat': None,
+    'Weekly': ('weeks', 1),
+    'Every 2 weeks': ('weeks', 2),
+    'Every 4 weeks': ('weeks', 4),
+    'Monthly': ('months', 1),
+}
+SERIES_COLUMNS = ['Series', 'Occurrence']
+# Fields of an occurrence that an exception may change
+CHANGEABLE = ['Appointment_date', 'Start_time', 'End_time', 'Staff_name']
+# Open-ended series are expanded this many days past today when all their visits are wanted
+SERIES_HORIZON_DAYS = 365
+
+
+def recurring_path(store_path):
+    """Where the repeat bookings of the store at store_path are saved"""
+    return os.path.splitext(store_path.rstrip('/'))[0] + '-recurring.json'
+
+
+def _date(value):
+    return pd.Timestamp(value).normalize()
+
+
+def _nth_weekday(year, month, weekday, nth):
+    """The nth (0-based) given weekday of a month, or None if the month has no such day"""
+    first = pd.Timestamp(year=year, month=month, day=1)
+    day = first + pd.Timedelta(days=(weekday - first.weekday()) % 7 + 7 * nth)
+    return day if day.month == month else None
+
+
+class RecurrenceRule:
+    """One repeat booking: a customer visited every interval weeks or months
+
+    Weekly series fall on the weekday of start_date; monthly series on the
+    same weekday of the month (e.g. the second Tuesday), skipping months
+    without a fifth one. Occurrences are never stored; occurrences() expands
+    them on demand for a date window. exceptions maps the scheduled date of
+    an occurrence to None (skipped) or to the fields changed for that visit.
+    """
+
+    def __init__(self, name, address, staff, start_date, start_time, end_time,
+                 unit='weeks', interval=1, until=None, exceptions=None):
+        if unit not in ('weeks', 'months'):
+            raise ValueError(f"Unknown repeat unit: {unit}")
+        if interval < 1:
+            raise ValueError("The repeat interval must be at least 1")
+        self.name = name
+        self.address = address
+        self.staff = staff
+        self.start_date = _date(start_date)
+        self.start_time = time_to_minutes(start_time)
+        self.end_time = time_to_minutes(end_time)
+        self.unit = unit
+        self.interval = int(interval)
+        self.until = None if until is None else _date(until)
+        self.exceptions = {_date(day): changes for day, changes in (exceptions or {}).items()}
+
+    def _lookback(self):
+        """A span that always holds the scheduled date before any given date"""
+        days = 7 if self.unit == 'weeks' else 35
+        return pd.Timedelta(days=days * self.interval)
+
+    def scheduled_dates(self, since=None):
+        """Yield the scheduled dates from since (or the series start) on, ignoring exceptions"""
+        since = self.start_date if since is None else max(_date(since), self.start_date)
+        if self.unit == 'weeks':
+            step = 7 * self.interval
+            # Jump straight to the first occurrence on or after since
+            skipped = -(-(since - self.start_date).days // step)
+            day = self.start_date + pd.Timedelta(days=skipped * step)
+            step = pd.Timedelta(days=step)
+            while self.until is None or day <= self.until:
+                yield day
+                day += step
+        else:
+            weekday, nth = self.start_date.weekday(), (self.start_date.day - 1) // 7
+            months = (since.year - self.start_date.year) * 12 + since.month - self.start_date.month
+            month = months // self.interval * self.interval
+            while True:
+                year, index = divmod(self.start_date.month - 1 + month, 12)
+                day = _nth_weekday(self.start_date.year + year, index + 1, weekday, nth)
+                month += self.interval
+                if day is None or day < since:
+                    continue
+                if self.until is not None and day > self.until:
+                    return
+                yield day
+
+    def _occurrence(self, scheduled, changes=None):
+        record = {
+            'Name': self.name,
+            'Address': self.address,
+            'Appointment_date': scheduled,
+            'Start_time': self.start_time,
+            'End_time': self.end_time,
+            'Staff_name': self.staff,
+            # Filled in by occurrences(), which knows the visit before
+            DAYS_COLUMN: None,
+            'Occurrence': scheduled,
+        }
+        for col, value in (changes or {}).items():
+            record[col] = _date(value) if col == 'Appointment_date' else value
+        for col in ('Start_time', 'End_time'):
+            record[col] = time_to_minutes(record[col])
+        return record
+
+    def _regular(self, start, end):
+        """The unchanged occurrences scheduled in the window"""
+        for day in self.scheduled_dates(start):
+            if end is not None and day > end:
+                return
+            if day not in self.exceptions:
+                yield self._occurrence(day)
+
+    def _changed(self, start, end):
+        """The changed occurrences whose (possibly moved) date falls in the window, in date order"""
+        changed = []
+        for scheduled, changes in self.exceptions.items():
+            if changes is None:
+                continue
+            record = self._occurrence(scheduled, changes)
+            date = record['Appointment_date']
+            if (start is None or date >= start) and (end is None or date <= end):
+                changed.append(record)
+        return sorted(changed, key=_order)
+
+    def _visit_before(self, day):
+        """The date of the last visit that takes place before day, skipped ones left out and moved ones moved"""
+        moved = [_date(changes.get('Appointment_date', scheduled)) for scheduled, changes in self.exceptions.items()
+                 if changes is not None]
+        latest = max((date for date in moved if date < day), default=None)
+        # Widen the look back until it reaches a visit that was not skipped or changed, or the series start
+        span = self._lookback()
+        while True:
+            since = day - span
+            regular = None
+            for scheduled in self.scheduled_dates(since):
+                if scheduled >= day:
+                    break
+                if scheduled not in self.exceptions:
+                    regular = scheduled
+            if regular is not None or since <= self.start_date:
+                break
+            span *= 2
+        if regular is not None and (latest is None or regular > latest):
+            latest = regular
+        return latest
+
+    def occurrences(self, start=None, end=None):
+        """Yield the visits between start and end (inclusive) in date order
+
+        Each visit is a record with the appointment columns plus the
+        scheduled date it belongs to ('Occurrence'). Days since the last
+        visit count from the series' previous visit that takes place:
+        skipped visits don't count and moved ones count on their new date.
+        Without an end date and an open-ended series the generator never
+        stops, so take what you need.
+        """
+        start = None if start is None else _date(start)
+        end = None if end is None else _date(end)
+        previous = None if start is None else self._visit_before(start)
+        for record in heapq.merge(self._regular(start, end), self._changed(start, end), key=_order):
+            date = record['Appointment_date']
+            record[DAYS_COLUMN] = None if previous is None else (date - previous).days
+            previous = date
+            yield record
+
+    def is_scheduled(self, day):
+        """Whether the series has a scheduled visit on day"""
+        day = _date(day)
+        return next(self.scheduled_dates(day), None) == day
+
+    def visit(self, scheduled):
+        """The visit scheduled on a date with its exception applied, or None if it was skipped"""
+        scheduled = _date(scheduled)
+        if scheduled in self.exceptions and self.exceptions[scheduled] is None:
+            return None
+        return self._occurrence(scheduled, self.exceptions.get(scheduled))
+
+    def staff_members(self):
+        """Everyone with a visit in the series: its staff member and whoever a changed visit went to"""
+        members = {self.staff}
+        members.update(changes['Staff_name'] for changes in self.exceptions.values()
+                       if changes and 'Staff_name' in changes)
+        return members
+
+    def describe(self):
+        """A short description such as 'every 2 weeks from 2025-02-04 until 2025-12-30'"""
+        unit = self.unit[:-1] if self.interval == 1 else f"{self.interval} {self.unit}"
+        text = f"every {unit} from {self.start_date:%Y-%m-%d}"
+        return text if self.until is None else f"{text} until {self.until:%Y-%m-%d}"
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'address': self.address,
+            'staff': self.staff,
+            'start_date': self.start_date.strftime('%Y-%m-%d'),
+            'start_time': time_text(self.start_time),
+            'end_time': time_text(self.end_time),
+            'unit': self.unit,
+            'interval': self.interval,
+            'until': None if self.until is None else self.until.strftime('%Y-%m-%d'),
+            'exceptions': {day.strftime('%Y-%m-%d'): changes for day, changes in self.exceptions.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def _order(record):
+    return record['Appointment_date'], record['Start_time']
+
+
+def _tagged(rule_id, records):
+    for record in records:
+        yield rule_id, record
+
+
+class RecurringBookings:
+    """The repeat bookings of a store, saved as one JSON file of rules
+
+    A year of weekly visits is one rule rather than 52 rows. Changing or
+    skipping a single visit records an exception on its rule and leaves the
+    rest of the series alone. Every change is written to path right away.
+    version counts the changes, saved with the rules, for caches of
+    expanded visits to key on.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.version = 0
+        self._rules = {}
+        self._last_id = 0
+        self._lock = threading.RLock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            self._last_id = saved['last_id']
+            self.version = saved.get('version', 0)
+            self._rules = {int(rule_id): RecurrenceRule.from_dict(rule) for rule_id, rule in saved['rules'].items()}
+
+    def __len__(self):
+        return len(self._rules)
+
+    def __iter__(self):
+        return iter(sorted(self._rules.items()))
+
+    def get(self, rule_id):
+        return self._rules[rule_id]
+
+    def customers(self):
+        """The (name, address) of every series"""
+        return [(rule.name, rule.address) for rule in self._rules.values()]
+
+    def _save(self):
+        self.version += 1
+        if not self.path:
+            return
+        rules = {str(rule_id): rule.to_dict() for rule_id, rule in self._rules.items()}
+        with atomic_write(self.path) as f:
+            json.dump({'last_id': self._last_id, 'version': self.version, 'rules': rules}, f, indent=1)
+
+    def add(self, rule):
+        """Store a new series and return its id"""
+        with self._lock:
+            self._last_id += 1
+            self._rules[self._last_id] = rule
+            self._save()
+            return self._last_id
+
+    def remove(self, rule_id):
+        """Delete a series with all its visits"""
+        with self._lock:
+            del self._rules[rule_id]
+            self._save()
+
+    def skip(self, rule_id, scheduled):
+        """Cancel one visit of a series"""
+        with self._lock:
+            self._rules[rule_id].exceptions[_date(scheduled)] = None
+            self._save()
+
+    def change(self, rule_id, scheduled, changes):
+        """Change one visit of a series (date, times or staff); the other visits keep the rule"""
+        unknown = set(changes) - set(CHANGEABLE)
+        if unknown:
+            raise ValueError(f"Cannot change {', '.join(sorted(unknown))} of a single visit")
+        with self._lock:
+            rule = self._rules[rule_id]
+            scheduled = _date(scheduled)
+            if not rule.is_scheduled(scheduled):
+                raise ValueError(f"Series {rule_id} has no visit on {scheduled:%Y-%m-%d}")
+            current = rule.exceptions.get(scheduled) or {}
+            updated = dict(current)
+            for col, value in changes.items():
+                if col == 'Appointment_date':
+                    value = _date(value).strftime('%Y-%m-%d')
+                elif col in ('Start_time', 'End_time'):
+                    value = time_text(time_to_minutes(value))
+                updated[col] = value
+            rule.exceptions[scheduled] = updated
+            self._save()
+
+    def end(self, rule_id, last_date):
+        """Stop a series after last_date; visits after it and their exceptions are dropped
+
+        A series ended before its first visit is deleted.
+        """
+        with self._lock:
+            rule = self._rules[rule_id]
+            if _date(last_date) < rule.start_date:
+                self.remove(rule_id)
+                return
+            rule.until = _date(last_date)
+            rule.exceptions = {day: changes for day, changes in rule.exceptions.items() if day <= rule.until}
+            self._save()
+
+    def occurrences(self, start=None, end=None, staff=None):
+        """Yield (series id, visit) for every series' visits between start and end, in date order"""
+        streams = [_tagged(rule_id, rule.occurrences(start, end)) for rule_id, rule in self._rules.items()]
+        for rule_id, record in heapq.merge(*streams, key=lambda item: _order(item[1])):
+            if staff is None or record['Staff_name'] == staff:
+                yield rule_id, record
+
+    def frame(self, start, end, limit=None):
+        """The visits between start and end as an appointments DataFrame with Series and Occurrence columns"""
+        visits = islice(self.occurrences(start, end), limit)
+        rows = [dict(record, Series=rule_id) for rule_id, record in visits]
+        return to_compact(pd.DataFrame(rows, columns=COLUMNS + SERIES_COLUMNS))
+
+    def conflicts(self, staff, appointment_date, start_time, end_time, ignore=None):
+        """Return the (series id, scheduled date) of visits that overlap the given slot
+
+        ignore is a (series id, scheduled date) pair to leave out, e.g. the
+        visit being moved.
+        """
+        start, end = time_to_minutes(start_time), time_to_minutes(end_time)
+        day = _date(appointment_date)
+        clashes = []
+        for rule_id, record in self.occurrences(day, day, staff=staff):
+            key = (rule_id, record['Occurrence'])
+            if key != ignore and record['Start_time'] < end and record['End_time'] > start:
+                clashes.append(key)
+        return clashes
+
+
+def clashing_dates(rule, schedule, bookings, days=365):
+    """Dates of the series' visits in its first days that clash with an appointment or another series
+
+    schedule is the StaffSchedule of the stored appointments and bookings
+    the RecurringBookings the series is about to join. Open-ended series
+    are only checked this far ahead.
+    """
+    clashes = []
+    for record in rule.occurrences(rule.start_date, rule.start_date + pd.Timedelta(days=days)):
+        slot = (record['Staff_name'], record['Appointment_date'], record['Start_time'], record['End_time'])
+        if schedule.conflicts(*slot) or bookings.conflicts(*slot):
+            clashes.append(record['Appointment_date'])
+    return clashes
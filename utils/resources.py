@@ -0,0 +1,63 @@
+from functools import lru_cache
+
+from utils.calendar_feeds import StaffFeeds, serve
+from utils.exports import ExportCache
+from utils.recurrence import RecurringBookings, recurring_path
+from utils.snapshots import SnapshotStore
+from utils.storage import open_store
+from utils.utilization import utilization_path
+
+# Streamlit re-executes main.py on every rerun of every session, but imported
+# modules live for the whole server process, so these caches are per process.
+
+
+@lru_cache(maxsize=None)
+def read_static(path):
+    """Return the text of a static asset, reading it from disk once per process"""
+    with open(path) as f:
+        return f.read()
+
+
+@lru_cache(maxsize=None)
+def shared_store(path, seed_csv=None):
+    """Open the appointment store once per process and share it between sessions"""
+    return open_store(path, seed_csv=seed_csv)
+
+
+@lru_cache(maxsize=None)
+def shared_snapshots(path, seed_csv=None, window_days=None):
+    """Return the process-wide snapshots of the appointments in the store at path"""
+    return SnapshotStore(shared_store(path, seed_csv=seed_csv), window_days=window_days,
+                         utilization_path=utilization_path(path), bookings=shared_recurring(path))
+
+
+@lru_cache(maxsize=None)
+def shared_recurring(path):
+    """Return the process-wide repeat bookings of the store at path"""
+    return RecurringBookings(recurring_path(path))
+
+
+@lru_cache(maxsize=None)
+def shared_exports():
+    """Return the process-wide cache of exported files"""
+    return ExportCache()
+
+
+@lru_cache(maxsize=None)
+def shared_calendar_feeds(path, seed_csv=None):
+    """Return the process-wide iCalendar feeds of the staff booked in the store at path"""
+    return StaffFeeds(shared_store(path, seed_csv=seed_csv), recurring=shared_recurring(path))
+
+
+@lru_cache(maxsize=None)
+def calendar_server(path, port, seed_csv=None, host='127.0.0.1'):
+    """Start serving the store's calendar feeds on host:port, once per process
+
+    Returns (server, None), or (None, reason) when the port can't be bound,
+    e.g. because it is in use. The failure is cached like the server, so
+    reruns don't try to bind again.
+    """
+    try:
+        return serve(shared_calendar_feeds(path, seed_csv=seed_csv), host=host, port=port), None
+    except OSError as error:
+        return None, f"Can't serve calendar feeds on {host}:{port}: {error.strerror or error}"
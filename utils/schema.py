@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+
+from utils.conflicts import time_to_minutes
+
+# The compact in-memory types of the appointment table. Customers and staff
+# repeat on many rows, so they are categoricals; times are minutes after
+# midnight; Days_since_last_visit is a nullable integer where <NA> means a
+# first visit. CSV files and the database keep the text form ('HH:MM' and
+# 'First visit'): to_compact() converts on load, to_export() on the way out.
+FIRST_VISIT = 'First visit'
+CATEGORY_COLUMNS = ['Name', 'Address', 'Staff_name']
+TIME_COLUMNS = ['Start_time', 'End_time']
+DATE_COLUMN = 'Appointment_date'
+DAYS_COLUMN = 'Days_since_last_visit'
+TIME_DTYPE = 'Int16'
+DAYS_DTYPE = 'Int32'
+
+
+def minutes_from_text(times):
+    """Vectorized 'HH:MM' to nullable minutes after midnight; unreadable times become <NA>
+
+    Only the distinct values are parsed. Columns that are already numeric are
+    just cast.
+    """
+    if times.dtype == TIME_DTYPE:
+        return times
+    if pd.api.types.is_numeric_dtype(times):
+        return times.astype(TIME_DTYPE)
+    codes, uniques = pd.factorize(times)
+    parsed = []
+    for value in uniques:
+        try:
+            parsed.append(time_to_minutes(value))
+        except (ValueError, TypeError):
+            parsed.append(None)
+    # The missing-value code -1 picks the trailing None
+    parsed = pd.array(parsed + [None], dtype=TIME_DTYPE)
+    return pd.Series(parsed[codes], index=times.index, name=times.name)
+
+
+def minutes_to_text(minutes):
+    """Vectorized minutes after midnight to 'HH:MM'; missing times become None"""
+    if not pd.api.types.is_numeric_dtype(minutes):
+        return minutes
+    codes, uniques = pd.factorize(minutes)
+    text = np.array([f'{value // 60:02d}:{value % 60:02d}' for value in uniques.tolist()] + [None],
+                    dtype=object)
+    return pd.Series(text[codes], index=minutes.index, name=minutes.name)
+
+
+def time_text(value):
+    """Format one time value (minutes or 'HH:MM') as 'HH:MM', '' when missing"""
+    if isinstance(value, str):
+        return value
+    if value is None or pd.isna(value):
+        return ''
+    return f'{int(value) // 60:02d}:{int(value) % 60:02d}'
+
+
+def days_from_values(days):
+    """Days_since_last_visit as a nullable integer: 'First visit', blanks and non-numbers become <NA>"""
+    if days.dtype == DAYS_DTYPE:
+        return days
+    numeric = pd.to_numeric(days, errors='coerce')
+    if pd.api.types.is_float_dtype(numeric):
+        numeric = np.trunc(numeric.where(np.isfinite(numeric)))
+    return numeric.astype(DAYS_DTYPE)
+
+
+def days_to_text(days):
+    """Days_since_last_visit in the text form: whole days, or 'First visit'"""
+    days = days_from_values(days)
+    return days.astype(object).where(days.notna(), FIRST_VISIT)
+
+
+def _compact_column(col, values):
+    """Convert one column to its compact type, leaving it alone if it already has it"""
+    if col in CATEGORY_COLUMNS:
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            return values
+        return values.astype('category')
+    if col in TIME_COLUMNS:
+        return minutes_from_text(values)
+    if col == DAYS_COLUMN:
+        return days_from_values(values)
+    if col == DATE_COLUMN and not pd.api.types.is_datetime64_dtype(values):
+        return pd.to_datetime(values)
+    return values
+
+
+def to_compact(df):
+    """Return df with the compact column types; the caller's frame is not modified"""
+    df = df.copy(deep=False)
+    for col in df.columns:
+        values = _compact_column(col, df[col])
+        if values is not df[col]:
+            df[col] = values
+    return df
+
+
+def to_export(df):
+    """Return df with times and days in the text form used by CSV files"""
+    df = df.copy(deep=False)
+    for col in TIME_COLUMNS:
+        if col in df:
+            df[col] = minutes_to_text(df[col])
+    if DAYS_COLUMN in df:
+        df[DAYS_COLUMN] = days_to_text(df[DAYS_COLUMN])
+    return df
+
+
+def append_rows(df, rows):
+    """Return a new frame of df followed by rows, both in the compact types
+
+    New customer, address or staff values are added to the categories first,
+    so the columns stay categorical instead of falling back to object.
+    """
+    df, rows = to_compact(df), rows.copy(deep=False)
+    for col in rows.columns:
+        if col in CATEGORY_COLUMNS and col in df:
+            new = pd.Index(rows[col].dropna().unique()).difference(df[col].cat.categories)
+            if len(new):
+                df[col] = df[col].cat.add_categories(new)
+            rows[col] = pd.Categorical(rows[col], dtype=df[col].dtype)
+        else:
+            rows[col] = _compact_column(col, rows[col])
+    return pd.concat([df, rows])
+
+
+def concat_frames(frames):
+    """Concatenate frames in the compact types, merging their categories so the columns stay categorical"""
+    frames = [to_compact(frame) for frame in frames]
+    for col in CATEGORY_COLUMNS:
+        present = [frame for frame in frames if col in frame]
+        if not present:
+            continue
+        categories = present[0][col].cat.categories
+        for frame in present[1:]:
+            if not frame[col].cat.categories.equals(categories):
+                categories = categories.union(frame[col].cat.categories)
+        for frame in present:
+            if not frame[col].cat.categories.equals(categories):
+                frame[col] = frame[col].cat.set_categories(categories)
+    return pd.concat(frames)
+
+
+def set_values(df, labels, changes):
+    """Assign {column: value or values} to the rows labelled labels, in place
+
+    Values may be in the text form; they are converted to the column's
+    compact type, and new category values are added to the categories.
+    """
+    for col, value in changes.items():
+        scalar = not pd.api.types.is_list_like(value)
+        values = _compact_column(col, pd.Series([value] if scalar else list(value)))
+        if col in CATEGORY_COLUMNS:
+            new = values.cat.categories.difference(df[col].cat.categories)
+            if len(new):
+                df[col] = df[col].cat.add_categories(new)
+        values = values.to_numpy(dtype=object) if col in CATEGORY_COLUMNS else values.array
+        df.loc[labels, col] = values[0] if scalar else values
+
+
+def memory_usage(df):
+    """Deep memory use in bytes per column, with the total under 'total'"""
+    usage = df.memory_usage(deep=True, index=False)
+    return dict(usage.items(), total=int(usage.sum()))
@@ -0,0 +1,264 @@
+from contextlib import contextmanager
+import atexit
+import os
+import sys
+import threading
+import time
+import weakref
+import pandas as pd
+
+from utils.cache import VersionedCache
+from utils.conflicts import StaffSchedule
+from utils.customer_directory import CustomerDirectory
+from utils.schema import concat_frames
+from utils.storage import empty_frame
+from utils.utilization import StaffUtilization
+from utils.visit_index import VisitIndex
+
+# The utilization table is saved at most this often while the app is writing
+UTILIZATION_SAVE_SECONDS = 60
+
+
+def frame_bytes(value):
+    """Deep memory size of a DataFrame or Series, shallow size of anything else"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(value, pd.DataFrame) else usage)
+    return sys.getsizeof(value)
+
+
+class Snapshot:
+    """One immutable version of the appointments table
+
+    Snapshots are shared by every session, so their frame must never be
+    modified in place; changes go through SnapshotStore.write().
+    """
+
+    def __init__(self, version, df):
+        self.version = version
+        self.df = df
+        self._nbytes = None
+
+    @property
+    def nbytes(self):
+        if self._nbytes is None:
+            self._nbytes = frame_bytes(self.df)
+        return self._nbytes
+
+
+class _Draft:
+    """A pending change to the current snapshot
+
+    base is the current, shared frame and must only be read. The first
+    access to df makes the private copy that will be published; assigning
+    df (e.g. draft.df = draft.base.drop(...)) avoids that copy altogether.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self._df = None
+
+    @property
+    def df(self):
+        if self._df is None:
+            self._df = self.base.copy()
+        return self._df
+
+    @df.setter
+    def df(self, value):
+        self._df = value
+
+    @property
+    def changed(self):
+        return self._df is not None
+
+
+class SnapshotStore:
+    """Process-wide, versioned appointments shared by all sessions
+
+    Sessions check out the current snapshot on each rerun and keep only its
+    version in their own state. Writes are copy-on-write: under a lock,
+    write() hands out a draft whose frame is copied on first change, and
+    publishing it creates the next version, leaving older snapshots
+    untouched for the sessions still rendering them. The lookup indexes and the cache of
+    derived frames (keyed by version) are shared as well. The indexes always
+    describe the newest version and are updated inside write().
+
+    With window_days set, only appointments from that many days back on are
+    loaded at first; ensure_loaded() reads older ones from the store when they
+    are asked for. The visit index and customer directory always cover the
+    whole history, built from the store's lighter visits() columns.
+
+    The staff utilization table covers the whole history too. It is saved
+    to utilization_path with the store's version() at most every
+    save_interval seconds, from a background thread after a write, and
+    when the process exits. The next start reads it back if the store
+    version still matches, and rebuilds it from the store otherwise (e.g.
+    after a crash or a change made outside the app).
+    """
+
+    def __init__(self, store, session_timeout=1800, window_days=None, utilization_path=None,
+                 save_interval=UTILIZATION_SAVE_SECONDS, bookings=None):
+        self.store = store
+        self.bookings = bookings
+        self.session_timeout = session_timeout
+        self.window_days = window_days
+        self.utilization_path = utilization_path
+        self.save_interval = save_interval
+        self.loaded_from = None
+        self.derived = VersionedCache(maxsize=16)
+        self.generation = 0
+        self._lock = threading.RLock()
+        self._current = None
+        self._version = 0
+        self._live = weakref.WeakValueDictionary()
+        self._sessions = {}
+        self._utilization_changed = False
+        self._utilization_saved = time.monotonic()
+        self._save_lock = threading.Lock()
+        if utilization_path:
+            atexit.register(self.save_utilization)
+
+    def current(self):
+        """Return the newest snapshot, loading it from the store on first use"""
+        if self._current is None:
+            with self._lock:
+                if self._current is None:
+                    self._reload()
+        return self._current
+
+    def _publish(self, df):
+        self._version += 1
+        snapshot = Snapshot(self._version, df)
+        self._live[snapshot.version] = snapshot
+        self._current = snapshot
+        return snapshot
+
+    def _load_utilization(self, df, rebuild=False):
+        """Read the saved utilization table if it still matches the store, else rebuild and save it"""
+        version = self.store.version()
+        path = self.utilization_path
+        if path and os.path.exists(path) and not rebuild:
+            utilization, saved_version = StaffUtilization.load(path)
+            if saved_version == version:
+                return utilization
+        if self.loaded_from is None:
+            utilization = StaffUtilization.from_frame(df)
+        else:
+            utilization = StaffUtilization.from_chunks(self.store.iter_chunks())
+        if path:
+            utilization.save(path, version)
+        self._utilization_changed = False
+        return utilization
+
+    def save_utilization(self):
+        """Save the utilization table with the store version it matches, if it changed since the last save"""
+        if not self.utilization_path:
+            return
+        # Saves are serialized so an older table never overwrites a newer one
+        with self._save_lock:
+            with self._lock:
+                if not self._utilization_changed:
+                    return
+                # Writes update the store and the table under the same lock, so the two agree here
+                utilization = self.utilization.copy()
+                version = self.store.version()
+                self._utilization_changed = False
+            utilization.save(self.utilization_path, version)
+
+    def _reload(self, rebuild=False):
+        if self.window_days is None:
+            df = visits = self.store.load() if self.store.count() else empty_frame()
+        else:
+            self.loaded_from = pd.Timestamp.now().normalize() - pd.Timedelta(days=self.window_days)
+            df = self.store.query(start=self.loaded_from)
+            visits = self.store.visits()
+        snapshot = self._publish(df)
+        self.visit_index = VisitIndex.from_frame(visits)
+        self.staff_schedule = StaffSchedule.from_frame(df)
+        self.customer_directory = CustomerDirectory.from_frame(visits)
+        if self.bookings is not None:
+            # Customers booked only as a series have no stored appointment
+            self.customer_directory.add_many(self.bookings.customers())
+        self.utilization = self._load_utilization(df, rebuild)
+        # Customer ids are assigned per directory build
+        self.generation += 1
+        return snapshot
+
+    def reload(self):
+        """Publish a fresh snapshot of the store and rebuild the indexes, e.g. after a bulk import"""
+        with self._lock:
+            self.derived.invalidate()
+            return self._reload(rebuild=True)
+
+    def ensure_loaded(self, start=None):
+        """Make sure the current snapshot holds every appointment from start on (all of them for None)
+
+        Appointments older than what is loaded are read from the store and
+        published as the next version. Returns the current snapshot.
+        """
+        with self._lock:
+            snapshot = self.current()
+            if self.loaded_from is None or (start is not None and pd.Timestamp(start) >= self.loaded_from):
+                return snapshot
+            older = self.store.query(start=start, end=self.loaded_from - pd.Timedelta(days=1))
+            # Rows booked into the older range since the window was loaded are already there
+            older = older[~older.index.isin(snapshot.df.index)]
+            self.loaded_from = None if start is None else pd.Timestamp(start).normalize()
+            if older.empty:
+                return snapshot
+            bookings = older[['Staff_name', 'Appointment_date', 'Start_time', 'End_time']]
+            for appointment_id, staff, date, start_time, end_time in bookings.itertuples(name=None):
+                self.staff_schedule.add(appointment_id, staff, date, start_time, end_time)
+            return self._publish(concat_frames([older, snapshot.df]))
+
+    @contextmanager
+    def write(self):
+        """Yield a draft of the current frame and publish it as the next version
+
+        Checks and updates of the shared indexes belong inside the block, as
+        writes are serialized. Nothing is published if the block raises or
+        never touches draft.df.
+        """
+        with self._lock:
+            draft = _Draft(self.current().df)
+            yield draft
+            if draft.changed:
+                self._publish(draft.df)
+                self._utilization_changed = True
+                save_due = time.monotonic() - self._utilization_saved >= self.save_interval
+                if self.utilization_path and save_due:
+                    self._utilization_saved = time.monotonic()
+                    threading.Thread(target=self.save_utilization, name='save-utilization', daemon=True).start()
+
+    def checkout(self, session_id):
+        """Return the current snapshot for a session and record which version it holds"""
+        snapshot = self.current()
+        with self._lock:
+            self._sessions[session_id] = (snapshot.version, time.time())
+        return snapshot
+
+    def memory_stats(self):
+        """Shared memory figures: snapshot versions still referenced, derived frames and active sessions"""
+        with self._lock:
+            cutoff = time.time() - self.session_timeout
+            for session_id in [s for s, (_, seen) in self._sessions.items() if seen < cutoff]:
+                del self._sessions[session_id]
+            sessions = len(self._sessions)
+            live = list(self._live.values())
+        snapshot_bytes = sum(snapshot.nbytes for snapshot in live)
+        derived_bytes = sum(frame_bytes(value) for value in self.derived.values())
+        shared_bytes = snapshot_bytes + derived_bytes
+        return {
+            'version': self.current().version,
+            'live_versions': len(live),
+            'snapshot_bytes': snapshot_bytes,
+            'derived_bytes': derived_bytes,
+            'sessions': sessions,
+            'shared_bytes_per_session': shared_bytes / sessions if sessions else shared_bytes,
+        }
+
+
+def session_bytes(session_state):
+    """Approximate memory held by one session's own state"""
+    return sum(frame_bytes(value) for value in session_state.values())
@@ -0,0 +1,131 @@
+import heapq
+import numpy as np
+import pandas as pd
+
+from utils.conflicts import StaffSchedule, minutes_column, day_numbers
+
+
+def assign_staff(appointments_df, staff):
+    """Assign a staff member to every appointment
+
+    Appointments are processed day by day in start-time order. Staff who are
+    free at an appointment's start sit in a heap ordered by booked minutes
+    that week, then that day, so each appointment goes to the least loaded
+    free staff member. Staff who are busy sit in a second heap ordered by the
+    end of their current booking and return to the free heap as soon as it
+    has ended, so nobody is ever double-booked. When everyone is busy the
+    appointment is left unassigned (None); keep_current_staff() settles
+    those.
+
+    Returns a Series of staff names aligned with appointments_df.
+    """
+    staff = sorted(set(staff))
+    if not staff:
+        raise ValueError("At least one staff member is required")
+    result = pd.Series(None, index=appointments_df.index, dtype=object)
+    if appointments_df.empty:
+        return result
+
+    days = day_numbers(appointments_df['Appointment_date'])
+    starts = minutes_column(appointments_df['Start_time'])
+    ends = minutes_column(appointments_df['End_time'])
+    # Ordinal 1 (0001-01-01) is a Monday, so this groups days into Monday-based weeks
+    weeks = (days - 1) // 7
+
+    order = np.lexsort((ends, starts, days))
+    assigned = [None] * len(order)
+    week_load = dict.fromkeys(staff, 0)
+    day_load = dict.fromkeys(staff, 0)
+    current_day = current_week = None
+    free, busy = [], []
+
+    for pos, day, week, start, end in zip(order.tolist(), days[order].tolist(), weeks[order].tolist(),
+                                          starts[order].tolist(), ends[order].tolist()):
+        if day != current_day:
+            if week != current_week:
+                week_load = dict.fromkeys(staff, 0)
+                current_week = week
+            day_load = dict.fromkeys(staff, 0)
+            current_day = day
+            free = [(week_load[name], 0, name) for name in staff]
+            heapq.heapify(free)
+            busy = []
+
+        # Staff whose booking has ended by now are free again
+        while busy and busy[0][0] <= start:
+            _, name = heapq.heappop(busy)
+            heapq.heappush(free, (week_load[name], day_load[name], name))
+
+        if not free:
+            continue
+        _, _, name = heapq.heappop(free)
+        duration = max(end - start, 0)
+        week_load[name] += duration
+        day_load[name] += duration
+        heapq.heappush(busy, (end, name))
+        assigned[pos] = name
+
+    result[:] = assigned
+    return result
+
+
+def keep_current_staff(appointments_df, assigned):
+    """Give the appointments assign_staff() left unassigned their current staff member
+
+    Returns (staff, clashing) where staff is assigned with the gaps filled
+    in and clashing holds the ids of the appointments whose current staff
+    member is booked elsewhere at the same time, checked against a
+    StaffSchedule of everything assigned so far, or who have none. Those
+    keep what they had, as nobody else is free, and are left to the caller
+    to report.
+    """
+    unassigned = assigned.isna()
+    staff = assigned.where(~unassigned, appointments_df['Staff_name'].astype(object))
+    if not unassigned.any():
+        return staff, appointments_df.index[:0]
+    schedule = StaffSchedule.from_frame(appointments_df[~unassigned].assign(Staff_name=assigned[~unassigned]))
+    rows = appointments_df[unassigned].assign(Staff_name=staff[unassigned])
+    columns = ['Staff_name', 'Appointment_date', 'Start_time', 'End_time']
+    rows = rows.iloc[np.lexsort((minutes_column(rows['Start_time']), day_numbers(rows['Appointment_date'])))]
+    clashing = []
+    for appointment_id, name, date, start, end in rows[columns].itertuples(name=None):
+        if pd.isna(name) or schedule.conflicts(name, date, start, end):
+            clashing.append(appointment_id)
+        else:
+            schedule.add(appointment_id, name, date, start, end)
+    return staff, pd.Index(clashing)
+
+
+def suggest_staff(schedule, staff, appointment_date, start_time, end_time, bookings=None):
+    """Suggest the least loaded staff member who is free for a new booking
+
+    schedule is the StaffSchedule of the stored appointments and bookings
+    the optional RecurringBookings whose visits count too; both give the
+    booked minutes of the week and day and the availability check, so no
+    appointments have to be read. Returns None if nobody is free.
+    """
+    appointment_date = pd.Timestamp(appointment_date).normalize()
+    day = appointment_date.toordinal()
+    week = range(day - appointment_date.weekday(), day - appointment_date.weekday() + 7)
+
+    week_load = {name: sum(schedule.booked_minutes(name, other) for other in week) for name in staff}
+    day_load = {name: schedule.booked_minutes(name, day) for name in staff}
+    if bookings is not None:
+        week_start = pd.Timestamp.fromordinal(week[0])
+        for _, record in bookings.occurrences(week_start, week_start + pd.Timedelta(days=6)):
+            name = record['Staff_name']
+            if name not in week_load:
+                continue
+            minutes = max(record['End_time'] - record['Start_time'], 0)
+            week_load[name] += minutes
+            if record['Appointment_date'] == appointment_date:
+                day_load[name] += minutes
+
+    candidates = []
+    for name in staff:
+        if schedule.conflicts(name, appointment_date, start_time, end_time):
+            continue
+        if bookings is not None and bookings.conflicts(name, appointment_date, start_time, end_time):
+            continue
+        candidates.append((week_load[name], day_load[name], name))
+    return min(candidates)[2] if candidates else None
@@ -0,0 +1,1015 @@
+from contextlib import contextmanager
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import uuid
+import pandas as pd
+
+from utils.schema import FIRST_VISIT, append_rows, concat_frames, set_values, time_text, to_compact, to_export
+
+# Column layout shared by every backend and by the CSV import/export format
+COLUMNS = [
+    'Name', 'Address', 'Appointment_date', 'Start_time',
+    'End_time', 'Staff_name', 'Days_since_last_visit'
+]
+ID_COLUMN = 'Appointment_id'
+# Natural key used to match imported rows against stored appointments
+UPSERT_KEY = ['Name', 'Appointment_date', 'Start_time']
+# Enough of each appointment to build the visit index and the customer directory
+VISIT_COLUMNS = ['Name', 'Address', 'Appointment_date']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS appointments (
+    Appointment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Name TEXT NOT NULL,
+    Address TEXT,
+    Appointment_date TEXT NOT NULL,
+    Start_time TEXT,
+    End_time TEXT,
+    Staff_name TEXT,
+    Days_since_last_visit INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_appointments_name_date
+    ON appointments (Name, Appointment_date);
+CREATE INDEX IF NOT EXISTS idx_appointments_staff_date
+    ON appointments (Staff_name, Appointment_date);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('changes', '0');
+"""
+
+
+def empty_frame():
+    """Return an empty appointments DataFrame with the standard columns and types"""
+    df = to_compact(pd.DataFrame(columns=COLUMNS))
+    df.index.name = ID_COLUMN
+    return df
+
+
+@contextmanager
+def atomic_write(path, binary=False):
+    """Write to a temporary file beside path and move it over path only on success
+
+    Readers see either the old file or the complete new one, never a partial write.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with (os.fdopen(fd, 'wb') if binary else os.fdopen(fd, 'w', newline='')) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _days_to_db(value):
+    """Convert a Days_since_last_visit value to an integer or None (first visit)"""
+    try:
+        if value is None or pd.isna(value) or value == FIRST_VISIT:
+            return None
+        return int(float(value))
+    except (ValueError, TypeError):
+        return None
+
+
+def _time_to_db(value):
+    """Convert a time (minutes after midnight or 'HH:MM') to 'HH:MM', or None"""
+    return time_text(value) or None
+
+
+def _date_to_db(value):
+    """Convert a date-like value to an ISO 'YYYY-MM-DD' string"""
+    return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+def _value_to_db(col, value):
+    """Convert one column value to its database form"""
+    if col not in COLUMNS:
+        raise KeyError(f"Unknown appointment column: {col}")
+    if col == 'Appointment_date':
+        return _date_to_db(value)
+    if col in ('Start_time', 'End_time'):
+        return _time_to_db(value)
+    if col == 'Days_since_last_visit':
+        return _days_to_db(value)
+    if value is not None and pd.isna(value):
+        return None
+    return value
+
+
+def _record_to_row(record):
+    """Convert an appointment record (dict or Series) to a tuple of database values"""
+    return (
+        record['Name'],
+        record.get('Address'),
+        _date_to_db(record['Appointment_date']),
+        _time_to_db(record.get('Start_time')),
+        _time_to_db(record.get('End_time')),
+        record.get('Staff_name'),
+        _days_to_db(record.get('Days_since_last_visit')),
+    )
+
+
+def _typed_frame(df):
+    """Apply the compact in-memory column types to a frame read from storage"""
+    return to_compact(df)
+
+
+def read_appointments_csv(path_or_buffer):
+    """Read an appointments CSV export into a typed DataFrame"""
+    df = pd.read_csv(path_or_buffer)
+    missing = [col for col in COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns in appointments data: {', '.join(missing)}")
+    return _typed_frame(df[COLUMNS])
+
+
+class SqliteStore:
+    """Appointment storage in a SQLite database with per-row writes"""
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            # Tells this database apart from an earlier one at the same path
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('store_id', ?)", (uuid.uuid4().hex,))
+
+    def _connect(self):
+        return sqlite3.connect(self.path)
+
+    def _changed(self, conn):
+        """Count a write, in the transaction making it"""
+        conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'changes'")
+
+    def version(self):
+        """A stamp of the stored data that changes with every write, also across restarts"""
+        with self._connect() as conn:
+            meta = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('store_id', 'changes')"))
+        return f"{meta['store_id']}-{meta['changes']}"
+
+    def count(self):
+        """Return the number of stored appointments"""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM appointments").fetchone()[0]
+
+    def load(self):
+        """Load all appointments as a typed DataFrame indexed by appointment id"""
+        return self.query()
+
+    def query(self, name=None, staff=None, start=None, end=None):
+        """Load appointments filtered by customer, staff and date range"""
+        clauses, params = [], []
+        if name is not None:
+            clauses.append("Name = ?")
+            params.append(name)
+        if staff is not None:
+            clauses.append("Staff_name = ?")
+            params.append(staff)
+        if start is not None:
+            clauses.append("Appointment_date >= ?")
+            params.append(_date_to_db(start))
+        if end is not None:
+            clauses.append("Appointment_date <= ?")
+            params.append(_date_to_db(end))
+        sql = f"SELECT {ID_COLUMN}, {', '.join(COLUMNS)} FROM appointments"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY Appointment_date, Start_time, {ID_COLUMN}"
+
+        with self._connect() as conn:
+            df = pd.read_sql_query(sql, conn, params=params, index_col=ID_COLUMN)
+        return _typed_frame(df)
+
+    def get(self, appointment_id):
+        """Return a single appointment as a Series, or None if it does not exist"""
+        df = self._select_ids([appointment_id])
+        return None if df.empty else df.iloc[0]
+
+    def _select_ids(self, ids):
+        placeholders = ', '.join('?' for _ in ids)
+        sql = (f"SELECT {ID_COLUMN}, {', '.join(COLUMNS)} FROM appointments "
+               f"WHERE {ID_COLUMN} IN ({placeholders})")
+        with self._connect() as conn:
+            df = pd.read_sql_query(sql, conn, params=list(ids), index_col=ID_COLUMN)
+        return _typed_frame(df)
+
+    def insert(self, record):
+        """Insert one appointment and return its new id"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f"INSERT INTO appointments ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                _record_to_row(record)
+            )
+            self._changed(conn)
+            return cursor.lastrowid
+
+    def insert_many(self, df):
+        """Insert every row of a DataFrame in one transaction"""
+        rows = [_record_to_row(record) for record in df[COLUMNS].to_dict('records')]
+        with self._connect() as conn:
+            conn.executemany(
+                f"INSERT INTO appointments ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._changed(conn)
+        return len(rows)
+
+    def upsert_many(self, df):
+        """Update rows matching on Name, date and start time; insert the rest
+
+        Returns (inserted, updated) counts.
+        """
+        rows = [_record_to_row(record) for record in df[COLUMNS].to_dict('records')]
+        inserted = updated = 0
+        with self._connect() as conn:
+            for row in rows:
+                name, address, date, start, end, staff, days = row
+                cursor = conn.execute(
+                    "UPDATE appointments SET Address = ?, End_time = ?, Staff_name = ?, Days_since_last_visit = ? "
+                    "WHERE Name = ? AND Appointment_date = ? AND Start_time = ?",
+                    (address, end, staff, days, name, date, start)
+                )
+                if cursor.rowcount:
+                    updated += cursor.rowcount
+                else:
+                    conn.execute(
+                        f"INSERT INTO appointments ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)", row
+                    )
+                    inserted += 1
+            self._changed(conn)
+        return inserted, updated
+
+    def clear(self):
+        """Delete every appointment"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM appointments")
+            self._changed(conn)
+
+    def update(self, appointment_id, changes):
+        """Update the given columns of one appointment"""
+        if not changes:
+            return
+        values = [_value_to_db(col, value) for col, value in changes.items()]
+        assignments = ', '.join(f"{col} = ?" for col in changes)
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE appointments SET {assignments} WHERE {ID_COLUMN} = ?",
+                values + [int(appointment_id)]
+            )
+            self._changed(conn)
+
+    def update_many(self, df):
+        """Update the columns of a DataFrame indexed by appointment id in one transaction"""
+        columns = list(df.columns)
+        rows = [[_value_to_db(col, value) for col, value in zip(columns, values)] + [int(appointment_id)]
+                for appointment_id, *values in df.itertuples(name=None)]
+        if not rows:
+            return
+        assignments = ', '.join(f"{col} = ?" for col in columns)
+        with self._connect() as conn:
+            conn.executemany(f"UPDATE appointments SET {assignments} WHERE {ID_COLUMN} = ?", rows)
+            self._changed(conn)
+
+    def delete(self, appointment_id):
+        """Delete one appointment"""
+        with self._connect() as conn:
+            conn.execute(f"DELETE FROM appointments WHERE {ID_COLUMN} = ?", (int(appointment_id),))
+            self._changed(conn)
+
+    def delete_many(self, appointment_ids):
+        """Delete several appointments in one transaction"""
+        with self._connect() as conn:
+            conn.executemany(f"DELETE FROM appointments WHERE {ID_COLUMN} = ?",
+                             [(int(appointment_id),) for appointment_id in appointment_ids])
+            self._changed(conn)
+
+    def iter_chunks(self, chunksize=10_000):
+        """Yield all appointments in id order as typed DataFrames of at most chunksize rows"""
+        sql = f"SELECT {ID_COLUMN}, {', '.join(COLUMNS)} FROM appointments ORDER BY {ID_COLUMN}"
+        conn = self._connect()
+        try:
+            for chunk in pd.read_sql_query(sql, conn, index_col=ID_COLUMN, chunksize=chunksize):
+                yield _typed_frame(chunk)
+        finally:
+            conn.close()
+
+    def visits(self):
+        """Return the name, address and date of every appointment"""
+        sql = f"SELECT {ID_COLUMN}, {', '.join(VISIT_COLUMNS)} FROM appointments"
+        with self._connect() as conn:
+            df = pd.read_sql_query(sql, conn, index_col=ID_COLUMN)
+        return _typed_frame(df)
+
+    def staff_names(self):
+        """Return the distinct staff names of the stored appointments"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT DISTINCT Staff_name FROM appointments WHERE Staff_name IS NOT NULL")
+            return sorted(name for name, in rows)
+
+    def date_range(self):
+        """Return the first and last appointment dates, or (None, None) when empty"""
+        with self._connect() as conn:
+            first, last = conn.execute(
+                "SELECT MIN(Appointment_date), MAX(Appointment_date) FROM appointments"
+            ).fetchone()
+        return (None, None) if first is None else (pd.Timestamp(first), pd.Timestamp(last))
+
+    def import_csv(self, path_or_buffer, replace=False):
+        """Import appointments from CSV, optionally replacing the stored data"""
+        df = read_appointments_csv(path_or_buffer)
+        if replace:
+            self.clear()
+        return self.insert_many(df)
+
+    def export_csv(self, path_or_buffer=None):
+        """Export all appointments in the CSV format"""
+        return to_export(self.load()).to_csv(path_or_buffer, index=False)
+
+
+class CsvStore:
+    """Appointment storage in a single CSV file, rewritten on every change"""
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            self._df = read_appointments_csv(path)
+            if ID_COLUMN in pd.read_csv(path, nrows=0).columns:
+                self._df.index = pd.Index(pd.read_csv(path, usecols=[ID_COLUMN])[ID_COLUMN], name=ID_COLUMN)
+            else:
+                # A plain export without ids, e.g. the seed data
+                self._df.index = pd.RangeIndex(1, len(self._df) + 1, name=ID_COLUMN)
+        else:
+            self._df = empty_frame()
+        self._last_id = int(self._df.index.max()) if len(self._df) else 0
+        self._version = None
+
+    def _write(self):
+        # The ids are written too, so they survive a restart like in the other stores
+        to_export(self._df).to_csv(self.path, index=True)
+        self._version = None
+
+    def version(self):
+        """A fingerprint of the stored data that changes with every write, also across restarts"""
+        if self._version is None:
+            hashed = pd.util.hash_pandas_object(self._df).to_numpy()
+            self._version = f"{len(hashed)}-{int(hashed.sum()):016x}"
+        return self._version
+
+    def _next_id(self):
+        # Ids are never reused, even after the newest appointment is deleted
+        return max(self._last_id, int(self._df.index.max()) if len(self._df) else 0) + 1
+
+    def count(self):
+        """Return the number of stored appointments"""
+        return len(self._df)
+
+    def load(self):
+        """Load all appointments as a typed DataFrame indexed by appointment id"""
+        return self._df.sort_values(['Appointment_date', 'Start_time'], kind='stable')
+
+    def query(self, name=None, staff=None, start=None, end=None):
+        """Load appointments filtered by customer, staff and date range"""
+        df = self.load()
+        if name is not None:
+            df = df[df['Name'] == name]
+        if staff is not None:
+            df = df[df['Staff_name'] == staff]
+        if start is not None:
+            df = df[df['Appointment_date'] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df['Appointment_date'] <= pd.Timestamp(end)]
+        return df
+
+    def get(self, appointment_id):
+        """Return a single appointment as a Series, or None if it does not exist"""
+        if appointment_id not in self._df.index:
+            return None
+        return self._df.loc[appointment_id]
+
+    def insert(self, record):
+        """Insert one appointment and return its new id"""
+        appointment_id = self._next_id()
+        self._last_id = appointment_id
+        row = pd.DataFrame([[record.get(col) for col in COLUMNS]], columns=COLUMNS,
+                           index=pd.Index([appointment_id], name=ID_COLUMN))
+        self._df = append_rows(self._df, row)
+        self._write()
+        return appointment_id
+
+    def insert_many(self, df):
+        """Insert every row of a DataFrame"""
+        new_rows = df[COLUMNS].copy()
+        start = self._next_id()
+        new_rows.index = pd.RangeIndex(start, start + len(new_rows), name=ID_COLUMN)
+        self._last_id = start + len(new_rows) - 1
+        self._df = append_rows(self._df, new_rows)
+        self._write()
+        return len(new_rows)
+
+    def upsert_many(self, df):
+        """Update rows matching on Name, date and start time; insert the rest
+
+        Returns (inserted, updated) counts.
+        """
+        df = to_compact(df[COLUMNS])
+        existing = {tuple(key): appointment_id for appointment_id, *key
+                    in self._df[UPSERT_KEY].itertuples(name=None)}
+        keys = list(df[UPSERT_KEY].itertuples(index=False, name=None))
+        matches = [existing.get(key) for key in keys]
+        is_update = [match is not None for match in matches]
+
+        updates = df[is_update]
+        if len(updates):
+            set_values(self._df, [m for m in matches if m is not None], {col: updates[col] for col in COLUMNS})
+        inserts = df[[not flag for flag in is_update]]
+        if len(inserts):
+            self.insert_many(inserts)
+        else:
+            self._write()
+        return len(inserts), len(updates)
+
+    def clear(self):
+        """Delete every appointment"""
+        self._df = empty_frame()
+        self._write()
+
+    def update(self, appointment_id, changes):
+        """Update the given columns of one appointment"""
+        if not changes:
+            return
+        set_values(self._df, [appointment_id], changes)
+        self._write()
+
+    def update_many(self, df):
+        """Update the columns of a DataFrame indexed by appointment id with a single rewrite"""
+        unknown = [col for col in df.columns if col not in COLUMNS]
+        if unknown:
+            raise KeyError(f"Unknown appointment column: {unknown[0]}")
+        df = df[df.index.isin(self._df.index)]
+        if df.empty:
+            return
+        set_values(self._df, df.index, {col: df[col] for col in df.columns})
+        self._write()
+
+    def delete(self, appointment_id):
+        """Delete one appointment"""
+        self._df = self._df.drop(index=appointment_id)
+        self._write()
+
+    def delete_many(self, appointment_ids):
+        """Delete several appointments with a single rewrite"""
+        self._df = self._df.drop(index=list(appointment_ids))
+        self._write()
+
+    def iter_chunks(self, chunksize=10_000):
+        """Yield all appointments in id order as DataFrames of at most chunksize rows"""
+        df = self._df.sort_index()
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+
+    def visits(self):
+        """Return the name, address and date of every appointment"""
+        return self._df[VISIT_COLUMNS]
+
+    def staff_names(self):
+        """Return the distinct staff names of the stored appointments"""
+        return sorted(set(self._df['Staff_name'].dropna().astype(str)))
+
+    def date_range(self):
+        """Return the first and last appointment dates, or (None, None) when empty"""
+        if self._df.empty:
+            return None, None
+        dates = self._df['Appointment_date']
+        return dates.min(), dates.max()
+
+    def import_csv(self, path_or_buffer, replace=False):
+        """Import appointments from CSV, optionally replacing the stored data"""
+        df = read_appointments_csv(path_or_buffer)
+        if replace:
+            self._df = empty_frame()
+        return self.insert_many(df)
+
+    def export_csv(self, path_or_buffer=None):
+        """Export all appointments in the CSV format"""
+        return to_export(self.load()).to_csv(path_or_buffer, index=False)
+
+
+def _json_value(value):
+    """Convert a frame value to something JSON can store"""
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d')
+    if hasattr(value, 'item'):
+        return value.item()
+    if value is not None and not isinstance(value, str) and pd.isna(value):
+        return None
+    return value
+
+
+def _json_rows(df):
+    return [{col: _json_value(value) for col, value in record.items()}
+            for record in df[COLUMNS].to_dict('records')]
+
+
+def _frame_from_rows(rows):
+    return to_compact(pd.DataFrame(rows, columns=COLUMNS))
+
+
+class JournalStore(CsvStore):
+    """Appointment storage as a snapshot plus an append-only change journal
+
+    Every insert, update or delete appends one JSON line to journal.jsonl, so
+    a mutation costs O(1) I/O however large the data is. Opening the store
+    loads the newest snapshot and replays the journal entries made after it.
+    Once more than compact_threshold entries have accumulated, a background
+    thread folds them into a new snapshot and trims the journal.
+
+    Every entry carries a sequence number and manifest.json records the
+    sequence number its snapshot includes. Replay skips entries the snapshot
+    already covers, so a crash at any point during compaction is safe.
+    """
+
+    def __init__(self, path, compact_threshold=10_000):
+        self.path = path
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        self._compacting = False
+        self._applying = False
+        os.makedirs(path, exist_ok=True)
+        self._journal_path = os.path.join(path, 'journal.jsonl')
+        self._manifest_path = os.path.join(path, 'manifest.json')
+        self._load()
+
+    def _load(self):
+        manifest = {'snapshot': None, 'seq': 0, 'last_id': 0}
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path) as f:
+                manifest = json.load(f)
+        self._df = empty_frame()
+        if manifest['snapshot']:
+            snapshot = pd.read_csv(os.path.join(self.path, manifest['snapshot']), index_col=ID_COLUMN)
+            self._df = _frame_from_rows(snapshot.reset_index().to_dict('records'))
+            self._df.index = pd.Index(snapshot.index, name=ID_COLUMN)
+        self._last_id = manifest['last_id']
+        self._snapshot_seq = self._seq = manifest['seq']
+        self._pending = 0
+        self._store_id = manifest.get('store_id')
+        if self._store_id is None:
+            # Tells this journal apart from an earlier one at the same path
+            self._store_id = uuid.uuid4().hex
+            with atomic_write(self._manifest_path) as f:
+                json.dump(dict(manifest, store_id=self._store_id), f)
+
+        if os.path.exists(self._journal_path):
+            with open(self._journal_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # A torn final write from a crash
+                    if entry['seq'] > self._snapshot_seq:
+                        self._apply(entry)
+                        self._seq = entry['seq']
+                        self._pending += 1
+
+    def _write(self):
+        # Changes are persisted through the journal, not by rewriting the data
+        pass
+
+    def version(self):
+        """A stamp of the stored data: the sequence number every journaled write advances"""
+        return f"{self._store_id}-{self._seq}"
+
+    def _apply(self, entry):
+        """Apply a journal entry to the in-memory frame"""
+        op = entry['op']
+        # The CsvStore methods call each other (upsert_many uses insert_many);
+        # while applying, those calls must not be journaled again
+        self._applying = True
+        try:
+            if op == 'insert':
+                CsvStore.insert(self, _frame_from_rows([entry['row']]).iloc[0])
+            elif op == 'insert_many':
+                CsvStore.insert_many(self, _frame_from_rows(entry['rows']))
+            elif op == 'upsert_many':
+                return CsvStore.upsert_many(self, _frame_from_rows(entry['rows']))
+            elif op == 'update':
+                CsvStore.update(self, entry['id'], entry['changes'])
+            elif op == 'update_many':
+                CsvStore.update_many(self, pd.DataFrame(entry['changes'], index=entry['ids']))
+            elif op == 'delete':
+                CsvStore.delete(self, entry['id'])
+            elif op == 'delete_many':
+                CsvStore.delete_many(self, entry['ids'])
+            elif op == 'clear':
+                CsvStore.clear(self)
+            else:
+                raise ValueError(f"Unknown journal operation: {op}")
+        finally:
+            self._applying = False
+
+    def _log(self, entry):
+        """Append an entry to the journal, then apply it in memory"""
+        with self._lock:
+            self._seq += 1
+            entry = dict(entry, seq=self._seq)
+            with open(self._journal_path, 'a') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            result = self._apply(entry)
+            self._pending += 1
+            if self._pending >= self.compact_threshold and not self._compacting:
+                self._compacting = True
+                threading.Thread(target=self.compact, daemon=True).start()
+            return result
+
+    def insert(self, record):
+        """Insert one appointment and return its new id"""
+        row = {col: _json_value(record.get(col)) for col in COLUMNS}
+        with self._lock:
+            self._log({'op': 'insert', 'row': row})
+            return self._last_id
+
+    def insert_many(self, df):
+        """Insert every row of a DataFrame"""
+        if self._applying:
+            return CsvStore.insert_many(self, df)
+        self._log({'op': 'insert_many', 'rows': _json_rows(df)})
+        return len(df)
+
+    def upsert_many(self, df):
+        """Update rows matching on Name, date and start time; insert the rest"""
+        return self._log({'op': 'upsert_many', 'rows': _json_rows(df)})
+
+    def update(self, appointment_id, changes):
+        """Update the given columns of one appointment"""
+        if changes:
+            self._log({'op': 'update', 'id': int(appointment_id),
+                       'changes': {col: _json_value(value) for col, value in changes.items()}})
+
+    def update_many(self, df):
+        """Update the columns of a DataFrame indexed by appointment id with one journal entry"""
+        if len(df):
+            self._log({'op': 'update_many', 'ids': [int(appointment_id) for appointment_id in df.index],
+                       'changes': {col: [_json_value(value) for value in df[col]] for col in df.columns}})
+
+    def delete(self, appointment_id):
+        """Delete one appointment"""
+        self._log({'op': 'delete', 'id': int(appointment_id)})
+
+    def delete_many(self, appointment_ids):
+        """Delete several appointments with one journal entry"""
+        self._log({'op': 'delete_many', 'ids': [int(appointment_id) for appointment_id in appointment_ids]})
+
+    def clear(self):
+        """Delete every appointment"""
+        self._log({'op': 'clear'})
+
+    def compact(self):
+        """Fold the journal into a new snapshot"""
+        try:
+            with self._lock:
+                df = self._df.copy()
+                seq, last_id = self._seq, self._last_id
+                old_snapshot = None
+                if os.path.exists(self._manifest_path):
+                    with open(self._manifest_path) as f:
+                        old_snapshot = json.load(f)['snapshot']
+
+            # Writing the snapshot is the slow part and happens outside the lock
+            snapshot = f'snapshot-{seq}.csv'
+            snapshot_path = os.path.join(self.path, snapshot)
+            to_export(df).to_csv(snapshot_path + '.tmp', index=True)
+            os.replace(snapshot_path + '.tmp', snapshot_path)
+
+            with self._lock:
+                with open(self._manifest_path + '.tmp', 'w') as f:
+                    json.dump({'snapshot': snapshot, 'seq': seq, 'last_id': last_id, 'store_id': self._store_id}, f)
+                os.replace(self._manifest_path + '.tmp', self._manifest_path)
+
+                # Keep only the entries written while the snapshot was being saved
+                kept = []
+                with open(self._journal_path) as f:
+                    for line in f:
+                        try:
+                            if json.loads(line)['seq'] > seq:
+                                kept.append(line)
+                        except json.JSONDecodeError:
+                            break
+                with open(self._journal_path + '.tmp', 'w') as f:
+                    f.writelines(kept)
+                os.replace(self._journal_path + '.tmp', self._journal_path)
+                self._snapshot_seq = seq
+                self._pending = len(kept)
+
+            if old_snapshot and old_snapshot != snapshot:
+                os.remove(os.path.join(self.path, old_snapshot))
+        finally:
+            self._compacting = False
+
+
+def _month_keys(dates):
+    """'YYYY-MM' partition key of each date"""
+    if dates.isna().any():
+        raise ValueError("Every appointment needs a date")
+    numbers = dates.dt.year * 100 + dates.dt.month
+    codes, uniques = pd.factorize(numbers)
+    keys = pd.Index([f'{number // 100:04d}-{number % 100:02d}' for number in uniques.tolist()])
+    return pd.Series(keys.take(codes), index=dates.index)
+
+
+class PartitionedStore:
+    """Appointment storage split into one CSV file per month
+
+    manifest.json lists every month with its row count and first and last
+    appointment date, so a date-range query reads only the months that
+    overlap the range and a change rewrites only the months it touches.
+    Each month file is kept sorted by date and start time. Which month holds
+    an appointment id is looked up from the id columns of the month files,
+    read once on the first change by id.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._manifest_path = os.path.join(path, 'manifest.json')
+        self._id_months = None
+        os.makedirs(path, exist_ok=True)
+        self._manifest = {'last_id': 0, 'partitions': {}}
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path) as f:
+                self._manifest = json.load(f)
+        if 'store_id' not in self._manifest:
+            # Tells this store apart from an earlier one at the same path
+            self._manifest.update(store_id=uuid.uuid4().hex, changes=0)
+            with atomic_write(self._manifest_path) as f:
+                json.dump(self._manifest, f, indent=1, sort_keys=True)
+
+    @property
+    def _partitions(self):
+        return self._manifest['partitions']
+
+    def _file(self, month):
+        return os.path.join(self.path, f'{month}.csv')
+
+    def months(self, start=None, end=None):
+        """Return the months whose appointments overlap [start, end], oldest first"""
+        start = None if start is None else _date_to_db(start)
+        end = None if end is None else _date_to_db(end)
+        return sorted(month for month, part in self._partitions.items()
+                      if (start is None or part['max_date'] >= start)
+                      and (end is None or part['min_date'] <= end))
+
+    def _read_text(self, month, columns=None):
+        usecols = None if columns is None else [ID_COLUMN] + columns
+        return pd.read_csv(self._file(month), index_col=ID_COLUMN, usecols=usecols)[columns or COLUMNS]
+
+    def _read(self, month):
+        """Read one month as a typed DataFrame indexed by appointment id"""
+        if month not in self._partitions:
+            return empty_frame()
+        return _typed_frame(self._read_text(month))
+
+    def _read_months(self, months, columns=None):
+        """Read several months as one typed DataFrame, converting the types once"""
+        if not months:
+            return empty_frame()[columns or COLUMNS]
+        return _typed_frame(pd.concat([self._read_text(month, columns) for month in months]))
+
+    def _save(self, frames):
+        """Write the given {month: frame} partitions, then the manifest"""
+        for month, df in frames.items():
+            if df.empty:
+                if month in self._partitions:
+                    os.remove(self._file(month))
+                    del self._partitions[month]
+                continue
+            df = df.sort_values(['Appointment_date', 'Start_time'], kind='stable')
+            with atomic_write(self._file(month)) as f:
+                to_export(df).to_csv(f, index=True, date_format='%Y-%m-%d')
+            dates = df['Appointment_date']
+            self._partitions[month] = {'rows': len(df), 'min_date': _date_to_db(dates.min()),
+                                       'max_date': _date_to_db(dates.max())}
+        self._manifest['changes'] = self._manifest.get('changes', 0) + 1
+        with atomic_write(self._manifest_path) as f:
+            json.dump(self._manifest, f, indent=1, sort_keys=True)
+
+    def _month_index(self):
+        """Map appointment id -> month, reading the id columns on first use"""
+        if self._id_months is None:
+            id_months = {}
+            for month in self._partitions:
+                ids = pd.read_csv(self._file(month), usecols=[ID_COLUMN])[ID_COLUMN]
+                id_months.update(dict.fromkeys(ids.tolist(), month))
+            self._id_months = id_months
+        return self._id_months
+
+    def count(self):
+        """Return the number of stored appointments"""
+        return sum(part['rows'] for part in self._partitions.values())
+
+    def version(self):
+        """A stamp of the stored data that changes with every write, also across restarts"""
+        return f"{self._manifest['store_id']}-{self._manifest['changes']}"
+
+    def load(self):
+        """Load all appointments as a typed DataFrame indexed by appointment id"""
+        return self.query()
+
+    def query(self, name=None, staff=None, start=None, end=None):
+        """Load appointments filtered by customer, staff and date range, reading only the overlapping months"""
+        df = self._read_months(self.months(start, end))
+        if name is not None:
+            df = df[df['Name'] == name]
+        if staff is not None:
+            df = df[df['Staff_name'] == staff]
+        if start is not None:
+            df = df[df['Appointment_date'] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df['Appointment_date'] <= pd.Timestamp(end)]
+        return df
+
+    def get(self, appointment_id):
+        """Return a single appointment as a Series, or None if it does not exist"""
+        month = self._month_index().get(int(appointment_id))
+        if month is None:
+            return None
+        return self._read(month).loc[int(appointment_id)]
+
+    def _add_rows(self, rows, frames=None):
+        """Append rows that already have their ids to their months and save"""
+        frames = {} if frames is None else frames
+        months = _month_keys(rows['Appointment_date'])
+        for month, part in rows.groupby(months, sort=False):
+            frames[month] = append_rows(frames[month] if month in frames else self._read(month), part)
+        if len(rows):
+            self._manifest['last_id'] = max(self._manifest['last_id'], int(rows.index.max()))
+        self._save(frames)
+        if self._id_months is not None:
+            self._id_months.update(zip(rows.index.tolist(), months.tolist()))
+
+    def _with_new_ids(self, df):
+        rows = to_compact(df[COLUMNS])
+        start = self._manifest['last_id'] + 1
+        rows.index = pd.RangeIndex(start, start + len(rows), name=ID_COLUMN)
+        return rows
+
+    def insert(self, record):
+        """Insert one appointment and return its new id"""
+        with self._lock:
+            rows = self._with_new_ids(pd.DataFrame([[record.get(col) for col in COLUMNS]], columns=COLUMNS))
+            self._add_rows(rows)
+            return int(rows.index[0])
+
+    def insert_many(self, df):
+        """Insert every row of a DataFrame, rewriting each month it touches once"""
+        with self._lock:
+            self._add_rows(self._with_new_ids(df))
+        return len(df)
+
+    def upsert_many(self, df):
+        """Update rows matching on Name, date and start time; insert the rest
+
+        The key includes the date, so matches are looked up in the row's own month.
+        Returns (inserted, updated) counts.
+        """
+        df = to_compact(df[COLUMNS])
+        frames, inserts = {}, []
+        updated = 0
+        with self._lock:
+            for month, part in df.groupby(_month_keys(df['Appointment_date']), sort=False):
+                existing = self._read(month)
+                lookup = {tuple(key): appointment_id for appointment_id, *key
+                          in existing[UPSERT_KEY].itertuples(name=None)}
+                matches = [lookup.get(key) for key in part[UPSERT_KEY].itertuples(index=False, name=None)]
+                is_update = pd.Series([match is not None for match in matches], index=part.index)
+                if is_update.any():
+                    set_values(existing, [match for match in matches if match is not None],
+                               {col: part.loc[is_update, col] for col in COLUMNS})
+                    frames[month] = existing
+                    updated += int(is_update.sum())
+                inserts.append(part[~is_update])
+            inserts = self._with_new_ids(concat_frames(inserts)) if inserts else empty_frame()
+            self._add_rows(inserts, frames)
+        return len(inserts), updated
+
+    def clear(self):
+        """Delete every appointment; ids are still never reused"""
+        with self._lock:
+            self._save({month: empty_frame() for month in list(self._partitions)})
+            self._id_months = {}
+
+    def update(self, appointment_id, changes):
+        """Update the given columns of one appointment, moving it if its month changes"""
+        if not changes:
+            return
+        unknown = [col for col in changes if col not in COLUMNS]
+        if unknown:
+            raise KeyError(f"Unknown appointment column: {unknown[0]}")
+        appointment_id = int(appointment_id)
+        with self._lock:
+            month = self._month_index().get(appointment_id)
+            if month is None:
+                return
+            df = self._read(month)
+            set_values(df, [appointment_id], changes)
+            new_month = _month_keys(df.loc[[appointment_id], 'Appointment_date']).iloc[0]
+            if new_month == month:
+                self._save({month: df})
+                return
+            moved = df.loc[[appointment_id]]
+            self._add_rows(moved, {month: df.drop(index=appointment_id)})
+
+    def update_many(self, df):
+        """Update the columns of a DataFrame indexed by appointment id, rewriting each month they are in once"""
+        unknown = [col for col in df.columns if col not in COLUMNS]
+        if unknown:
+            raise KeyError(f"Unknown appointment column: {unknown[0]}")
+        if 'Appointment_date' in df.columns:
+            # A new date can move an appointment to another month
+            for appointment_id, changes in df.to_dict('index').items():
+                self.update(appointment_id, changes)
+            return
+        with self._lock:
+            id_months = self._month_index()
+            months = [id_months.get(int(appointment_id)) for appointment_id in df.index]
+            frames = {}
+            # Ids that are not stored have no month and are skipped
+            for month, part in df.groupby(pd.Series(months, index=df.index, dtype=object), sort=False):
+                frame = self._read(month)
+                set_values(frame, part.index, {col: part[col] for col in part.columns})
+                frames[month] = frame
+            self._save(frames)
+
+    def delete(self, appointment_id):
+        """Delete one appointment"""
+        self.delete_many([appointment_id])
+
+    def delete_many(self, appointment_ids):
+        """Delete several appointments, rewriting each month they are in once"""
+        with self._lock:
+            id_months = self._month_index()
+            by_month = {}
+            for appointment_id in appointment_ids:
+                month = id_months.pop(int(appointment_id), None)
+                if month is not None:
+                    by_month.setdefault(month, []).append(int(appointment_id))
+            self._save({month: self._read(month).drop(index=ids) for month, ids in by_month.items()})
+
+    def iter_chunks(self, chunksize=10_000):
+        """Yield all appointments month by month, in id order within a month, as DataFrames of at most chunksize rows"""
+        for month in self.months():
+            df = self._read(month).sort_index()
+            for start in range(0, len(df), chunksize):
+                yield df.iloc[start:start + chunksize]
+
+    def visits(self):
+        """Return the name, address and date of every appointment"""
+        return self._read_months(self.months(), VISIT_COLUMNS)
+
+    def staff_names(self):
+        """Return the distinct staff names of the stored appointments, reading only that column"""
+        return sorted(set(self._read_months(self.months(), ['Staff_name'])['Staff_name'].dropna().astype(str)))
+
+    def date_range(self):
+        """Return the first and last appointment dates, or (None, None) when empty"""
+        if not self._partitions:
+            return None, None
+        return (pd.Timestamp(min(part['min_date'] for part in self._partitions.values())),
+                pd.Timestamp(max(part['max_date'] for part in self._partitions.values())))
+
+    def import_csv(self, path_or_buffer, replace=False):
+        """Import appointments from CSV, optionally replacing the stored data"""
+        df = read_appointments_csv(path_or_buffer)
+        if replace:
+            self.clear()
+        return self.insert_many(df)
+
+    def export_csv(self, path_or_buffer=None):
+        """Export all appointments in the CSV format"""
+        return to_export(self.load()).to_csv(path_or_buffer, index=False)
+
+
+def get_store(path):
+    """Open the storage backend matching the file extension of path"""
+    extension = os.path.splitext(path.rstrip('/'))[1].lower()
+    if extension in ('.db', '.sqlite', '.sqlite3'):
+        return SqliteStore(path)
+    if extension == '.csv':
+        return CsvStore(path)
+    if extension == '.journal':
+        return JournalStore(path)
+    if extension == '.parts':
+        return PartitionedStore(path)
+    raise ValueError(f"Unsupported appointment store: {path}")
+
+
+def open_store(path, seed_csv=None):
+    """Open a store, importing seed_csv the first time the store file is created"""
+    is_new = not os.path.exists(path)
+    store = get_store(path)
+    if is_new and seed_csv and os.path.exists(seed_csv) and os.path.abspath(seed_csv) != os.path.abspath(path):
+        store.import_csv(seed_csv)
+    return store
@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+
+from utils.conflicts import day_numbers
+from utils.schema import to_compact
+from utils.staff_assignment import assign_staff
+from utils.storage import COLUMNS
+from utils.visit_index import compute_days_since_last_visit
+
+# Swedish first names and last names
+FIRST_NAMES = [
+    'Erik', 'Lars', 'Karl', 'Anders', 'Johan', 'Per', 'Nils', 'Gustav', 'Mikael',
+    'Maria', 'Anna', 'Eva', 'Karin', 'Sara', 'Lisa', 'Lena', 'Helena', 'Sofia',
+    'Emma', 'Kristina', 'Björn', 'Magnus', 'Olof', 'Hans', 'Filip'
+]
+
+LAST_NAMES = [
+    'Andersson', 'Johansson', 'Karlsson', 'Nilsson', 'Eriksson', 'Larsson',
+    'Olsson', 'Persson', 'Svensson', 'Gustafsson', 'Pettersson', 'Bergström',
+    'Lindberg', 'Magnusson', 'Lindström', 'Gustavsson', 'Olofsson', 'Lindgren',
+    'Berg', 'Axelsson', 'Bergman', 'Lundberg', 'Lind', 'Holm'
+]
+
+# Uddevalla streets
+STREETS = [
+    'Kungsgatan', 'Drottninggatan', 'Norra Drottninggatan', 'Södra Drottninggatan',
+    'Västerlånggatan', 'Österlånggatan', 'Norgårdsvägen', 'Strömstadsvägen',
+    'Göteborgsvägen', 'Sunningevägen', 'Boxhultsvägen', 'Fasserödsvägen',
+    'Kurverödsvägen', 'Sigelhultsvägen', 'Äsperödsvägen', 'Tunnbindaregatan',
+    'Kampenhofsgatan', 'Junogatan', 'Margretegärdegatan', 'Bastionsgatan'
+]
+
+DEFAULT_STAFF = ['Lotta', 'Meera', 'Alice', 'Steve']
+
+# Most customers are on a fixed weekly, fortnightly, three-weekly or monthly cycle
+CYCLE_DAYS = np.array([7, 14, 21, 28])
+CYCLE_WEIGHTS = np.array([0.35, 0.35, 0.1, 0.2])
+
+
+def generate_customers(n_customers, rng):
+    """Return a DataFrame of distinct customer names and addresses"""
+    first = rng.choice(FIRST_NAMES, n_customers)
+    last = rng.choice(LAST_NAMES, n_customers)
+    names = pd.Series(np.char.add(np.char.add(first, ' '), last))
+    # Number repeated names so every customer is distinct
+    repeat = names.groupby(names).cumcount()
+    names = names.where(repeat == 0, names + ' ' + (repeat + 1).astype(str))
+
+    streets = rng.choice(STREETS, n_customers)
+    numbers = rng.integers(1, 100, n_customers).astype(str)
+    addresses = pd.Series(streets) + ' ' + numbers + ', Uddevalla'
+    return pd.DataFrame({'Name': names, 'Address': addresses})
+
+
+def peak_overlap(appointments_df):
+    """The most appointments running at the same moment on any day"""
+    if appointments_df.empty:
+        return 0
+    days = day_numbers(appointments_df['Appointment_date']) * 24 * 60
+    starts = days + appointments_df['Start_time'].to_numpy(dtype=np.int64)
+    ends = days + appointments_df['End_time'].to_numpy(dtype=np.int64)
+    times = np.concatenate([starts, ends])
+    steps = np.concatenate([np.ones(len(starts), dtype=np.int64), -np.ones(len(ends), dtype=np.int64)])
+    # A booking ending at a minute frees its staff member for one starting then
+    order = np.lexsort((steps, times))
+    return int(np.cumsum(steps[order]).max())
+
+
+def staff_for(appointments_df, staff, add_staff=False):
+    """The staff list, checked to be long enough to book every appointment without overlaps
+
+    Raises ValueError saying how many staff are needed when it is too short,
+    unless add_staff is set, in which case numbered staff are added.
+    """
+    staff = list(staff)
+    needed = peak_overlap(appointments_df)
+    if needed <= len(staff):
+        return staff
+    if not add_staff:
+        raise ValueError(f"{needed} appointments overlap at the busiest moment but only {len(staff)} staff "
+                         f"were given; pass at least {needed} staff, spread the rows over more years, "
+                         f"or allow numbered staff to be added")
+    extra = (f'Staff {number}' for number in range(len(staff) + 1, needed + 1))
+    return staff + [name for name in extra if name not in staff]
+
+
+def generate_appointments(n_rows, n_customers=None, staff=None, start_year=2020, years=5, seed=0,
+                          add_staff=False):
+    """Generate n_rows of realistic, reproducible appointments
+
+    Each customer gets a recurring cycle (weekly to monthly) with a random
+    phase; visits fall on that cycle with a day of jitter, are moved off
+    weekends, and get a 1-3 hour slot between 08:00 and 17:00. A customer
+    with more visits than fit in the years at their cycle visits more often.
+    Staff are assigned with assign_staff(), so nobody is double-booked;
+    when the given staff can't cover the busiest moment, ValueError is
+    raised, or with add_staff numbered staff ('Staff 5', ...) are added. Dates and times are built with array
+    operations. The frame has the compact column types; to_export() gives
+    the CSV form.
+    """
+    rng = np.random.default_rng(seed)
+    staff = staff or DEFAULT_STAFF
+    n_customers = n_customers or max(1, n_rows // 50)
+    customers = generate_customers(n_customers, rng)
+
+    # Spread the rows over customers, then lay each customer's visits on their cycle
+    customer = np.sort(rng.integers(0, n_customers, n_rows))
+    visit_number = pd.Series(customer).groupby(customer).cumcount().to_numpy()
+    span_days = 365 * years
+    visits = np.bincount(customer, minlength=n_customers)
+    # Shorten the cycle of customers whose visits would run past the end, then start each series where it fits
+    cycle = np.minimum(rng.choice(CYCLE_DAYS, n_customers, p=CYCLE_WEIGHTS),
+                       np.maximum(span_days // np.maximum(visits, 1), 1))
+    room = np.maximum(span_days - (visits - 1) * cycle, 1)
+    phase = rng.integers(0, room)
+    offset = np.clip(phase[customer] + visit_number * cycle[customer] + rng.integers(-1, 2, n_rows),
+                     0, span_days - 1)
+
+    dates = pd.Timestamp(year=start_year, month=1, day=1) + pd.to_timedelta(offset, unit='D')
+    weekday = dates.weekday.to_numpy()
+    dates = dates + pd.to_timedelta(np.where(weekday >= 5, 7 - weekday, 0), unit='D')
+
+    start_hour = rng.integers(8, 15, n_rows)
+    duration = rng.integers(1, 4, n_rows)
+    df = pd.DataFrame({
+        'Name': customers['Name'].to_numpy()[customer],
+        'Address': customers['Address'].to_numpy()[customer],
+        'Appointment_date': dates,
+        'Start_time': start_hour * 60,
+        'End_time': (start_hour + duration) * 60,
+    })
+    df = df.sort_values(['Appointment_date', 'Start_time'], kind='stable', ignore_index=True)
+    df['Staff_name'] = assign_staff(df, staff_for(df, staff, add_staff))
+    df['Days_since_last_visit'] = compute_days_since_last_visit(df)
+    return to_compact(df[COLUMNS])
@@ -0,0 +1,149 @@
+import json
+import os
+import pandas as pd
+
+from utils.conflicts import day_numbers, time_to_minutes
+from utils.schema import minutes_from_text
+from utils.storage import atomic_write
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def utilization_path(store_path):
+    """Where the utilization table of the store at store_path is saved"""
+    return os.path.splitext(store_path.rstrip('/'))[0] + '-utilization.json'
+
+
+def _day(value):
+    return pd.Timestamp(value).toordinal()
+
+
+def _week(day):
+    # Ordinal 1 (0001-01-01) is a Monday, so this is the day number of the week's Monday
+    return day - (day - 1) % 7
+
+
+def _minutes(start_time, end_time):
+    """Booked minutes of one appointment, 0 when a time is missing or the end is not after the start"""
+    if start_time is None or end_time is None or pd.isna(start_time) or pd.isna(end_time):
+        return 0
+    return max(time_to_minutes(end_time) - time_to_minutes(start_time), 0)
+
+
+class StaffUtilization:
+    """Booked minutes and visit counts per staff member per day and per week
+
+    A materialized aggregate of the appointments keyed by (staff, day) and
+    (staff, week). add() and remove() adjust the totals of one booking in
+    constant time, so the add, edit and cancel paths keep it current without
+    another pass over the table, and a week's summary reads a fixed number
+    of entries however long the history is.
+    """
+
+    def __init__(self):
+        self._days = {}
+        self._weeks = {}
+
+    @classmethod
+    def from_frame(cls, appointments_df):
+        """Build the table from an appointments DataFrame in one grouped pass"""
+        utilization = cls()
+        utilization.add_frame(appointments_df)
+        return utilization
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        """Build the table from DataFrame chunks, e.g. store.iter_chunks(), in bounded memory"""
+        utilization = cls()
+        for chunk in chunks:
+            utilization.add_frame(chunk)
+        return utilization
+
+    def _adjust(self, staff, day, minutes, visits):
+        for table, key in ((self._days, (staff, day)), (self._weeks, (staff, _week(day)))):
+            totals = table.setdefault(key, [0, 0])
+            totals[0] += minutes
+            totals[1] += visits
+            if totals[1] <= 0:
+                del table[key]
+
+    def add_frame(self, appointments_df):
+        """Add every appointment of a DataFrame"""
+        if appointments_df.empty:
+            return
+        dates = pd.to_datetime(appointments_df['Appointment_date'])
+        start = minutes_from_text(appointments_df['Start_time'])
+        end = minutes_from_text(appointments_df['End_time'])
+        frame = pd.DataFrame({
+            'staff': appointments_df['Staff_name'].astype(object),
+            'day': day_numbers(dates),
+            'minutes': (end - start).clip(lower=0).fillna(0).astype('int64'),
+        })
+        frame = frame[frame['staff'].notna().to_numpy() & dates.notna().to_numpy()]
+        totals = frame.groupby(['staff', 'day'], sort=False)['minutes'].agg(['sum', 'count'])
+        for (staff, day), minutes, visits in zip(totals.index, totals['sum'].tolist(), totals['count'].tolist()):
+            self._adjust(staff, int(day), minutes, visits)
+
+    def add(self, staff, appointment_date, start_time, end_time):
+        """Record a booking"""
+        self._adjust(staff, _day(appointment_date), _minutes(start_time, end_time), 1)
+
+    def remove(self, staff, appointment_date, start_time, end_time):
+        """Forget a booking (e.g. when it is cancelled or moved)"""
+        self._adjust(staff, _day(appointment_date), -_minutes(start_time, end_time), -1)
+
+    def day(self, staff, appointment_date):
+        """Return (booked minutes, visits) of a staff member on a day"""
+        return tuple(self._days.get((staff, _day(appointment_date)), (0, 0)))
+
+    def week(self, staff, appointment_date):
+        """Return (booked minutes, visits) of a staff member in the week of a date"""
+        return tuple(self._weeks.get((staff, _week(_day(appointment_date))), (0, 0)))
+
+    def week_summary(self, appointment_date, staff):
+        """Booked hours per weekday and the week's hours and visits of each staff member
+
+        Reads eight entries per staff member, whatever the size of the history.
+        """
+        monday = _week(_day(appointment_date))
+        rows = []
+        for name in staff:
+            hours = [self._days.get((name, monday + offset), (0, 0))[0] / 60 for offset in range(7)]
+            minutes, visits = self._weeks.get((name, monday), (0, 0))
+            rows.append(hours + [minutes / 60, visits])
+        return pd.DataFrame(rows, index=pd.Index(list(staff), name='Staff'),
+                            columns=WEEKDAYS + ['Week hours', 'Visits'])
+
+    def __len__(self):
+        return len(self._days)
+
+    def to_frame(self):
+        """Return the per-day table as a DataFrame sorted by staff and date"""
+        rows = [(staff, pd.Timestamp.fromordinal(day), minutes, visits)
+                for (staff, day), (minutes, visits) in self._days.items()]
+        df = pd.DataFrame(rows, columns=['Staff_name', 'Date', 'Minutes', 'Visits'])
+        return df.sort_values(['Staff_name', 'Date'], ignore_index=True)
+
+    def copy(self):
+        """Return an independent copy of the table"""
+        utilization = StaffUtilization()
+        utilization._days = {key: list(totals) for key, totals in self._days.items()}
+        utilization._weeks = {key: list(totals) for key, totals in self._weeks.items()}
+        return utilization
+
+    def save(self, path, version):
+        """Write the table, with the store version (store.version()) it matches, to a JSON file"""
+        days = [[staff, day, minutes, visits] for (staff, day), (minutes, visits) in self._days.items()]
+        with atomic_write(path) as f:
+            json.dump({'version': version, 'days': days}, f)
+
+    @classmethod
+    def load(cls, path):
+        """Read a saved table; returns (table, store version it matches)"""
+        with open(path) as f:
+            saved = json.load(f)
+        utilization = cls()
+        for staff, day, minutes, visits in saved['days']:
+            utilization._adjust(staff, day, minutes, visits)
+        # Tables saved before versions were recorded never match
+        return utilization, saved.get('version')
@@ -0,0 +1,94 @@
+from bisect import bisect_left, insort
+import pandas as pd
+
+from utils.schema import DAYS_DTYPE
+
+
+def _day(value):
+    """Convert a date-like value to a day number for comparison"""
+    return pd.Timestamp(value).toordinal()
+
+
+class VisitIndex:
+    """Per-customer sorted visit dates for fast last-visit lookups"""
+
+    def __init__(self):
+        self._visits = {}
+
+    @classmethod
+    def from_frame(cls, appointments_df):
+        """Build the index from an appointments DataFrame in one grouped pass"""
+        index = cls()
+        if appointments_df.empty:
+            return index
+        dates = pd.to_datetime(appointments_df['Appointment_date'])
+        days = pd.Series(dates.map(pd.Timestamp.toordinal, na_action='ignore'),
+                         index=appointments_df.index)
+        frame = pd.DataFrame({'Name': appointments_df['Name'], 'day': days}).dropna()
+        for name, group in frame.sort_values('day').groupby('Name', sort=False, observed=True)['day']:
+            index._visits[name] = group.astype(int).tolist()
+        return index
+
+    def add(self, customer_name, appointment_date):
+        """Record a visit"""
+        insort(self._visits.setdefault(customer_name, []), _day(appointment_date))
+
+    def remove(self, customer_name, appointment_date):
+        """Forget a visit (e.g. when an appointment is cancelled)"""
+        visits = self._visits.get(customer_name)
+        if not visits:
+            return
+        day = _day(appointment_date)
+        pos = bisect_left(visits, day)
+        if pos < len(visits) and visits[pos] == day:
+            del visits[pos]
+        if not visits:
+            del self._visits[customer_name]
+
+    def move(self, old_name, old_date, new_name, new_date):
+        """Update the index for an edited appointment"""
+        self.remove(old_name, old_date)
+        self.add(new_name, new_date)
+
+    def last_visit_before(self, customer_name, current_date):
+        """Return the most recent visit strictly before current_date, or None"""
+        visits = self._visits.get(customer_name)
+        if not visits:
+            return None
+        pos = bisect_left(visits, _day(current_date))
+        if pos == 0:
+            return None
+        return pd.Timestamp.fromordinal(visits[pos - 1])
+
+    def days_since_last_visit(self, customer_name, current_date):
+        """Return days since the previous visit, or None for a first visit"""
+        visits = self._visits.get(customer_name)
+        if not visits:
+            return None
+        day = _day(current_date)
+        pos = bisect_left(visits, day)
+        if pos == 0:
+            return None
+        return day - visits[pos - 1]
+
+
+def compute_days_since_last_visit(appointments_df):
+    """Recompute Days_since_last_visit for every row in one grouped pass
+
+    Returns a nullable integer Series aligned with appointments_df holding
+    the number of days since the customer's previous visit day, <NA> for a
+    first visit.
+    """
+    if appointments_df.empty:
+        return pd.Series(index=appointments_df.index, dtype=DAYS_DTYPE)
+
+    dates = pd.to_datetime(appointments_df['Appointment_date']).dt.normalize()
+    visits = pd.DataFrame({'Name': appointments_df['Name'], 'date': dates})
+
+    # Previous distinct visit day per customer, so same-day rows share a value
+    days = visits.drop_duplicates().dropna().sort_values(['Name', 'date'])
+    days['previous'] = days.groupby('Name', observed=True)['date'].shift()
+
+    previous = visits.merge(days, on=['Name', 'date'], how='left')['previous']
+    previous.index = visits.index
+    return (visits['date'] - previous).dt.days.astype(DAYS_DTYPE)